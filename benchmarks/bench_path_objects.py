@@ -0,0 +1,34 @@
+"""
+Objects per second when wrapping a listing into path objects
+
+    python -m benchmarks.bench_path_objects [count]
+"""
+import sys
+import time
+
+from ufs.base import FS
+
+
+def bench(name: str, func, count: int):
+    start = time.perf_counter()
+    objects = func()
+    elapsed = time.perf_counter() - start
+    assert len(objects) == count
+    print(f"{name:<40} {count / elapsed:>14,.0f} objects/s")
+
+
+def main(count: int = 200000):
+    s3_paths = [f"s3://bucket/data/part={i % 100}/file-{i}.parquet" for i in range(count)]
+    posix_paths = [f"/data/part={i % 100}/file-{i}.parquet" for i in range(count)]
+
+    bench("FS.to_file (s3)", lambda: [FS.to_file(p) for p in s3_paths], count)
+    bench("FS.to_file (posix)", lambda: [FS.to_file(p) for p in posix_paths], count)
+    bench("FS.to_files (s3)", lambda: FS.to_files(s3_paths), count)
+    bench("FS.to_files (posix)", lambda: FS.to_files(posix_paths), count)
+
+    files = FS.to_files(s3_paths)
+    bench("S3File.bucket_name/prefix", lambda: [(f.bucket_name, f.prefix) for f in files], count)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
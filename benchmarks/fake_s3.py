@@ -0,0 +1,242 @@
+"""
+In-process stand-in for a boto3 S3 client, covering the calls ufs makes
+
+Objects live in memory, listings are served from a sorted key list. An optional per request
+latency models the round trip to a real endpoint.
+"""
+import bisect
+import hashlib
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+class ClientError(Exception):
+    """Shaped like botocore.exceptions.ClientError for ufs.s3.s3_common.error_code"""
+
+    def __init__(self, code: str, operation: str):
+        super().__init__(f"An error occurred ({code}) when calling the {operation} operation")
+        self.response = dict(Error=dict(Code=code))
+
+
+class _Body:
+    def __init__(self, data: bytes):
+        self._data = data
+        self._position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._data) if size is None or size < 0 else self._position + size
+        data = self._data[self._position:end]
+        self._position += len(data)
+        return data
+
+    def close(self):
+        pass
+
+
+class _Bucket:
+    def __init__(self):
+        self.objects = dict()
+        self.keys = list()
+
+
+class FakeS3Client:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._buckets = dict()
+        self._uploads = dict()
+        self._upload_attributes = dict()
+        self._lock = threading.Lock()
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _bucket(self, name: str) -> _Bucket:
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                bucket = self._buckets[name] = _Bucket()
+            return bucket
+
+    def _get(self, bucket_name: str, key: str, operation: str) -> dict:
+        obj = self._bucket(bucket_name).objects.get(key)
+        if obj is None:
+            raise ClientError("404", operation)
+        return obj
+
+    def _put(self, bucket_name: str, key: str, data: bytes, etag: str = None, attributes=None) -> dict:
+        """:param attributes: head_object fields stored with the object, e.g. ContentType, Metadata"""
+        bucket = self._bucket(bucket_name)
+        obj = dict(
+            data=data,
+            etag=etag or f'"{hashlib.md5(data).hexdigest()}"',
+            mtime=datetime.now(timezone.utc),
+            attributes=dict(attributes or {}),
+        )
+        with self._lock:
+            if key not in bucket.objects:
+                bisect.insort(bucket.keys, key)
+            bucket.objects[key] = obj
+        return obj
+
+    @staticmethod
+    def _body(body) -> bytes:
+        return body.read() if hasattr(body, "read") else bytes(body)
+
+    def list_objects_v2(
+            self,
+            Bucket,
+            Prefix="",
+            Delimiter=None,
+            StartAfter=None,
+            ContinuationToken=None,
+            MaxKeys=1000,
+            **kwargs,
+    ):
+        self._request()
+        bucket = self._bucket(Bucket)
+        start = ContinuationToken or StartAfter
+        index = bisect.bisect_right(bucket.keys, start) if start else 0
+        index = max(index, bisect.bisect_left(bucket.keys, Prefix))
+
+        contents, prefixes = list(), list()
+        last = None
+        while index < len(bucket.keys) and len(contents) + len(prefixes) < MaxKeys:
+            key = bucket.keys[index]
+            if not key.startswith(Prefix):
+                break
+            if Delimiter:
+                position = key.find(Delimiter, len(Prefix))
+                if position >= 0:
+                    common_prefix = key[:position + len(Delimiter)]
+                    prefixes.append(dict(Prefix=common_prefix))
+                    # skip the rest of the common prefix
+                    last = common_prefix + "￿"
+                    index = bisect.bisect_right(bucket.keys, last)
+                    continue
+            obj = bucket.objects[key]
+            contents.append(
+                dict(Key=key, Size=len(obj["data"]), LastModified=obj["mtime"], ETag=obj["etag"])
+            )
+            last = key
+            index += 1
+
+        truncated = index < len(bucket.keys) and bucket.keys[index].startswith(Prefix)
+        page = dict(KeyCount=len(contents) + len(prefixes), IsTruncated=truncated)
+        if contents:
+            page["Contents"] = contents
+        if prefixes:
+            page["CommonPrefixes"] = prefixes
+        if truncated:
+            page["NextContinuationToken"] = last
+        return page
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._request()
+        obj = self._get(Bucket, Key, "HeadObject")
+        return dict(
+            obj["attributes"], ContentLength=len(obj["data"]), ETag=obj["etag"], LastModified=obj["mtime"]
+        )
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        self._request()
+        obj = self._get(Bucket, Key, "GetObject")
+        if IfMatch and IfMatch.strip('"') != obj["etag"].strip('"'):
+            raise ClientError("412", "GetObject")
+        data = obj["data"]
+        response = dict(ETag=obj["etag"], LastModified=obj["mtime"])
+        if Range:
+            start, end = Range[len("bytes="):].split("-")
+            start, end = int(start), min(int(end), len(data) - 1)
+            if start >= len(data):
+                raise ClientError("InvalidRange", "GetObject")
+            response["ContentRange"] = f"bytes {start}-{end}/{len(data)}"
+            data = data[start:end + 1]
+        response.update(Body=_Body(data), ContentLength=len(data))
+        return response
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        self._request()
+        return dict(ETag=self._put(Bucket, Key, self._body(Body), attributes=kwargs)["etag"])
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._request()
+        self.delete_objects(Bucket, dict(Objects=[dict(Key=Key)]))
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self._request()
+        bucket = self._bucket(Bucket)
+        with self._lock:
+            for item in Delete["Objects"]:
+                if bucket.objects.pop(item["Key"], None) is not None:
+                    del bucket.keys[bisect.bisect_left(bucket.keys, item["Key"])]
+        return dict()
+
+    def copy_object(self, CopySource, Bucket, Key, **kwargs):
+        self._request()
+        obj = self._get(CopySource["Bucket"], CopySource["Key"], "CopyObject")
+        etag = self._put(Bucket, Key, obj["data"], obj["etag"], obj["attributes"])["etag"]
+        return dict(CopyObjectResult=dict(ETag=etag))
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._request()
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = dict()
+            self._upload_attributes[upload_id] = kwargs
+        return dict(UploadId=upload_id)
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._request()
+        data = self._body(Body)
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        self._uploads[UploadId][PartNumber] = (data, etag)
+        return dict(ETag=etag)
+
+    def upload_part_copy(
+            self, Bucket, Key, UploadId, PartNumber, CopySource, CopySourceRange=None, CopySourceIfMatch=None, **kwargs
+    ):
+        self._request()
+        obj = self._get(CopySource["Bucket"], CopySource["Key"], "UploadPartCopy")
+        if CopySourceIfMatch and CopySourceIfMatch.strip('"') != obj["etag"].strip('"'):
+            raise ClientError("412", "UploadPartCopy")
+        data = obj["data"]
+        if CopySourceRange:
+            start, end = CopySourceRange[len("bytes="):].split("-")
+            data = data[int(start):int(end) + 1]
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        self._uploads[UploadId][PartNumber] = (data, etag)
+        return dict(CopyPartResult=dict(ETag=etag))
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0, **kwargs):
+        self._request()
+        if UploadId not in self._uploads:
+            raise ClientError("NoSuchUpload", "ListParts")
+        parts = [
+            dict(PartNumber=number, ETag=etag, Size=len(data))
+            for number, (data, etag) in sorted(self._uploads[UploadId].items())
+            if number > PartNumberMarker
+        ]
+        return dict(Parts=parts, IsTruncated=False)
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self._request()
+        with self._lock:
+            parts = self._uploads.pop(UploadId)
+            attributes = self._upload_attributes.pop(UploadId)
+        data = b"".join(parts[part["PartNumber"]][0] for part in MultipartUpload["Parts"])
+        etag = f'"{hashlib.md5(data).hexdigest()}-{len(MultipartUpload["Parts"])}"'
+        self._put(Bucket, Key, data, etag, attributes)
+        return dict(ETag=etag)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._request()
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+            self._upload_attributes.pop(UploadId, None)
+        return dict()
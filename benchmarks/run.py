@@ -0,0 +1,255 @@
+"""
+Benchmark suite of the ufs hot paths, on synthetic Posix trees and an in-process S3 stand-in
+
+    python -m benchmarks.run [--scale 0.2] [--trees small,deep] [--only s3.list_files]
+                             [--output results.json] [--compare baseline.json]
+
+Every benchmark reports objects/s and the peak Python memory (tracemalloc, measured in a
+separate pass so that tracing does not skew the timings). The ones reading or writing file
+content report MB/s too. Results are written as JSON. --compare prints the relative change
+against an earlier run and exits with 1 on regressions over --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, List, NamedTuple, Optional
+
+from benchmarks.fake_s3 import FakeS3Client
+from benchmarks.trees import TREES, TreeInfo
+from ufs.posix.posix_directory import PosixDirectory
+from ufs.posix.posix_file import PosixFile
+from ufs.s3.s3_client import get_client_pool
+from ufs.s3.s3_directory import S3Directory
+from ufs.s3.s3_file import S3File
+
+MB = 1024 * 1024
+
+
+class Benchmark(NamedTuple):
+    """
+    run returns nothing, objects and bytes processed come from the tree; reset runs untimed after each run
+    metadata benchmarks (listings, counts, sizes) never read the files, they get no MB/s
+    """
+
+    name: str
+    run: Callable[[], None]
+    reset: Optional[Callable[[], None]] = None
+    metadata: bool = False
+
+
+class Result(NamedTuple):
+    benchmark: str
+    tree: str
+    seconds: float
+    objects: int
+    bytes: int
+    objects_per_s: float
+    mb_per_s: Optional[float]
+    peak_memory_mb: Optional[float]
+
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.unlink(path)
+
+
+def _checksum_all(directory, **kwargs):
+    for file in directory.iter_file_objects():
+        file.checksum(**kwargs)
+
+
+def posix_benchmarks(src: PosixDirectory, work: str) -> List[Benchmark]:
+    dst = os.path.join(work, "posix-dst")
+    archive = os.path.join(work, "posix.tar.gz")
+    bucket = S3Directory(f"s3://bench-upload/{os.path.basename(str(src).rstrip('/'))}/")
+    return [
+        Benchmark("posix.list_files", lambda: src.list_files(), metadata=True),
+        Benchmark("posix.file_count", lambda: src.file_count(), metadata=True),
+        Benchmark("posix.size", lambda: src.size(), metadata=True),
+        Benchmark("posix.checksum", lambda: _checksum_all(src)),
+        Benchmark("posix.duplicate", lambda: src.duplicate(PosixDirectory(dst)), lambda: _remove(dst)),
+        Benchmark("posix.copy_to", lambda: src.copy_to(PosixDirectory(dst)), lambda: _remove(dst)),
+        Benchmark("posix.upload", lambda: bucket._upload(src), lambda: bucket.remove()),
+        Benchmark(
+            "posix.archive_to_posix",
+            lambda: src.archive_to_posix(PosixFile(archive), "gztar", compression_level=1),
+            lambda: _remove(archive),
+        ),
+        Benchmark(
+            "posix.archive_to_s3",
+            lambda: src.archive_to_s3(S3File("s3://bench-upload/posix.tar.gz"), "gztar", compression_level=1),
+            lambda: S3File("s3://bench-upload/posix.tar.gz").remove(),
+        ),
+    ]
+
+
+def s3_benchmarks(src: S3Directory, work: str) -> List[Benchmark]:
+    dst = os.path.join(work, "s3-dst")
+    archive = os.path.join(work, "s3.tar.gz")
+    copy_dst = S3Directory("s3://bench-copy/dst/")
+    return [
+        Benchmark("s3.list_files", lambda: src.list_files(), metadata=True),
+        Benchmark("s3.file_count", lambda: src.file_count(), metadata=True),
+        Benchmark("s3.size", lambda: src.size(), metadata=True),
+        Benchmark("s3.checksum", lambda: _checksum_all(src, use_metadata=False)),
+        Benchmark("s3.duplicate", lambda: src.duplicate(copy_dst), lambda: copy_dst.remove()),
+        Benchmark("s3.copy_to", lambda: src.copy_to(copy_dst), lambda: copy_dst.remove()),
+        Benchmark("s3.download", lambda: src._download(PosixDirectory(dst)), lambda: _remove(dst)),
+        Benchmark(
+            "s3.archive_to_posix",
+            lambda: src.archive_to_posix(PosixFile(archive), "gztar", compression_level=1),
+            lambda: _remove(archive),
+        ),
+        Benchmark(
+            "s3.archive_to_s3",
+            lambda: src.archive_to_s3(S3File("s3://bench-copy/s3.tar.gz"), "gztar", compression_level=1),
+            lambda: S3File("s3://bench-copy/s3.tar.gz").remove(),
+        ),
+    ]
+
+
+def measure(benchmark: Benchmark, tree: str, info: TreeInfo, repeat: int, memory: bool) -> Result:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        benchmark.run()
+        best = min(best, time.perf_counter() - start)
+        if benchmark.reset is not None:
+            benchmark.reset()
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            benchmark.run()
+            peak = tracemalloc.get_traced_memory()[1] / MB
+        finally:
+            tracemalloc.stop()
+        if benchmark.reset is not None:
+            benchmark.reset()
+
+    return Result(
+        benchmark.name,
+        tree,
+        best,
+        info.files,
+        info.bytes,
+        info.files / best,
+        None if benchmark.metadata else info.bytes / MB / best,
+        peak,
+    )
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(args) -> dict:
+    return dict(
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        commit=_git_commit(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpus=os.cpu_count(),
+        scale=args.scale,
+        repeat=args.repeat,
+        latency=args.latency,
+    )
+
+
+def compare(results: List[Result], baseline_path: str, threshold: float) -> int:
+    """Print the change of every benchmark against the baseline, return the number of regressions"""
+    with open(baseline_path) as f:
+        baseline = {(r["benchmark"], r["tree"]): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"\n{'benchmark':<26} {'tree':<6} {'baseline s':>11} {'current s':>11} {'change':>8}")
+    for result in results:
+        previous = baseline.get((result.benchmark, result.tree))
+        if previous is None:
+            continue
+        change = result.seconds / previous["seconds"] - 1
+        flag = ""
+        if change > threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(
+            f"{result.benchmark:<26} {result.tree:<6} {previous['seconds']:>11.4f} "
+            f"{result.seconds:>11.4f} {change:>+8.1%}{flag}"
+        )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="size factor of the synthetic trees")
+    parser.add_argument("--trees", default=",".join(TREES), help="comma separated, of: " + ", ".join(TREES))
+    parser.add_argument("--only", default="", help="comma separated benchmark name prefixes")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs, the fastest is reported")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every S3 request")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown reported as a regression")
+    parser.add_argument("--workdir", help="where the trees are generated, a temporary directory by default")
+    args = parser.parse_args(argv)
+
+    only = tuple(name for name in args.only.split(",") if name)
+    client = FakeS3Client(latency=args.latency)
+    get_client_pool().register(client)
+
+    work = tempfile.mkdtemp(prefix="ufs-bench-", dir=args.workdir)
+    results = list()
+    try:
+        for tree in args.trees.split(","):
+            root = os.path.join(work, tree)
+            info = TREES[tree](root, args.scale)
+            src = PosixDirectory(root)
+            s3_src = S3Directory(f"s3://bench/{tree}/")
+            s3_src._upload(src)
+            print(f"# tree {tree}: {info.files} files, {info.bytes / MB:.1f} MB", file=sys.stderr)
+
+            for benchmark in posix_benchmarks(src, work) + s3_benchmarks(s3_src, work):
+                if only and not benchmark.name.startswith(only):
+                    continue
+                result = measure(benchmark, tree, info, args.repeat, not args.no_memory)
+                results.append(result)
+                memory = f"{result.peak_memory_mb:>9.1f} MB" if result.peak_memory_mb is not None else ""
+                throughput = f"{result.mb_per_s:>9.1f} MB/s" if result.mb_per_s is not None else " " * 14
+                print(
+                    f"{result.benchmark:<26} {tree:<6} {result.seconds:>9.4f} s "
+                    f"{result.objects_per_s:>12,.0f} objects/s {throughput} {memory}"
+                )
+            s3_src.remove()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+        get_client_pool().clear()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(metadata=metadata(args), results=[r._asdict() for r in results]), f, indent=2)
+
+    if args.compare:
+        return int(compare(results, args.compare, args.threshold) > 0)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
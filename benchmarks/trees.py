@@ -0,0 +1,54 @@
+"""Synthetic directory trees for the benchmarks"""
+import os
+from typing import Callable, Dict, NamedTuple
+
+
+class TreeInfo(NamedTuple):
+    files: int
+    bytes: int
+
+
+def _write(path: str, size: int) -> int:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        # incompressible, so that archive timings do not depend on the generator
+        f.write(os.urandom(size))
+    return size
+
+
+def many_small_files(root: str, scale: float = 1.0) -> TreeInfo:
+    """Wide tree of 1 KiB files, 100 per directory"""
+    count = max(1, int(5000 * scale))
+    total = 0
+    for i in range(count):
+        total += _write(os.path.join(root, f"d{i // 100:04d}", f"f{i:06d}.bin"), 1024)
+    return TreeInfo(count, total)
+
+
+def few_huge_files(root: str, scale: float = 1.0) -> TreeInfo:
+    """A handful of files large enough for multipart transfers"""
+    size = max(1024 * 1024, int(48 * 1024 * 1024 * scale))
+    count = 3
+    total = 0
+    for i in range(count):
+        total += _write(os.path.join(root, f"huge{i}.bin"), size)
+    return TreeInfo(count, total)
+
+
+def deep_nesting(root: str, scale: float = 1.0) -> TreeInfo:
+    """Single chain of directories, a few 4 KiB files per level"""
+    depth = max(1, int(200 * scale))
+    total = 0
+    count = 0
+    path = root
+    for level in range(depth):
+        path = os.path.join(path, f"level{level:03d}")
+        for i in range(3):
+            total += _write(os.path.join(path, f"f{i}.bin"), 4096)
+            count += 1
+    return TreeInfo(count, total)
+
+
+TREES: Dict[str, Callable[[str, float], TreeInfo]] = dict(
+    small=many_small_files, huge=few_huge_files, deep=deep_nesting
+)
@@ -0,0 +1,31 @@
+import pytest
+
+from benchmarks.fake_s3 import FakeS3Client
+from ufs.cache import disable_metadata_cache
+from ufs.metrics import disable_metrics
+from ufs.s3.s3_client import get_client_pool
+from ufs.s3.s3_content_cache import disable_content_cache
+
+BUCKET = "bucket"
+
+
+@pytest.fixture
+def s3_client():
+    """In-memory S3 client, also the default client of the pool"""
+    client = FakeS3Client()
+    get_client_pool().register(client)
+    yield client
+    get_client_pool().clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_globals():
+    yield
+    disable_metadata_cache()
+    disable_content_cache()
+    disable_metrics()
+
+
+def put_objects(client: FakeS3Client, objects: dict, bucket_name: str = BUCKET):
+    for key, data in objects.items():
+        client._put(bucket_name, key, data)
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from tests.conftest import BUCKET, put_objects
+from ufs.aio import AsyncDirectory, AsyncFile, AsyncLimiter, to_async
+from ufs.posix.posix_file import PosixFile
+from ufs.s3.s3_directory import S3Directory
+from ufs.s3.s3_file import S3File
+
+
+@pytest.fixture
+def limiter():
+    limiter = AsyncLimiter(max_concurrency=4)
+    yield limiter
+    limiter.shutdown()
+
+
+def test_to_async(s3_client, tmp_path):
+    assert isinstance(to_async(S3File(f"s3://{BUCKET}/a", s3_client=s3_client)), AsyncFile)
+    assert isinstance(to_async(S3Directory(f"s3://{BUCKET}/a/", s3_client=s3_client)), AsyncDirectory)
+    with pytest.raises(RuntimeError):
+        to_async("s3://bucket/a")
+
+
+def test_file_round_trip(s3_client, tmp_path, limiter):
+    async def main():
+        s3_file = to_async(S3File(f"s3://{BUCKET}/a.txt", s3_client=s3_client), limiter)
+        await s3_file.write_text("hello")
+        local = to_async(PosixFile(str(tmp_path / "a.txt")), limiter)
+        await s3_file.duplicate(local)
+        return await s3_file.read_bytes(), await local.read_text(encoding="utf-8")
+
+    assert asyncio.run(main()) == (b"hello", "hello")
+
+
+def test_directory_iteration(s3_client, limiter):
+    put_objects(s3_client, {f"data/{index:04d}": b"x" for index in range(2500)})
+    directory = to_async(S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client), limiter)
+
+    async def main():
+        files = [path async for path in directory.iter_files()]
+        contents = await asyncio.gather(
+            *(directory.join_as_file(f"{index:04d}").read_bytes() for index in range(50))
+        )
+        return files, contents, await directory.size()
+
+    files, contents, size = asyncio.run(main())
+    assert len(files) == 2500 and files[0] == f"s3://{BUCKET}/data/0000"
+    assert contents == [b"x"] * 50
+    assert size == 2500
+
+
+def test_iteration_stops_with_the_consumer(limiter):
+    produced = list()
+
+    def items():
+        for index in range(100000):
+            produced.append(index)
+            yield index
+
+    async def main():
+        async for item in limiter.iterate(items, batch_size=10):
+            if item == 5:
+                break
+
+    asyncio.run(main())
+    # at most the batches buffered ahead of the consumer, not the whole iterator
+    assert len(produced) <= 40
+
+
+def test_iteration_raises_producer_errors(limiter):
+    def items():
+        yield 1
+        raise ValueError("listing failed")
+
+    async def main():
+        return [item async for item in limiter.iterate(items)]
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
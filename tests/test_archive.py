@@ -0,0 +1,57 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from tests.conftest import BUCKET, put_objects
+from ufs.archive import write_archive
+from ufs.posix.posix_directory import PosixDirectory
+from ufs.posix.posix_file import PosixFile
+from ufs.s3.s3_directory import S3Directory
+from ufs.s3.s3_file import S3File
+
+OBJECTS = {"src/a.txt": b"a" * 100, "src/b/c.txt": b"c" * 5000, "src/b/d.bin": bytes(range(256))}
+
+
+@pytest.fixture
+def s3_src(s3_client):
+    put_objects(s3_client, OBJECTS)
+    return S3Directory(f"s3://{BUCKET}/src/", s3_client=s3_client)
+
+
+def _members(data: bytes, archive_format: str) -> dict:
+    if archive_format == "zip":
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as archive:
+        return {
+            member.name: archive.extractfile(member).read() for member in archive.getmembers() if member.isfile()
+        }
+
+
+@pytest.mark.parametrize("archive_format,extension", [("zip", ".zip"), ("gztar", ".tar.gz")])
+def test_s3_archive_to_posix(s3_src, tmp_path, archive_format, extension):
+    dst = PosixFile(str(tmp_path / ("archive" + extension)))
+    progress = list()
+    s3_src.archive_to_posix(dst, archive_format, progress=progress.append)
+    expected = {key[len("src/"):]: data for key, data in OBJECTS.items()}
+    assert _members(dst.read_bytes(), archive_format) == expected
+    assert progress[-1].items == len(OBJECTS)
+
+
+def test_posix_archive_to_s3(s3_client, s3_src, tmp_path):
+    local = PosixDirectory(str(tmp_path / "local") + "/")
+    s3_src.duplicate(local)
+    dst = S3File(f"s3://{BUCKET}/archive.zip", s3_client=s3_client)
+    local.archive_to_s3(dst, "zip", compression_level=9)
+    with zipfile.ZipFile(io.BytesIO(dst.read_bytes())) as archive:
+        assert archive.read("b/c.txt") == OBJECTS["src/b/c.txt"]
+        assert archive.getinfo("b/c.txt").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_streamed_members(s3_src, tmp_path):
+    # members over prefetch_size are streamed instead of read ahead
+    dst = PosixFile(str(tmp_path / "archive.zip"))
+    write_archive(s3_src, dst, "zip", prefetch_size=1000)
+    assert _members(dst.read_bytes(), "zip")["b/c.txt"] == OBJECTS["src/b/c.txt"]
@@ -0,0 +1,46 @@
+import pytest
+
+from tests.conftest import BUCKET, put_objects
+from ufs.base import FileSystem
+from ufs.s3.s3_file import S3File
+from ufs.transfer import TransferException
+
+
+@pytest.fixture
+def paths(s3_client, tmp_path):
+    put_objects(s3_client, {"a": b"a", "b": b"bb"})
+    local = tmp_path / "c"
+    local.write_bytes(b"ccc")
+    return [f"s3://{BUCKET}/a", str(local), f"s3://{BUCKET}/missing", f"s3://{BUCKET}/b"]
+
+
+def test_results_in_input_order(paths):
+    assert FileSystem.exists_many(paths) == [True, True, False, True]
+    sizes = FileSystem.size_many(paths)
+    assert sizes[:2] == [1, 3] and sizes[3] == 2
+    assert isinstance(sizes[2], Exception)
+    contents = FileSystem.read_many([paths[3], paths[1]])
+    assert contents == [b"bb", b"ccc"]
+
+
+def test_fail_fast(paths):
+    with pytest.raises(TransferException):
+        FileSystem.size_many(paths, fail_fast=True)
+
+
+def test_remove_many_batches_s3_deletes(s3_client, paths):
+    put_objects(s3_client, {f"many/{index}": b"x" for index in range(1500)})
+    s3_paths = [f"s3://{BUCKET}/many/{index}" for index in range(1500)]
+    requests = s3_client.requests
+    assert FileSystem.remove_many(s3_paths + paths) == [None] * (1500 + len(paths))
+    # DeleteObjects of at most 1000 keys per request, one group per client and bucket
+    assert s3_client.requests - requests == 2
+    assert FileSystem.exists_many(paths) == [False] * len(paths)
+
+
+def test_remove_many_groups_explicit_and_pooled_clients(s3_client):
+    put_objects(s3_client, {"a": b"a", "b": b"b"})
+    files = [S3File(f"s3://{BUCKET}/a", s3_client=s3_client), f"s3://{BUCKET}/b"]
+    requests = s3_client.requests
+    FileSystem.remove_many(files)
+    assert s3_client.requests - requests == 1
@@ -0,0 +1,86 @@
+import os
+import time
+
+from tests.conftest import BUCKET, put_objects
+from ufs.cache import MISSING, MetadataCache, enable_metadata_cache
+from ufs.s3 import s3_content_cache
+from ufs.s3.s3_content_cache import ContentCache, enable_content_cache
+from ufs.s3.s3_file import S3File
+
+
+def test_metadata_cache_ttl_and_lru(monkeypatch):
+    cache = MetadataCache(max_entries=2, ttl=10)
+    cache.set("a", "size", 1)
+    cache.set("b", "size", 2)
+    assert cache.get("a", "size") == 1
+    cache.set("c", "size", 3)
+    # b was the least recently used
+    assert cache.get("b", "size") is MISSING
+    assert cache.get("a", "exists") is MISSING
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get("a", "size") is MISSING
+    stats = cache.stats()
+    assert (stats["hits"], stats["evictions"]) == (1, 1)
+
+
+def test_metadata_cache_saves_requests_and_is_invalidated(s3_client):
+    put_objects(s3_client, {"dir/a": b"abc"})
+    cache = enable_metadata_cache()
+    s3_file = S3File(f"s3://{BUCKET}/dir/a", s3_client=s3_client)
+    assert s3_file.size() == 3 and s3_file.exists()
+    requests = s3_client.requests
+    assert s3_file.size() == 3 and s3_file.exists()
+    assert s3_client.requests == requests
+
+    s3_file.write_bytes(b"abcdef", "WRITE")
+    assert s3_file.size() == 6
+    s3_file.remove()
+    assert not s3_file.exists()
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_content_cache_read_through(s3_client, tmp_path):
+    put_objects(s3_client, {"a": b"a" * 100})
+    cache = enable_content_cache(str(tmp_path / "cache"))
+    s3_file = S3File(f"s3://{BUCKET}/a", s3_client=s3_client)
+    assert s3_file.read_bytes() == b"a" * 100
+    assert s3_file.read_text() == "a" * 100
+    assert bytes(s3_file.read_mmap()) == b"a" * 100
+    assert cache.stats() == dict(hits=2, misses=1, evictions=0)
+
+    # a new version of the object is a new cache entry
+    put_objects(s3_client, {"a": b"b" * 10})
+    assert s3_file.read_bytes() == b"b" * 10
+    assert cache.stats()["misses"] == 2
+
+
+def test_content_cache_eviction(s3_client, tmp_path):
+    put_objects(s3_client, {f"k{index}": bytes([index]) * 100 for index in range(10)})
+    cache = ContentCache(str(tmp_path / "cache"), max_bytes=350)
+    for index in range(10):
+        with cache.open(S3File(f"s3://{BUCKET}/k{index}", s3_client=s3_client)) as f:
+            assert f.read() == bytes([index]) * 100
+    # evicted down to EVICT_TO_RATIO of max_bytes each time it went over
+    assert cache.size() <= 350
+    assert cache.stats()["evictions"] >= 6
+
+    with cache.open(S3File(f"s3://{BUCKET}/k9", s3_client=s3_client)):
+        pass
+    assert cache.stats()["hits"] == 1
+
+
+def test_content_cache_removes_stale_downloads(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    stale = directory / "abandoned.part"
+    stale.write_bytes(b"x")
+    old = time.time() - s3_content_cache.STALE_PART_SECONDS - 1
+    os.utime(str(stale), (old, old))
+    recent = directory / "running.part"
+    recent.write_bytes(b"x")
+
+    ContentCache(str(directory))
+    assert not stale.exists()
+    assert recent.exists()
@@ -0,0 +1,67 @@
+import hashlib
+
+import pytest
+
+from tests.conftest import BUCKET
+from ufs.integrity import ChecksumManifest
+from ufs.posix.posix_directory import PosixDirectory
+from ufs.s3.s3_directory import S3Directory
+
+FILES = {"a.txt": b"a" * 10, "b/c.txt": b"c" * 20, "b/d/e.txt": b"e" * 30}
+
+
+@pytest.fixture
+def local(tmp_path):
+    root = tmp_path / "local"
+    for name, data in FILES.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    return PosixDirectory(str(root) + "/")
+
+
+def test_checksums_manifest_round_trip(local, tmp_path):
+    progress = list()
+    manifest = local.checksums("md5", workers=2, progress=progress.append)
+    assert len(manifest) == 3
+    assert manifest.get("b/c.txt").digest == hashlib.md5(FILES["b/c.txt"]).hexdigest()
+    assert progress[-1].items == 3
+
+    path = str(tmp_path / "manifest.txt")
+    manifest.save(path)
+    loaded = ChecksumManifest.load(path)
+    assert loaded.algorithm == "md5"
+    assert {entry.relative_path: entry.digest for entry in loaded} == {
+        entry.relative_path: entry.digest for entry in manifest
+    }
+    assert local.verify(loaded).ok
+
+
+def test_verify_reports_differences(local):
+    manifest = local.checksums()
+    with open(str(local.join_as_file("a.txt")), "wb") as f:
+        f.write(b"b" * 10)
+    with open(str(local.join_as_file("b/c.txt")), "ab") as f:
+        f.write(b"c")
+    local.join_as_file("b/d/e.txt").remove()
+    local.join_as_file("new.txt").touch()
+
+    result = local.verify(manifest, workers=2)
+    assert not result.ok
+    assert sorted(result.mismatched) == ["a.txt", "b/c.txt"]
+    assert result.missing == ["b/d/e.txt"]
+    assert result.extra == ["new.txt"]
+    assert result.matched == 0
+
+
+def test_verify_against_s3(s3_client, local):
+    remote = S3Directory(f"s3://{BUCKET}/copy/", s3_client=s3_client)
+    local.duplicate(remote)
+    progress = list()
+    result = local.verify(remote, progress=progress.append)
+    assert result.ok and result.matched == 3
+    # one sequence counting the files of both sides
+    assert [snapshot.items for snapshot in progress] == list(range(1, 7))
+
+    remote.join_as_file("b/c.txt").write_bytes(b"x" * 20, "WRITE")
+    assert list(local.verify(remote).mismatched) == ["b/c.txt"]
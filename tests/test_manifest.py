@@ -0,0 +1,67 @@
+import pytest
+
+from tests.conftest import BUCKET, put_objects
+from ufs.s3.s3_directory import S3Directory
+from ufs.s3.s3_manifest import S3Manifest, disable_manifest, enable_manifest, get_manifest
+
+
+@pytest.fixture
+def directory(s3_client):
+    put_objects(s3_client, {f"data/day={day}/part{index}": b"x" * index for day in range(3) for index in range(4)})
+    return S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client)
+
+
+@pytest.fixture
+def manifest(directory, tmp_path):
+    manifest = enable_manifest(directory, str(tmp_path / "manifest.db"))
+    yield manifest
+    disable_manifest(directory)
+
+
+def test_answers_from_the_index(s3_client, directory, manifest):
+    requests = s3_client.requests
+    assert directory.file_count(use_manifest=True) == 12
+    assert directory.size(use_manifest=True) == 18
+    assert len(list(directory.iter_entries(use_manifest=True))) == 12
+    sub_directory = directory.join_as_directory("day=1")
+    assert sub_directory.file_count(use_manifest=True) == 4
+    assert sorted(directory.glob("day=2/part*", use_manifest=True)) == [
+        f"s3://{BUCKET}/data/day=2/part{index}" for index in range(4)
+    ]
+    assert "day=0/part3" in manifest
+    assert s3_client.requests == requests
+
+
+def test_writes_mark_the_index_stale(s3_client, directory, manifest):
+    directory.join_as_file("day=1/part9").write_bytes(b"new", "WRITE")
+    assert manifest.is_stale("day=1/")
+    assert not manifest.is_stale("day=0/")
+    assert get_manifest(directory) is None
+    # the stale part is listed live, the rest is still answered from the index
+    assert directory.join_as_directory("day=1").file_count(use_manifest=True) == 5
+    assert get_manifest(directory.join_as_directory("day=0")) is not None
+
+    manifest.refresh()
+    assert not manifest.is_stale()
+    assert directory.file_count(use_manifest=True) == 13
+
+
+def test_incremental_refresh(s3_client, directory, manifest):
+    put_objects(s3_client, {"data/day=3/part0": b"abc"})
+    assert manifest.refresh() == 1
+    assert manifest.file_count() == 13
+
+    # objects deleted behind ufs' back are dropped by a re-listing of their partition
+    s3_client.delete_object(Bucket=BUCKET, Key="data/day=0/part0")
+    manifest.refresh(partitions=["day=0/"])
+    assert manifest.file_count("day=0/") == 3
+
+
+def test_reopened_manifest(directory, tmp_path):
+    path = str(tmp_path / "manifest.db")
+    with S3Manifest(directory, path) as manifest:
+        manifest.refresh()
+    with S3Manifest(directory, path) as manifest:
+        assert manifest.file_count() == 12 and manifest.refreshed_at is not None
+    with pytest.raises(RuntimeError):
+        S3Manifest(directory.join_as_directory("day=0"), path)
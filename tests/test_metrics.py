@@ -0,0 +1,99 @@
+import gc
+from unittest import mock
+
+from benchmarks.fake_s3 import ClientError
+from tests.conftest import BUCKET, put_objects
+from ufs import metrics
+from ufs.metrics import (
+    InstrumentedS3Client,
+    add_hook,
+    enable_metrics,
+    instrumented_client,
+    remove_hook,
+)
+from ufs.posix.posix_common import file_counter
+from ufs.posix.posix_tree import copy_file
+from ufs.s3.s3_file import S3File
+from ufs.transfer import TransferEngine
+
+
+def test_s3_calls_are_recorded(s3_client):
+    put_objects(s3_client, {"a": b"abc"})
+    registry = enable_metrics()
+    s3_file = S3File(f"s3://{BUCKET}/a", s3_client=s3_client)
+    assert s3_file.read_bytes() == b"abc"
+    assert not S3File(f"s3://{BUCKET}/missing", s3_client=s3_client).exists()
+
+    assert registry.counter("requests", backend="s3", operation="get_object") >= 1
+    assert registry.counter("bytes", backend="s3", operation="get_object") == 3
+    assert registry.counter("errors", backend="s3", operation="head_object") == 1
+    assert registry.histogram("latency", backend="s3", operation="get_object").count >= 1
+    assert "requests" in registry.snapshot()["counters"]
+
+    registry.reset()
+    assert registry.snapshot() == dict(counters=dict(), histograms=dict())
+
+
+def test_posix_calls_and_retries_are_recorded(tmp_path):
+    (tmp_path / "a").write_bytes(b"abc")
+    registry = enable_metrics()
+    assert file_counter(str(tmp_path)) == 1
+    copy_file(str(tmp_path / "a"), str(tmp_path / "b"))
+    assert registry.counter("requests", backend="posix", operation="scandir") == 1
+    assert registry.counter("bytes", backend="posix", operation="copy_file") == 3
+
+    attempts = list()
+
+    def flaky(item):
+        attempts.append(item)
+        if len(attempts) == 1:
+            raise ClientError("SlowDown", "GetObject")
+
+    TransferEngine(backoff=0.001).run(flaky, [1])
+    assert registry.counter("retries") == 1
+
+
+def test_hooks(s3_client):
+    put_objects(s3_client, {"a": b"abc"})
+    events = list()
+    add_hook(events.append)
+    try:
+        S3File(f"s3://{BUCKET}/a", s3_client=s3_client).read_bytes()
+    finally:
+        remove_hook(events.append)
+    assert [(event.backend, event.target) for event in events] == [("s3", f"s3://{BUCKET}/a")]
+
+    S3File(f"s3://{BUCKET}/a", s3_client=s3_client).read_bytes()
+    assert len(events) == 1
+
+
+def test_disabled_instrumentation_returns_the_client(s3_client):
+    assert instrumented_client(s3_client) is s3_client
+
+
+def test_one_wrapper_per_client(s3_client):
+    enable_metrics()
+    wrapper = instrumented_client(s3_client)
+    assert isinstance(wrapper, InstrumentedS3Client)
+    assert instrumented_client(s3_client) is wrapper
+
+    # Mock clients make up an attribute for any name, they still get one wrapper
+    client = mock.Mock()
+    assert instrumented_client(client) is instrumented_client(client)
+
+
+def test_slotted_clients_are_not_kept_alive():
+    class SlottedClient:
+        __slots__ = ("__weakref__",)
+
+        def head_object(self, **kwargs):
+            return dict()
+
+    enable_metrics()
+    client = SlottedClient()
+    wrapper = instrumented_client(client)
+    assert instrumented_client(client) is wrapper
+    assert wrapper.head_object(Bucket="b", Key="k") == dict()
+    del client, wrapper
+    gc.collect()
+    assert len(metrics._slotted_wrappers) == 0
@@ -0,0 +1,149 @@
+import os
+
+import pytest
+
+from ufs import base
+from ufs.base import FileSystem, register_scheme
+from ufs.posix.posix_common import atomic_writer, file_counter, get_dir_size, get_files_list, scan_tree
+from ufs.posix.posix_directory import PosixDirectory
+from ufs.posix.posix_file import PosixFile
+from ufs.posix.posix_tree import copy_file, copy_tree, remove_tree
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "tree"
+    for index in range(30):
+        path = root / f"d{index % 3}" / f"e{index % 2}" / f"f{index}.txt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * index)
+    return str(root)
+
+
+def _relative(paths, root):
+    return sorted(os.path.relpath(path, root) for path in paths)
+
+
+@pytest.mark.parametrize("fan_out", [1, 4])
+def test_tree_walker(tree, fan_out):
+    assert file_counter(tree, fan_out=fan_out) == 30
+    assert get_dir_size(tree, fan_out=fan_out) == sum(range(30))
+    files = get_files_list(tree, fan_out=fan_out)
+    assert len(set(files)) == 30
+    assert get_files_list(tree, fan_out=fan_out, sort=True) == sorted(files)
+    scan = scan_tree(tree, fan_out=fan_out, list_files=True)
+    assert (scan.file_count, scan.size) == (30, sum(range(30)))
+    assert _relative(scan.files, tree) == _relative(files, tree)
+    assert len(get_files_list(tree, recursive=False)) == 0
+
+
+def test_symlink_cycles_are_skipped(tree):
+    os.symlink(tree, os.path.join(tree, "d0", "loop"))
+    assert file_counter(tree) == 30
+    assert file_counter(tree, symlinks="skip") == 30
+
+
+def test_copy_and_remove_tree(tree, tmp_path):
+    dst = str(tmp_path / "copy")
+    progress = list()
+    result = copy_tree(tree, dst, preserve_metadata=True, fan_out=4, progress=progress.append)
+    assert result.ok and len(result.succeeded) == 30
+    assert progress[-1].bytes == sum(range(30))
+    assert _relative(get_files_list(dst), dst) == _relative(get_files_list(tree), tree)
+    assert os.stat(os.path.join(dst, "d1")).st_mtime == os.stat(os.path.join(tree, "d1")).st_mtime
+    with pytest.raises(FileExistsError):
+        copy_tree(tree, dst)
+
+    result = remove_tree(dst, fan_out=4)
+    assert result.ok
+    assert not os.path.exists(dst)
+    assert remove_tree(dst).ok
+    with pytest.raises(FileNotFoundError):
+        remove_tree(dst, missing_ok=False)
+
+
+def test_directory_duplicate_and_remove(tree, tmp_path):
+    src = PosixDirectory(tree + "/")
+    dst = PosixDirectory(str(tmp_path / "copy") + "/")
+    src.duplicate(dst)
+    assert dst.file_count() == 30
+    dst.remove()
+    assert not dst.exists()
+
+
+def test_copy_file(tmp_path):
+    src = tmp_path / "src"
+    src.write_bytes(b"content")
+    assert copy_file(str(src), str(tmp_path / "dst")) == 7
+    assert (tmp_path / "dst").read_bytes() == b"content"
+
+
+def test_atomic_writer(tmp_path):
+    path = str(tmp_path / "file.txt")
+    with atomic_writer(path, "w") as f:
+        f.write("first")
+    with atomic_writer(path, "a") as f:
+        f.write(" second")
+    assert PosixFile(path).read_text() == "first second"
+
+    with pytest.raises(ValueError):
+        with atomic_writer(path, "w") as f:
+            f.write("partial")
+            raise ValueError()
+    # the previous content is kept, and no temporary file is left behind
+    assert PosixFile(path).read_text() == "first second"
+    assert os.listdir(str(tmp_path)) == ["file.txt"]
+
+    with pytest.raises(RuntimeError):
+        with atomic_writer(path, "r"):
+            pass
+
+
+def test_atomic_write_methods(tmp_path):
+    posix_file = PosixFile(str(tmp_path / "file.bin"))
+    posix_file.write_bytes(b"abc", "WRITE", atomic=True)
+    posix_file.write_text("def", "APPEND", atomic=True)
+    assert posix_file.read_bytes() == b"abcdef"
+    with posix_file.atomic_writer() as f:
+        f.write(b"new")
+    assert posix_file.read_bytes() == b"new"
+
+
+def test_read_view_and_readinto(tmp_path):
+    posix_file = PosixFile(str(tmp_path / "file.bin"))
+    posix_file.write_bytes(bytes(range(100)), "WRITE")
+    with posix_file.read_view() as view:
+        assert view.readonly
+        assert bytes(view[10:20]) == bytes(range(10, 20))
+    buffer = bytearray(50)
+    assert posix_file.readinto(buffer, offset=60) == 40
+    assert bytes(buffer[:40]) == bytes(range(60, 100))
+
+    empty = PosixFile(str(tmp_path / "empty"))
+    empty.touch()
+    with empty.read_view() as view:
+        assert len(view) == 0
+
+
+def test_path_dispatch(tmp_path):
+    assert isinstance(FileSystem.to_file(str(tmp_path / "a")), PosixFile)
+    assert isinstance(FileSystem.to_directory(str(tmp_path) + "/"), PosixDirectory)
+    files = FileSystem.to_files([str(tmp_path / "a"), str(tmp_path / "b")])
+    assert [type(f) for f in files] == [PosixFile, PosixFile]
+    with pytest.raises(RuntimeError):
+        FileSystem.to_file("mem://a")
+
+
+class MemoryFile(PosixFile):
+    __slots__ = ()
+
+    def _validate_path(self, path: str) -> bool:
+        return path.startswith("mem://")
+
+
+def test_register_scheme(monkeypatch):
+    monkeypatch.setattr(base, "_SCHEMES", dict(base._SCHEMES))
+    monkeypatch.setattr(base, "_DISPATCH", dict(base._DISPATCH))
+    register_scheme("mem://", "tests.test_posix:MemoryFile", "ufs.posix.posix_directory:PosixDirectory")
+    files = FileSystem.to_files(["mem://a", "/tmp/b", "mem://c"])
+    assert [type(f) for f in files] == [MemoryFile, PosixFile, MemoryFile]
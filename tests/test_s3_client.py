@@ -0,0 +1,35 @@
+from benchmarks.fake_s3 import FakeS3Client
+from ufs.s3.s3_client import (
+    DEFAULT_MAX_POOL_CONNECTIONS,
+    S3ClientPool,
+    get_client_pool,
+    get_s3_client,
+    pool_connections_for,
+)
+from ufs.s3.s3_file import S3File
+
+
+def test_pool_connections_for():
+    assert pool_connections_for(16, 8) == 128
+    assert DEFAULT_MAX_POOL_CONNECTIONS == pool_connections_for(16, 8)
+
+
+def test_registered_clients_are_keyed():
+    pool = S3ClientPool()
+    default, regional, large = FakeS3Client(), FakeS3Client(), FakeS3Client()
+    pool.register(default)
+    pool.register(regional, region_name="eu-west-1")
+    pool.register(large, max_pool_connections=512)
+    assert pool.get() is default
+    assert pool.get(max_pool_connections=DEFAULT_MAX_POOL_CONNECTIONS) is default
+    assert pool.get(region_name="eu-west-1") is regional
+    assert pool.get(max_pool_connections=512) is large
+
+
+def test_objects_share_the_default_client(s3_client):
+    assert get_s3_client() is s3_client
+    first = S3File("s3://bucket/a")
+    second = S3File("s3://bucket/b")
+    assert first._client is second._client is s3_client
+    get_client_pool().clear()
+    assert S3File("s3://bucket/a", s3_client=s3_client)._client is s3_client
@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+from tests.conftest import BUCKET, put_objects
+from ufs.base import FileSystem
+from ufs.posix.posix_directory import PosixDirectory
+from ufs.s3.s3_directory import S3Directory
+from ufs.transfer import TransferEngine, TransferException
+
+
+@pytest.fixture
+def tree(s3_client):
+    objects = dict()
+    for group in range(3):
+        for sub in range(4):
+            for index in range(5):
+                objects[f"data/g{group}/s{sub}/f{index}.txt"] = f"{group}{sub}{index}".encode()
+    objects["data/top.json"] = b"{}"
+    put_objects(s3_client, objects)
+    return objects
+
+
+def test_iter_files_is_lazy(s3_client, tree):
+    directory = S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client)
+    files = directory.iter_files()
+    assert s3_client.requests == 0
+    assert next(files) == f"s3://{BUCKET}/data/g0/s0/f0.txt"
+    assert len(directory.list_files(limit=7)) == 7
+
+
+def test_iter_entries_carry_listing_metadata(s3_client, tree):
+    directory = S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client)
+    entries = directory.list_entries()
+    assert len(entries) == len(tree)
+    first = entries[0]
+    assert first.size == 3
+    assert first.etag and not first.etag.startswith('"')
+    assert directory.file_count() == len(tree)
+    assert directory.size() == sum(len(data) for data in tree.values())
+
+
+def test_non_recursive_listing(s3_client, tree):
+    directory = S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client)
+    assert directory.list_files(recursive=False) == [f"s3://{BUCKET}/data/top.json"]
+
+
+@pytest.mark.parametrize("fan_out", [2, 8])
+def test_parallel_listing_matches_sequential(s3_client, tree, fan_out):
+    directory = S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client)
+    expected = directory.list_files(sort=True)
+    assert directory.list_files(sort=True, fan_out=fan_out) == expected
+    assert sorted(directory.list_files(fan_out=fan_out)) == expected
+
+
+def test_parallel_listing_splits_below_first_level(s3_client):
+    # a single top level prefix, the fan-out has to go one level deeper
+    put_objects(s3_client, {f"data/only/s{i}/f.txt": b"x" for i in range(20)})
+    directory = S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client)
+    expected = [f"s3://{BUCKET}/data/only/s{i}/f.txt" for i in sorted(range(20), key=str)]
+    assert directory.list_files(sort=True, fan_out=8) == expected
+
+
+def test_glob_and_find(s3_client, tree):
+    directory = S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client)
+    root = f"s3://{BUCKET}/data/"
+    assert sorted(directory.glob("g1/*/f0.txt")) == [f"{root}g1/s{sub}/f0.txt" for sub in range(4)]
+    assert list(directory.glob("*.json")) == [f"{root}top.json"]
+    assert len(list(directory.glob("**/*.txt"))) == len(tree) - 1
+    entries = list(directory.find("**", predicate=lambda entry: entry.path.endswith("f4.txt")))
+    assert len(entries) == 12
+
+
+def test_summary(s3_client, tree):
+    summary = S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client).summary()
+    assert summary.file_count == len(tree)
+    assert summary.size == sum(len(data) for data in tree.values())
+
+
+def test_download_upload_round_trip(s3_client, tree, tmp_path):
+    src = S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client)
+    local = PosixDirectory(str(tmp_path) + "/local/")
+    progress = list()
+    result = src.duplicate(local, engine=TransferEngine(max_workers=4), fan_out=4, progress=progress.append)
+    assert result.ok and len(result.succeeded) == len(tree)
+    assert progress[-1].items == len(tree)
+    with open(os.path.join(str(local), "g2/s3/f4.txt"), "rb") as f:
+        assert f.read() == b"234"
+
+    dst = S3Directory(f"s3://{BUCKET}/copy/", s3_client=s3_client)
+    result = local.duplicate(dst)
+    assert len(result.succeeded) == len(tree)
+    assert dst.join_as_file("g0/s1/f2.txt").read_bytes() == b"012"
+
+
+def test_server_side_duplicate(s3_client, tree):
+    src = S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client)
+    dst = S3Directory(f"s3://{BUCKET}/copy/", s3_client=s3_client)
+    result = src.duplicate(dst, fan_out=4)
+    assert len(result.succeeded) == len(tree)
+    assert dst.file_count() == len(tree)
+
+
+def test_download_reports_failures(s3_client, tree, tmp_path):
+    src = S3Directory(f"s3://{BUCKET}/data/", s3_client=s3_client)
+    local = PosixDirectory(str(tmp_path) + "/local/")
+    os.makedirs(str(local))
+    # a file where a directory has to be created
+    with open(os.path.join(str(local), "g1"), "w"):
+        pass
+    with pytest.raises(TransferException) as info:
+        src.duplicate(local, dir_exist_ok=True)
+    assert len(info.value.result.failed) == 20
+    assert len(info.value.result.succeeded) == len(tree) - 20
+
+
+def test_filesystem_dispatch(s3_client):
+    directory = FileSystem.to_directory(f"s3://{BUCKET}/data/")
+    assert isinstance(directory, S3Directory)
+    assert directory._client is s3_client
@@ -0,0 +1,172 @@
+import hashlib
+import os
+
+import pytest
+
+from benchmarks.fake_s3 import ClientError
+from tests.conftest import BUCKET, put_objects
+from ufs.posix.posix_file import PosixFile
+from ufs.s3 import s3_transfer
+from ufs.s3.s3_common import error_code
+from ufs.s3.s3_file import S3File
+from ufs.s3.s3_transfer import MIN_PART_SIZE, S3TransferConfig
+
+DATA = bytes(range(256)) * 4
+SMALL_PARTS = S3TransferConfig(part_size=100, max_concurrency=4, multipart_threshold=200)
+UPLOAD_PARTS = S3TransferConfig(part_size=MIN_PART_SIZE, max_concurrency=1, multipart_threshold=MIN_PART_SIZE)
+
+
+@pytest.fixture
+def s3_file(s3_client):
+    put_objects(s3_client, {"data/file.bin": DATA})
+    return S3File(f"s3://{BUCKET}/data/file.bin", s3_client=s3_client)
+
+
+def test_small_read_is_a_single_request(s3_client, s3_file):
+    assert s3_file.read_bytes() == DATA
+    assert s3_client.requests == 1
+
+
+def test_read_with_known_size(s3_client, s3_file):
+    assert s3_file.read_bytes(size=len(DATA)) == DATA
+    assert s3_client.requests == 1
+
+
+def test_ranged_parallel_read(s3_client, s3_file):
+    s3_file.transfer_config = SMALL_PARTS
+    assert s3_file.read_bytes() == DATA
+    assert s3_client.requests == 11
+    assert b"".join(s3_file.iter_chunks()) == DATA
+    assert b"".join(s3_file.iter_chunks(offset=1000)) == DATA[1000:]
+
+
+def test_read_empty_object(s3_client):
+    put_objects(s3_client, {"empty": b""})
+    s3_file = S3File(f"s3://{BUCKET}/empty", s3_client=s3_client)
+    assert s3_file.read_bytes() == b""
+    assert list(s3_file.iter_chunks()) == []
+
+
+def test_read_range_and_readinto(s3_file):
+    assert s3_file.read_range(10, 5) == DATA[10:15]
+    buffer = bytearray(2000)
+    assert s3_file.readinto(buffer, offset=24) == 1000
+    assert bytes(buffer[:1000]) == DATA[24:]
+
+
+def test_chunks_are_pinned_to_the_etag(s3_file):
+    s3_file.transfer_config = SMALL_PARTS
+    with pytest.raises(Exception) as info:
+        list(s3_file.iter_chunks(etag='"stale"'))
+    assert error_code(info.value) == "412"
+
+
+def test_size_and_exists_without_head_permission(s3_client, s3_file, monkeypatch):
+    def head_object(**kwargs):
+        raise ClientError("403", "HeadObject")
+
+    monkeypatch.setattr(s3_client, "head_object", head_object)
+    assert s3_file.size() == len(DATA)
+    assert s3_file.exists()
+    assert not S3File(f"s3://{BUCKET}/missing", s3_client=s3_client).exists()
+
+
+def test_open_read_and_write(s3_client):
+    s3_file = S3File(f"s3://{BUCKET}/text.txt", s3_client=s3_client)
+    with s3_file.open("w") as f:
+        for index in range(100):
+            f.write(f"line {index}\n")
+    with s3_file.open("r") as f:
+        lines = f.readlines()
+    assert len(lines) == 100 and lines[42] == "line 42\n"
+    with s3_file.open("rb") as f:
+        f.seek(5)
+        assert f.read(2) == b"0\n"
+
+
+def test_multipart_write_bytes(s3_client):
+    content = os.urandom(2 * MIN_PART_SIZE + 10)
+    s3_file = S3File(f"s3://{BUCKET}/big", s3_client=s3_client, transfer_config=UPLOAD_PARTS)
+    s3_file.write_bytes(content, "WRITE")
+    assert s3_client.head_object(Bucket=BUCKET, Key="big")["ETag"].endswith('-3"')
+    assert s3_file.read_bytes() == content
+
+
+def test_checksums_from_metadata(s3_client, s3_file):
+    assert s3_file.checksum("md5") == hashlib.md5(DATA).hexdigest()
+    # answered by head_object alone
+    assert s3_client.requests == 1
+
+
+def test_checksums_streamed(s3_file):
+    s3_file.transfer_config = SMALL_PARTS
+    checksums = s3_file.checksums(("sha256", "md5"), use_metadata=False)
+    assert checksums == dict(sha256=hashlib.sha256(DATA).hexdigest(), md5=hashlib.md5(DATA).hexdigest())
+
+
+def test_duplicate(s3_client, s3_file, tmp_path):
+    copy = S3File(f"s3://{BUCKET}/copy/file.bin", s3_client=s3_client)
+    s3_file.duplicate(copy)
+    assert copy.read_bytes() == DATA
+
+    local = PosixFile(str(tmp_path / "sub" / "file.bin"))
+    s3_file.duplicate(local)
+    assert local.read_bytes() == DATA
+
+
+def test_multipart_copy_keeps_attributes(s3_client, monkeypatch):
+    monkeypatch.setattr(s3_transfer, "MAX_COPY_OBJECT_SIZE", 10)
+    s3_client.put_object(
+        Bucket=BUCKET, Key="src", Body=DATA, ContentType="application/x-test", Metadata=dict(owner="me")
+    )
+    src = S3File(f"s3://{BUCKET}/src", s3_client=s3_client, transfer_config=UPLOAD_PARTS)
+    dst = S3File(f"s3://{BUCKET}/dst", s3_client=s3_client)
+    src.duplicate(dst)
+    head = s3_client.head_object(Bucket=BUCKET, Key="dst")
+    assert head["ETag"].endswith('-1"')
+    assert head["ContentType"] == "application/x-test"
+    assert head["Metadata"] == dict(owner="me")
+    assert dst.read_bytes() == DATA
+
+
+def test_resumable_upload(s3_client, tmp_path, monkeypatch):
+    content = os.urandom(2 * MIN_PART_SIZE + 10)
+    src = tmp_path / "big.bin"
+    src.write_bytes(content)
+    state_file = str(tmp_path / "state.json")
+    dst = S3File(f"s3://{BUCKET}/big", s3_client=s3_client, transfer_config=UPLOAD_PARTS)
+
+    upload_part = s3_client.upload_part
+    uploaded = list()
+    failures = [2]
+
+    def failing_upload_part(**kwargs):
+        if kwargs["PartNumber"] in failures:
+            failures.remove(kwargs["PartNumber"])
+            raise ClientError("500", "UploadPart")
+        uploaded.append(kwargs["PartNumber"])
+        return upload_part(**kwargs)
+
+    monkeypatch.setattr(s3_client, "upload_part", failing_upload_part)
+    monkeypatch.setattr(s3_client, "create_multipart_upload", _counted(s3_client.create_multipart_upload))
+    with pytest.raises(Exception):
+        dst._upload(PosixFile(str(src)), state_file=state_file)
+    assert os.path.exists(state_file)
+    assert not dst.exists()
+
+    first_attempt = list(uploaded)
+    dst._upload(PosixFile(str(src)), state_file=state_file)
+    # only the part that failed is uploaded again, into the same upload
+    assert uploaded[len(first_attempt):] == [2]
+    assert s3_client.create_multipart_upload.calls == 1
+    assert not os.path.exists(state_file)
+    assert dst.read_bytes() == content
+
+
+def _counted(func):
+    def wrapper(*args, **kwargs):
+        wrapper.calls += 1
+        return func(*args, **kwargs)
+
+    wrapper.calls = 0
+    return wrapper
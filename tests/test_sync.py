@@ -0,0 +1,81 @@
+import os
+import time
+
+import pytest
+
+from tests.conftest import BUCKET, put_objects
+from ufs.posix.posix_directory import PosixDirectory
+from ufs.s3.s3_directory import S3Directory
+from ufs.sync import SyncAction, diff, sync
+
+
+@pytest.fixture
+def local(tmp_path):
+    root = tmp_path / "src"
+    for name in ("a.txt", "b/c.txt", "b/d/e.txt"):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(name)
+    return PosixDirectory(str(root) + "/")
+
+
+def test_posix_to_s3_is_incremental(s3_client, local):
+    dst = S3Directory(f"s3://{BUCKET}/dst/", s3_client=s3_client)
+    result = sync(local, dst)
+    assert (result.copied, result.unchanged) == (3, 0)
+    assert dst.join_as_file("b/d/e.txt").read_text() == "b/d/e.txt"
+
+    result = sync(local, dst)
+    assert (result.copied, result.unchanged) == (0, 3)
+
+    changed = os.path.join(str(local), "b/c.txt")
+    with open(changed, "w") as f:
+        f.write("changed")
+    future = time.time() + 3600
+    os.utime(changed, (future, future))
+    result = sync(local, dst)
+    assert result.copied == 1 and result.copied_bytes == len("changed")
+
+
+def test_delete_and_dry_run(s3_client, local, capsys):
+    put_objects(s3_client, {"dst/extra.txt": b"extra"})
+    dst = S3Directory(f"s3://{BUCKET}/dst/", s3_client=s3_client)
+    actions = list(diff(local, dst, delete=True))
+    assert SyncAction("delete", "extra.txt", 5, "extra") in actions
+
+    result = sync(local, dst, delete=True, dry_run=True)
+    assert result.copied == 3 and result.deleted == 1
+    assert "Deleting" in capsys.readouterr().out
+    assert dst.file_count() == 1
+
+    result = sync(local, dst, delete=True)
+    assert result.ok and result.deleted == 1
+    assert sorted(dst.list_files()) == [
+        f"s3://{BUCKET}/dst/{name}" for name in ("a.txt", "b/c.txt", "b/d/e.txt")
+    ]
+
+
+def test_s3_to_posix(s3_client, tmp_path):
+    put_objects(s3_client, {"src/x.txt": b"x", "src/y/z.txt": b"yz"})
+    src = S3Directory(f"s3://{BUCKET}/src/", s3_client=s3_client)
+    dst = PosixDirectory(str(tmp_path / "dst") + "/")
+    assert sync(src, dst).copied == 2
+    assert (tmp_path / "dst" / "y" / "z.txt").read_bytes() == b"yz"
+    assert sync(src, dst, compare="size").copied == 0
+
+
+def test_s3_to_s3_keeps_markers_and_compares_etags(s3_client):
+    put_objects(s3_client, {"src/empty/": b"", "src/x.txt": b"x"})
+    src = S3Directory(f"s3://{BUCKET}/src/", s3_client=s3_client)
+    dst = S3Directory(f"s3://{BUCKET}/dst/", s3_client=s3_client)
+    assert sync(src, dst).copied == 2
+    assert s3_client.head_object(Bucket=BUCKET, Key="dst/empty/")["ContentLength"] == 0
+
+    put_objects(s3_client, {"src/x.txt": b"y"})
+    assert sync(src, dst, compare="size").copied == 0
+    assert sync(src, dst, compare="etag").copied == 1
+
+
+def test_invalid_compare_mode(local, tmp_path):
+    with pytest.raises(RuntimeError):
+        list(diff(local, PosixDirectory(str(tmp_path) + "/"), compare="content"))
@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from benchmarks.fake_s3 import ClientError
+from ufs.transfer import ProgressTracker, TransferEngine, TransferException, is_retryable
+
+
+def test_is_retryable():
+    assert is_retryable(ClientError("SlowDown", "GetObject"))
+    assert is_retryable(ClientError("503", "GetObject"))
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(ClientError("404", "GetObject"))
+    assert not is_retryable(ClientError("AccessDenied", "GetObject"))
+    assert not is_retryable(RuntimeError("invalid argument"))
+
+
+def test_run_retries_transient_errors():
+    attempts = dict()
+    lock = threading.Lock()
+
+    def flaky(item):
+        with lock:
+            attempts[item] = attempts.get(item, 0) + 1
+            if attempts[item] < 3:
+                raise ClientError("SlowDown", "PutObject")
+        return item * 2
+
+    result = TransferEngine(max_workers=4, backoff=0.001).run(flaky, range(5))
+    assert result.ok
+    assert result.succeeded == {i: i * 2 for i in range(5)}
+    assert result.retries == 10
+
+
+def test_run_does_not_retry_permanent_errors():
+    attempts = list()
+
+    def missing(item):
+        attempts.append(item)
+        raise ClientError("404", "GetObject")
+
+    result = TransferEngine(backoff=0.001).run(missing, ["a"])
+    assert attempts == ["a"]
+    assert list(result.failed) == ["a"]
+    with pytest.raises(TransferException):
+        result.raise_for_errors()
+
+
+def test_run_gives_up_after_max_attempts():
+    def throttled(item):
+        raise ClientError("SlowDown", "GetObject")
+
+    result = TransferEngine(max_attempts=2, backoff=0.001).run(throttled, ["a"])
+    assert result.retries == 1
+    assert list(result.failed) == ["a"]
+
+
+def test_run_fail_fast_stops_pulling_items():
+    pulled = list()
+
+    def items():
+        for i in range(1000):
+            pulled.append(i)
+            yield i
+
+    def fail(item):
+        raise RuntimeError(item)
+
+    result = TransferEngine(max_workers=2, fail_fast=True).run(fail, items())
+    assert result.failed
+    assert len(pulled) < 1000
+
+
+def test_run_key():
+    result = TransferEngine().run(len, ["a", "bb"], key=lambda item: item.upper())
+    assert result.succeeded == {"A": 1, "BB": 2}
+
+
+def test_progress_tracker():
+    snapshots = list()
+    tracker = ProgressTracker(snapshots.append)
+    tracker.update(10)
+    tracker.update(5)
+    assert [(s.items, s.bytes) for s in snapshots] == [(1, 10), (2, 15)]
+    assert tracker.snapshot().bytes == 15
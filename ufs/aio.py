@@ -0,0 +1,236 @@
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Optional, Sequence
+
+from ufs.base import Directory, File, FileEntry, FileSystemObject
+from ufs.transfer import DEFAULT_MAX_WORKERS
+
+_DONE = object()
+
+
+class AsyncLimiter:
+    """
+    Executor plus concurrency limit shared by async wrappers
+    The blocking backend calls (boto3 client / os) run in the executor, at most
+    max_concurrency of them at a time. Can be used from several event loops.
+    """
+
+    def __init__(
+            self, max_concurrency: int = DEFAULT_MAX_WORKERS, executor: Optional[Executor] = None
+    ):
+        self.max_concurrency = max_concurrency
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        return self._executor
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # one per event loop, a semaphore is bound to the loop it is first used in
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def run(self, func: Callable, *args, **kwargs):
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(func, *args, **kwargs)
+            )
+
+    async def iterate(self, iterator_factory: Callable, batch_size: int = 1000) -> AsyncIterator:
+        """
+        Drive a blocking iterator in a dedicated thread, handing items to the event loop in batches
+        At most two batches are buffered ahead of the consumer. The thread is not taken from the
+        executor, so that consumers awaiting run() for every item always find a free worker.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        # batches the producer may hand over before the consumer takes one
+        slots = threading.Semaphore(2)
+        stop = threading.Event()
+        finished = loop.create_future()
+
+        def put(item):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        def produce():
+            try:
+                batch = list()
+                for item in iterator_factory():
+                    # a consumer gone mid-batch must not leave the listing running to the batch end
+                    if stop.is_set():
+                        return
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        slots.acquire()
+                        if stop.is_set():
+                            return
+                        put(batch)
+                        batch = list()
+                if batch:
+                    put(batch)
+                put(_DONE)
+            except Exception as e:
+                put(e)
+            finally:
+                loop.call_soon_threadsafe(finished.set_result, None)
+
+        threading.Thread(target=produce, name="ufs-aio-iterate", daemon=True).start()
+        try:
+            while True:
+                batch = await queue.get()
+                slots.release()
+                if batch is _DONE:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                for item in batch:
+                    yield item
+        finally:
+            stop.set()
+            # unblock a producer waiting for a slot, it stops before handing over another batch
+            slots.release()
+            await finished
+
+    def shutdown(self):
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+_default_limiter = None
+
+
+def default_limiter() -> AsyncLimiter:
+    global _default_limiter
+    if _default_limiter is None:
+        _default_limiter = AsyncLimiter()
+    return _default_limiter
+
+
+class AsyncFileSystemObject:
+    def __init__(self, target: FileSystemObject, limiter: Optional[AsyncLimiter] = None):
+        self.target = target
+        self.limiter = limiter or default_limiter()
+
+    def __str__(self):
+        return str(self.target)
+
+    def __fspath__(self):
+        return self.target.__fspath__()
+
+    async def exists(self) -> bool:
+        return await self.limiter.run(self.target.exists)
+
+    async def size(self) -> int:
+        return await self.limiter.run(self.target.size)
+
+
+class AsyncFile(AsyncFileSystemObject):
+    """Async facade over a File (PosixFile or S3File)"""
+
+    target: File
+
+    async def read_bytes(self) -> bytes:
+        return await self.limiter.run(self.target.read_bytes)
+
+    async def read_text(self, *args, **kwargs) -> str:
+        return await self.limiter.run(self.target.read_text, *args, **kwargs)
+
+    async def write_bytes(self, content: bytes, mode: str = "WRITE", *args, **kwargs):
+        return await self.limiter.run(self.target.write_bytes, content, mode, *args, **kwargs)
+
+    async def write_text(self, content: str, mode: str = "WRITE", *args, **kwargs):
+        return await self.limiter.run(self.target.write_text, content, mode, *args, **kwargs)
+
+    async def remove(self, *args, **kwargs):
+        return await self.limiter.run(self.target.remove, *args, **kwargs)
+
+    async def checksum(self, algorithm: str = "sha256", *args, **kwargs) -> str:
+        return await self.limiter.run(self.target.checksum, algorithm, *args, **kwargs)
+
+    async def checksums(self, algorithms: Sequence[str] = ("sha256",), *args, **kwargs) -> dict:
+        return await self.limiter.run(self.target.checksums, algorithms, *args, **kwargs)
+
+    async def duplicate(self, dst: File):
+        return await self.limiter.run(self.target.duplicate, _unwrap(dst))
+
+    async def copy_to(self, dst: Directory):
+        return await self.limiter.run(self.target.copy_to, _unwrap(dst))
+
+
+class AsyncDirectory(AsyncFileSystemObject):
+    """Async facade over a Directory (PosixDirectory or S3Directory)"""
+
+    target: Directory
+
+    async def iter_files(self, recursive: bool = True, *args, **kwargs) -> AsyncIterator[str]:
+        iterator = functools.partial(self.target.iter_files, recursive, *args, **kwargs)
+        async for file_path in self.limiter.iterate(iterator):
+            yield file_path
+
+    async def iter_entries(
+            self, recursive: bool = True, *args, **kwargs
+    ) -> AsyncIterator[FileEntry]:
+        iterator = functools.partial(self.target.iter_entries, recursive, *args, **kwargs)
+        async for entry in self.limiter.iterate(iterator):
+            yield entry
+
+    async def iter_file_objects(
+            self, recursive: bool = True, *args, **kwargs
+    ) -> AsyncIterator[AsyncFile]:
+        iterator = functools.partial(self.target.iter_file_objects, recursive, *args, **kwargs)
+        async for file in self.limiter.iterate(iterator):
+            yield AsyncFile(file, limiter=self.limiter)
+
+    async def list_files(self, recursive: bool = True, *args, **kwargs) -> list:
+        return await self.limiter.run(self.target.list_files, recursive, *args, **kwargs)
+
+    async def file_count(self, *args, **kwargs) -> int:
+        return await self.limiter.run(self.target.file_count, *args, **kwargs)
+
+    async def size(self, *args, **kwargs) -> int:
+        return await self.limiter.run(self.target.size, *args, **kwargs)
+
+    async def create(self, *args, **kwargs):
+        return await self.limiter.run(self.target.create, *args, **kwargs)
+
+    async def remove(self, *args, **kwargs):
+        return await self.limiter.run(self.target.remove, *args, **kwargs)
+
+    async def duplicate(self, dst: Directory, *args, **kwargs):
+        return await self.limiter.run(self.target.duplicate, _unwrap(dst), *args, **kwargs)
+
+    async def copy_to(self, dst: Directory, *args, **kwargs):
+        return await self.limiter.run(self.target.copy_to, _unwrap(dst), *args, **kwargs)
+
+    def join_as_file(self, *other) -> AsyncFile:
+        return AsyncFile(self.target.join_as_file(*other), limiter=self.limiter)
+
+    def join_as_directory(self, *other) -> "AsyncDirectory":
+        return AsyncDirectory(self.target.join_as_directory(*other), limiter=self.limiter)
+
+
+def _unwrap(obj):
+    return obj.target if isinstance(obj, AsyncFileSystemObject) else obj
+
+
+def to_async(obj: FileSystemObject, limiter: Optional[AsyncLimiter] = None):
+    if isinstance(obj, File):
+        return AsyncFile(obj, limiter=limiter)
+    if isinstance(obj, Directory):
+        return AsyncDirectory(obj, limiter=limiter)
+    raise RuntimeError(f"Un-supported file system object: {obj!r}")
@@ -0,0 +1,170 @@
+import gzip
+import io
+import tarfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+
+from ufs.base import Directory, File, FileEntry
+from ufs.transfer import ProgressTracker, TransferProgress
+
+ARCHIVE_EXTENSIONS = {"zip": ".zip", "gztar": ".tar.gz", "zstdtar": ".tar.zst"}
+# files up to this size are read ahead concurrently, larger ones are streamed when their turn comes
+PREFETCH_SIZE = 8 * 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def archive_extension(archive_format: str) -> str:
+    if archive_format not in ARCHIVE_EXTENSIONS:
+        raise RuntimeError(f"Un-supported archive format: {archive_format}")
+    return ARCHIVE_EXTENSIONS[archive_format]
+
+
+def _zstd_writer_factory(level: Optional[int]) -> Callable[[BinaryIO], BinaryIO]:
+    level = 3 if level is None else level
+    try:
+        from compression import zstd
+    except ImportError:
+        pass
+    else:
+        return lambda stream: zstd.ZstdFile(stream, "wb", level=level)
+
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstdtar archive format requires Python 3.14+ or the zstandard package")
+
+    compressor = zstandard.ZstdCompressor(level=level)
+    return lambda stream: compressor.stream_writer(stream, closefd=False)
+
+
+def _iter_sources(
+        src: Directory, prefetch: int, prefetch_size: int
+) -> Iterator[Tuple[str, FileEntry, BinaryIO]]:
+    """
+    Yield (archive name, entry, readable stream) in listing order, with up to prefetch small
+    files read concurrently ahead of the one being archived
+    """
+    from ufs.s3.s3_directory import S3Directory
+
+    root = str(src)
+    # the listed size saves S3 reads from learning it with their first request
+    known_size = isinstance(src, S3Directory)
+
+    def read(name: str, entry: FileEntry) -> BinaryIO:
+        file = src.join_as_file(name)
+        return io.BytesIO(file.read_bytes(size=entry.size) if known_size else file.read_bytes())
+
+    with ThreadPoolExecutor(max_workers=prefetch) as executor:
+        window = deque()
+        entries = src.iter_entries(recursive=True, sort=True)
+        try:
+            while True:
+                while len(window) < prefetch:
+                    entry = next(entries, None)
+                    if entry is None:
+                        break
+                    name = entry.path[len(root):].lstrip("/")
+                    future = executor.submit(read, name, entry) if entry.size <= prefetch_size else None
+                    window.append((name, entry, future))
+                if not window:
+                    return
+
+                name, entry, future = window.popleft()
+                if future is not None:
+                    yield name, entry, future.result()
+                    continue
+                kwargs = dict(size=entry.size) if known_size else dict()
+                with src.join_as_file(name).open("rb", **kwargs) as stream:
+                    yield name, entry, stream
+        finally:
+            for _, _, future in window:
+                if future is not None:
+                    future.cancel()
+
+
+def _track(sources, tracker: ProgressTracker):
+    previous = None
+    for source in sources:
+        # a file is archived once the writer asks for the next one
+        if previous is not None:
+            tracker.update(previous.size)
+        previous = source[1]
+        yield source
+    if previous is not None:
+        tracker.update(previous.size)
+
+
+def _write_zip(stream: BinaryIO, sources, level: Optional[int]):
+    with zipfile.ZipFile(
+            stream, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=level
+    ) as archive:
+        for name, entry, source in sources:
+            info = zipfile.ZipInfo(name, date_time=time.localtime(entry.mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            if isinstance(source, io.BytesIO):
+                # prefetched, already in memory
+                archive.writestr(info, source.getvalue(), compresslevel=level)
+                continue
+
+            # ZipFile.open() takes the level from the ZipInfo only, settable from Python 3.13
+            if level is not None and hasattr(zipfile.ZipInfo, "compress_level"):
+                info.compress_level = level
+            info.file_size = entry.size
+            with archive.open(info, "w", force_zip64=entry.size >= zipfile.ZIP64_LIMIT) as f:
+                while True:
+                    chunk = source.read(COPY_BUFFER_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+
+
+def _write_tar(stream: BinaryIO, sources):
+    with tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT) as archive:
+        for name, entry, source in sources:
+            info = tarfile.TarInfo(name)
+            info.size = entry.size
+            info.mtime = int(entry.mtime)
+            archive.addfile(info, source)
+
+
+def write_archive(
+        src: Directory,
+        dst: File,
+        archive_format: str,
+        compression_level: Optional[int] = None,
+        prefetch: int = 8,
+        prefetch_size: int = PREFETCH_SIZE,
+        progress: Optional[Callable[[TransferProgress], None]] = None,
+):
+    """
+    Archive src into dst in one streaming pass, without staging files or the archive on local disk
+    dst is written through File.open, i.e. a local file or an S3 multipart upload.
+    Memory is bounded by prefetch * prefetch_size plus the transfer buffers.
+    :param archive_format: zip, gztar or zstdtar (zstdtar needs Python 3.14+ or the zstandard package)
+    :param compression_level: zlib level for zip/gztar (default 6), zstd level for zstdtar (default 3);
+        zip members over prefetch_size get the default level before Python 3.13
+    :param prefetch: number of small source files read concurrently ahead
+    :param progress: called with TransferProgress (files, source bytes, elapsed) after every archived file
+    """
+    extension = archive_extension(archive_format)
+    assert dst.endswith(extension)
+
+    if archive_format == "gztar":
+        level = 6 if compression_level is None else compression_level
+        compressor = lambda stream: gzip.GzipFile(fileobj=stream, mode="wb", compresslevel=level)
+    elif archive_format == "zstdtar":
+        compressor = _zstd_writer_factory(compression_level)
+
+    sources = _iter_sources(src, prefetch=prefetch, prefetch_size=prefetch_size)
+    if progress is not None:
+        sources = _track(sources, ProgressTracker(progress))
+    with dst.open("wb") as stream:
+        if archive_format == "zip":
+            _write_zip(stream, sources, compression_level)
+            return
+
+        with compressor(stream) as compressed:
+            _write_tar(compressed, sources)
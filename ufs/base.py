@@ -1,10 +1,42 @@
 import os
 from abc import ABC, abstractmethod
+from datetime import datetime
 from pathlib import PosixPath
-from typing import Union
+from typing import IO, Callable, Iterable, Iterator, NamedTuple, Optional, Sequence, Union
 
 
-class FileSystemObject(os.PathLike, ABC):
+class FileEntry(NamedTuple):
+    """
+    Listing entry carrying the metadata the backend listing already returned
+    mtime: seconds since epoch
+    etag: S3 ETag without quotes, None on Posix
+    """
+
+    path: str
+    size: int
+    mtime: float
+    etag: Optional[str] = None
+
+    def __str__(self):
+        return self.path
+
+    def __fspath__(self):
+        return self.path
+
+
+class DirectorySummary(NamedTuple):
+    file_count: int
+    size: int
+    last_modified: Optional[float]
+    changed_count: int = 0
+    changed_size: int = 0
+
+
+class FileSystemObject(ABC):
+    # no instance __dict__, listings wrap millions of these
+    # (still an os.PathLike, through __fspath__ and PathLike.__subclasshook__)
+    __slots__ = ("_path",)
+
     def __init__(self, path: Union[str, PosixPath], *args, **kwargs):
         self._path = str(path).strip()
 
@@ -22,11 +54,19 @@ class FileSystemObject(os.PathLike, ABC):
     def size(self) -> int:
         raise NotImplementedError
 
-    def __getattr__(self, item):
-        if item in ("startswith", "endswith", "replace"):
-            return getattr(self._path, item)
+    def startswith(self, *args) -> bool:
+        return self._path.startswith(*args)
+
+    def endswith(self, *args) -> bool:
+        return self._path.endswith(*args)
+
+    def replace(self, *args) -> str:
+        return self._path.replace(*args)
 
-        raise AttributeError(f"Unknown attribute: {item} for {self.__class__}")
+    @classmethod
+    def from_paths(cls, paths: Iterable[str], *args, **kwargs) -> list:
+        """Wrap many paths at once, e.g. a listing, sharing the constructor arguments"""
+        return [cls(path, *args, **kwargs) for path in paths]
 
     def basename(self) -> str:
         return os.path.basename(self._path)
@@ -51,6 +91,8 @@ class FileSystemObject(os.PathLike, ABC):
 
 
 class File(FileSystemObject, ABC):
+    __slots__ = ()
+
     @abstractmethod
     def write_text(self, content, mode, *args, **kwargs):
         raise NotImplementedError
@@ -76,7 +118,15 @@ class File(FileSystemObject, ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def checksum(self, *args, **kwargs) -> str:
+    def open(self, mode: str = "rb", encoding: Optional[str] = None, *args, **kwargs) -> IO:
+        raise NotImplementedError
+
+    @abstractmethod
+    def checksum(self, algorithm: str = "sha256", *args, **kwargs) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def checksums(self, algorithms: Sequence[str] = ("sha256",), *args, **kwargs) -> dict:
         raise NotImplementedError
 
     @abstractmethod
@@ -89,6 +139,8 @@ class File(FileSystemObject, ABC):
 
 
 class DirectoryPrefix(FileSystemObject, ABC):
+    __slots__ = ()
+
     @abstractmethod
     def remove(self, missing_ok: bool = True, dry_run: bool = False, *args, **kwargs):
         raise NotImplementedError
@@ -103,16 +155,133 @@ class DirectoryPrefix(FileSystemObject, ABC):
     def list_file_objects(self, recursive: bool = True, *args, **kwargs) -> list:
         raise NotImplementedError
 
+    @abstractmethod
+    def iter_files(
+            self, recursive: bool = True, limit: int = -1, sort: bool = False, *args, **kwargs
+    ) -> Iterator[str]:
+        """
+        Lazily yield file paths as the underlying listing produces them
+        :param recursive: descend into sub-directories
+        :param limit: stop after this many files, -1 for no limit
+        :param sort: yield paths in sorted order, without materializing the full listing
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_file_objects(
+            self, recursive: bool = True, limit: int = -1, sort: bool = False, *args, **kwargs
+    ) -> Iterator["File"]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_entries(
+            self, recursive: bool = True, limit: int = -1, sort: bool = False, *args, **kwargs
+    ) -> Iterator[FileEntry]:
+        raise NotImplementedError
+
+    def list_entries(
+            self, recursive: bool = True, limit: int = -1, sort: bool = False, *args, **kwargs
+    ) -> list:
+        return list(self.iter_entries(recursive, limit=limit, sort=sort, *args, **kwargs))
+
+    def changed_since(
+            self, since: Union[float, datetime], recursive: bool = True
+    ) -> Iterator[FileEntry]:
+        if isinstance(since, datetime):
+            since = since.timestamp()
+        for entry in self.iter_entries(recursive):
+            if entry.mtime > since:
+                yield entry
+
+    def summary(
+            self, changed_since: Union[float, datetime, None] = None, recursive: bool = True, **kwargs
+    ) -> DirectorySummary:
+        """
+        Count, size and last modification time from a single pass over the listing
+        :param changed_since: also count files (and their size) modified after this time
+        :param kwargs: listing options passed to iter_entries, e.g. fan_out
+        """
+        if isinstance(changed_since, datetime):
+            changed_since = changed_since.timestamp()
+
+        file_count = size = changed_count = changed_size = 0
+        last_modified = None
+        for entry in self.iter_entries(recursive, **kwargs):
+            file_count += 1
+            size += entry.size
+            if last_modified is None or entry.mtime > last_modified:
+                last_modified = entry.mtime
+            if changed_since is not None and entry.mtime > changed_since:
+                changed_count += 1
+                changed_size += entry.size
+
+        return DirectorySummary(file_count, size, last_modified, changed_count, changed_size)
+
+    def glob(self, pattern: str, limit: int = -1, **kwargs) -> Iterator[str]:
+        """
+        Lazily yield the paths of the files matching pattern, relative to this directory
+        '*', '?' and '[...]' match within one path segment, '**' any number of segments
+        (e.g. "year=2024/*/*.parquet", "**/*.json").
+        """
+        for entry in self.find(pattern, limit=limit, **kwargs):
+            yield entry.path
+
+    def find(
+            self,
+            pattern: str = "**",
+            predicate: Optional[Callable[[FileEntry], bool]] = None,
+            min_size: Optional[int] = None,
+            max_size: Optional[int] = None,
+            modified_after: Union[float, datetime, None] = None,
+            modified_before: Union[float, datetime, None] = None,
+            max_depth: int = -1,
+            limit: int = -1,
+            **kwargs,
+    ) -> Iterator[FileEntry]:
+        """
+        Lazily yield FileEntry of the files matching pattern (see glob) and all the conditions
+        This generic version filters the full listing, backends push the pattern into their listing.
+        :param predicate: called with every FileEntry matching the other conditions
+        :param modified_after: exclusive bound on the modification time, like modified_before
+        :param max_depth: deepest sub-directory level to look into, -1 for no limit
+        """
+        from ufs.pattern import GlobPattern, entry_filter
+
+        matcher = GlobPattern(pattern)
+        accept = entry_filter(predicate, min_size, max_size, modified_after, modified_before)
+        root_length = len(str(self))
+        for entry in self.iter_entries(True, **kwargs):
+            relative_path = entry.path[root_length:]
+            if 0 <= max_depth < relative_path.count("/") or not matcher.match(relative_path):
+                continue
+            if accept is None or accept(entry):
+                yield entry
+                limit -= 1
+                if limit == 0:
+                    return
+
     @abstractmethod
     def copy_to(self, dst: "Directory", dir_exist_ok: bool = False):
         raise NotImplementedError
 
     @abstractmethod
-    def archive_to_posix(self, dst: File, archive_format: str):
+    def archive_to_posix(
+            self,
+            dst: File,
+            archive_format: str,
+            compression_level: Optional[int] = None,
+            progress: Optional[Callable] = None,
+    ):
         raise NotImplementedError
 
     @abstractmethod
-    def archive_to_s3(self, dst: File, archive_format: str):
+    def archive_to_s3(
+            self,
+            dst: File,
+            archive_format: str,
+            compression_level: Optional[int] = None,
+            progress: Optional[Callable] = None,
+    ):
         raise NotImplementedError
 
     @abstractmethod
@@ -121,6 +290,8 @@ class DirectoryPrefix(FileSystemObject, ABC):
 
 
 class Directory(DirectoryPrefix, ABC):
+    __slots__ = ()
+
     @abstractmethod
     def create(self, parents: bool = True, exist_ok: bool = False, *args, **kwargs):
         raise NotImplementedError
@@ -137,43 +308,184 @@ class Directory(DirectoryPrefix, ABC):
     def join_as_directory(self, *other) -> "Directory":
         raise NotImplementedError
 
+    def _checksum_files(
+            self,
+            entries: Iterable[FileEntry],
+            algorithm: str,
+            workers: Optional[int] = None,
+            tracker: Optional["ProgressTracker"] = None,
+    ):
+        """
+        Digest of every entry (files of this directory) on worker threads, TransferResult keyed by path
+        :param tracker: updated per hashed file, may be shared with other calls
+        """
+        from ufs.transfer import DEFAULT_MAX_WORKERS, ProgressTracker, TransferEngine
+
+        root_length = len(str(self))
+        tracker = tracker or ProgressTracker()
+
+        def digest(entry: FileEntry) -> str:
+            value = self.join_as_file(entry.path[root_length:]).checksum(algorithm)
+            tracker.update(entry.size)
+            return value
+
+        engine = TransferEngine(max_workers=workers or DEFAULT_MAX_WORKERS)
+        return engine.run(digest, entries, key=lambda entry: entry.path)
+
+    def checksums(
+            self,
+            algorithm: str = "sha256",
+            workers: Optional[int] = None,
+            progress: Optional[Callable] = None,
+            **kwargs,
+    ) -> "ChecksumManifest":
+        """
+        Digest of every file, hashed in parallel: processes for Posix (CPU bound),
+        threads for S3 (streams, or the object's checksum metadata when available)
+        Posix worker processes are started with forkserver (spawn on Windows), so scripts calling
+        this with workers > 1 need the usual if __name__ == "__main__" guard.
+        :param workers: files hashed at the same time, defaults to the cpu count (Posix)
+            or DEFAULT_MAX_WORKERS (S3)
+        :param progress: called with TransferProgress (files, bytes, elapsed) after every file
+        :param kwargs: listing options passed to iter_entries, e.g. fan_out
+        :return: ChecksumManifest of (relative path, size, digest), see ufs.integrity
+        """
+        from ufs.integrity import checksum_directory
+
+        return checksum_directory(self, algorithm, workers, progress, **kwargs)
+
+    def verify(
+            self,
+            reference: Union["ChecksumManifest", "Directory"],
+            algorithm: Optional[str] = None,
+            workers: Optional[int] = None,
+            progress: Optional[Callable] = None,
+    ) -> "VerifyResult":
+        """
+        Compare the files of this directory to a ChecksumManifest, or to another directory
+        (e.g. a PosixDirectory and its S3Directory copy, both hashed at the same time)
+        Listings are compared first, only files present on both sides with the same size are hashed.
+        :param algorithm: defaults to the manifest's algorithm, or sha256
+        """
+        from ufs.integrity import verify
+
+        return verify(self, reference, algorithm, workers, progress)
+
+
+# scheme -> (file class, directory class, directory prefix class) as "module:Class" names,
+# imported on first use
+_SCHEMES = dict()
+# (scheme, kind) -> class, filled as paths are dispatched
+_DISPATCH = dict()
+_KINDS = ("file", "directory", "directory_prefix")
+
+
+def register_scheme(
+        scheme: str, file_class: str, directory_class: str, directory_prefix_class: Optional[str] = None
+):
+    """
+    Map a path scheme to its classes, e.g. register_scheme("s3://", "ufs.s3.s3_file:S3File", ...)
+    The scheme "/" stands for Posix paths.
+    """
+    _SCHEMES[scheme] = (file_class, directory_class, directory_prefix_class or directory_class)
+    for kind in _KINDS:
+        _DISPATCH.pop((scheme, kind), None)
+
+
+register_scheme("/", "ufs.posix.posix_file:PosixFile", "ufs.posix.posix_directory:PosixDirectory")
+register_scheme("s3://", "ufs.s3.s3_file:S3File", "ufs.s3.s3_directory:S3Directory")
+register_scheme("s3a://", "ufs.s3.s3_file:S3File", "ufs.s3.s3_directory:S3Directory")
+
+
+def _scheme(path: str) -> str:
+    if path.startswith("/"):
+        return "/"
+    end = path.find("://")
+    return path[:end + 3] if end > 0 else path
+
+
+def _dispatch(path: str, kind: str) -> type:
+    scheme = _scheme(path)
+    cls = _DISPATCH.get((scheme, kind))
+    if cls is not None:
+        return cls
+
+    if scheme not in _SCHEMES:
+        raise RuntimeError(f"Unknown filesystem path: {path}")
+
+    from importlib import import_module
+
+    module_name, class_name = _SCHEMES[scheme][_KINDS.index(kind)].split(":")
+    cls = getattr(import_module(module_name), class_name)
+    _DISPATCH[(scheme, kind)] = cls
+    return cls
+
 
 class FileSystem:
     @staticmethod
-    def to_file(path: str):
-        if path.strip().startswith("/"):
-            from ufs.posix.posix_file import PosixFile
+    def to_file(path: str, s3_client=None):
+        path = path.strip()
+        return _dispatch(path, "file")(path, s3_client=s3_client)
 
-            return PosixFile(path)
-        elif path.strip().startswith("s3://") or path.strip().startswith("s3a://"):
-            from ufs.s3.s3_file import S3File
+    @staticmethod
+    def to_directory(path, s3_client=None):
+        path = path.strip()
+        return _dispatch(path, "directory")(path, s3_client=s3_client)
 
-            return S3File(path)
-        raise RuntimeError(f"Unknown filesystem path: {path}")
+    @staticmethod
+    def to_directory_prefix(path, s3_client=None):
+        path = path.strip()
+        return _dispatch(path, "directory_prefix")(path, s3_client=s3_client)
 
     @staticmethod
-    def to_directory(path):
-        if path.strip().startswith("/"):
-            from ufs.posix.posix_directory import PosixDirectory
+    def to_files(paths: Iterable[str], s3_client=None) -> list:
+        """
+        Bulk to_file, e.g. for wrapping a listing
+        Consecutive paths of the same scheme are constructed together with from_paths.
+        """
+        files = list()
+        batch = list()
+        batch_scheme = None
+        for path in paths:
+            scheme = _scheme(path)
+            if scheme != batch_scheme and batch:
+                cls = _dispatch(batch[0], "file")
+                files.extend(cls.from_paths(batch, s3_client=s3_client))
+                batch = list()
+            batch_scheme = scheme
+            batch.append(path)
+        if batch:
+            files.extend(_dispatch(batch[0], "file").from_paths(batch, s3_client=s3_client))
+        return files
 
-            return PosixDirectory(path)
-        elif path.strip().startswith("s3://") or path.strip().startswith("s3a://"):
-            from ufs.s3.s3_directory import S3Directory
+    @staticmethod
+    def exists_many(paths: Iterable, fail_fast: bool = False, *args, **kwargs) -> list:
+        """
+        Batch and concurrent variants of the per file operations, see ufs.batch
+        Paths (strings or File objects) are processed concurrently and results are
+        returned in input order.
+        """
+        from ufs.batch import exists_many
 
-            return S3Directory(path)
-        raise RuntimeError(f"Unknown filesystem path: {path}")
+        return exists_many(paths, fail_fast, *args, **kwargs)
 
     @staticmethod
-    def to_directory_prefix(path):
-        if path.strip().startswith("/"):
-            from ufs.posix.posix_directory_prefix import PosixDirectoryPrefix
+    def size_many(paths: Iterable, fail_fast: bool = False, *args, **kwargs) -> list:
+        from ufs.batch import size_many
 
-            return PosixDirectoryPrefix(path)
-        elif path.strip().startswith("s3://") or path.strip().startswith("s3a://"):
-            from ufs.s3.s3_directory_prefix import S3DirectoryPrefix
+        return size_many(paths, fail_fast, *args, **kwargs)
 
-            return S3DirectoryPrefix(path)
-        raise RuntimeError(f"Unknown filesystem path: {path}")
+    @staticmethod
+    def read_many(paths: Iterable, fail_fast: bool = False, *args, **kwargs) -> list:
+        from ufs.batch import read_many
+
+        return read_many(paths, fail_fast, *args, **kwargs)
+
+    @staticmethod
+    def remove_many(paths: Iterable, *args, **kwargs) -> list:
+        from ufs.batch import remove_many
+
+        return remove_many(paths, *args, **kwargs)
 
 
 FS = FileSystem
@@ -0,0 +1,153 @@
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Union
+
+from ufs.base import File, FileSystem
+from ufs.exceptions import FileSystemException
+from ufs.transfer import TransferEngine, TransferException, TransferResult
+
+PathLike = Union[str, File]
+
+
+def _to_files(paths: Iterable[PathLike], s3_client=None) -> List[File]:
+    return [
+        path if isinstance(path, File) else FileSystem.to_file(path, s3_client=s3_client)
+        for path in paths
+    ]
+
+
+def _ordered(result: TransferResult, size: int, fail_fast: bool) -> list:
+    """Per path results in input order, failures are raised (fail_fast) or returned in place"""
+    if fail_fast and result.failed:
+        raise TransferException(result)
+
+    results = [None] * size
+    for index, value in result.succeeded.items():
+        results[index] = value
+    for index, error in result.failed.items():
+        results[index] = error
+    return results
+
+
+def _run(
+        func: Callable[[File], object],
+        paths: Iterable[PathLike],
+        fail_fast: bool,
+        engine: Optional[TransferEngine],
+        s3_client,
+) -> list:
+    files = _to_files(paths, s3_client=s3_client)
+    engine = engine or TransferEngine(fail_fast=fail_fast)
+    result = engine.run(lambda item: func(item[1]), enumerate(files), key=lambda item: item[0])
+    return _ordered(result, len(files), fail_fast)
+
+
+def exists_many(
+        paths: Iterable[PathLike],
+        fail_fast: bool = False,
+        engine: Optional[TransferEngine] = None,
+        s3_client=None,
+) -> list:
+    """
+    exists() of every path, checked concurrently
+    :param paths: path strings or File objects, Posix and S3 can be mixed
+    :param fail_fast: raise TransferException on the first failure, otherwise the exception
+        is returned in place of the failed path's result
+    :param s3_client: client used for S3 path strings
+    :return: list of results in the order of paths
+    """
+    return _run(lambda f: f.exists(), paths, fail_fast, engine, s3_client)
+
+
+def size_many(
+        paths: Iterable[PathLike],
+        fail_fast: bool = False,
+        engine: Optional[TransferEngine] = None,
+        s3_client=None,
+) -> list:
+    return _run(lambda f: f.size(), paths, fail_fast, engine, s3_client)
+
+
+def read_many(
+        paths: Iterable[PathLike],
+        fail_fast: bool = False,
+        engine: Optional[TransferEngine] = None,
+        s3_client=None,
+) -> list:
+    return _run(lambda f: f.read_bytes(), paths, fail_fast, engine, s3_client)
+
+
+def remove_many(
+        paths: Iterable[PathLike],
+        missing_ok: bool = True,
+        dry_run: bool = False,
+        fail_fast: bool = False,
+        engine: Optional[TransferEngine] = None,
+        s3_client=None,
+) -> list:
+    """
+    Remove every path, S3 objects are grouped by client and bucket and deleted with
+    DeleteObjects (1000 keys per request), Posix files are unlinked concurrently
+    :return: list with None for removed paths (or the exception, see exists_many) in the order of paths
+    """
+    from ufs.s3.s3_client import get_s3_client
+    from ufs.s3.s3_common import MAX_DELETE_KEYS, delete_s3_objects
+    from ufs.s3.s3_file import S3File
+
+    files = _to_files(paths, s3_client=s3_client)
+
+    batches = list()
+    groups = OrderedDict()
+    for index, file in enumerate(files):
+        if not isinstance(file, S3File):
+            batches.append((index,))
+            continue
+        if file._s3_client is None:
+            file._s3_client = get_s3_client()
+        # keyed by the client itself: the id of a per call wrapper can be reused once it is freed
+        group = groups.setdefault((file._s3_client, file.bucket_name), list())
+        group.append(index)
+        if len(group) == MAX_DELETE_KEYS:
+            batches.append(tuple(group))
+            group.clear()
+    batches.extend(tuple(group) for group in groups.values() if group)
+
+    def remove(batch: tuple) -> dict:
+        first = files[batch[0]]
+        if not isinstance(first, S3File):
+            if dry_run:
+                print(f"Deleting: {first}")
+            else:
+                first.remove(missing_ok=missing_ok)
+            return dict()
+
+        errors = delete_s3_objects(
+            first._client,
+            first.bucket_name,
+            [dict(Key=files[index].prefix) for index in batch],
+            dry_run=dry_run,
+        )
+        if not dry_run:
+            for index in batch:
+                files[index]._invalidate_metadata()
+        return {error.get("Key"): error for error in errors}
+
+    engine = engine or TransferEngine(fail_fast=fail_fast)
+    batch_result = engine.run(remove, batches)
+
+    # fan the per batch outcome back out to the paths
+    result = TransferResult()
+    result.retries = batch_result.retries
+    for batch, errors in batch_result.succeeded.items():
+        for index in batch:
+            error = errors.get(files[index].prefix) if errors else None
+            if error is None:
+                result.succeeded[index] = None
+            else:
+                result.failed[index] = FileSystemException(
+                    f"Failed to delete {files[index]}: {error.get('Code')} {error.get('Message')}"
+                )
+    for batch, error in batch_result.failed.items():
+        for index in batch:
+            result.failed[index] = error
+
+    return _ordered(result, len(files), fail_fast)
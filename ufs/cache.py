@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+MISSING = object()
+
+
+class MetadataCache:
+    """
+    Thread-safe TTL + LRU cache of per-path metadata (head_object responses, existence)
+    Each path holds a small dict of fields which expires ttl seconds after it was first cached;
+    at most max_entries paths are kept, least recently used ones are evicted first.
+    """
+
+    def __init__(self, max_entries: int = 100000, ttl: float = 60.0):
+        if max_entries < 1:
+            raise RuntimeError(f"Invalid max_entries: {max_entries}")
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, path: str, field: str) -> Any:
+        """Cached value of field for path, or MISSING"""
+        with self._lock:
+            record = self._entries.get(path)
+            if record is not None and record[0] < time.monotonic():
+                del self._entries[path]
+                record = None
+            if record is None or field not in record[1]:
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return record[1][field]
+
+    def set(self, path: str, field: str, value: Any):
+        with self._lock:
+            record = self._entries.get(path)
+            if record is None or record[0] < time.monotonic():
+                record = (time.monotonic() + self.ttl, dict())
+                self._entries[path] = record
+            record[1][field] = value
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, path: str):
+        with self._lock:
+            if self._entries.pop(path, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_prefix(self, prefix: str):
+        with self._lock:
+            for path in [p for p in self._entries if p.startswith(prefix)]:
+                del self._entries[path]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(
+                entries=len(self._entries),
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / lookups if lookups else 0.0,
+                evictions=self.evictions,
+                invalidations=self.invalidations,
+            )
+
+
+_metadata_cache: Optional[MetadataCache] = None
+
+
+def enable_metadata_cache(max_entries: int = 100000, ttl: float = 60.0) -> MetadataCache:
+    """Turn on the metadata cache shared by all file system objects"""
+    global _metadata_cache
+    _metadata_cache = MetadataCache(max_entries=max_entries, ttl=ttl)
+    return _metadata_cache
+
+
+def disable_metadata_cache():
+    global _metadata_cache
+    _metadata_cache = None
+
+
+def get_metadata_cache() -> Optional[MetadataCache]:
+    return _metadata_cache
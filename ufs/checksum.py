@@ -0,0 +1,97 @@
+import base64
+import hashlib
+from typing import BinaryIO, Dict, Iterable, Sequence
+
+try:
+    import crc32c as _crc32c
+except ImportError:
+    _crc32c = None
+
+CHUNK_SIZE = 1024 * 1024
+ALGORITHMS = ("md5", "sha1", "sha256", "blake2b", "crc32c")
+
+
+def _crc32c_table() -> list:
+    table = list()
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82F63B78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC32C_TABLE = None
+
+
+class Crc32c:
+    """
+    hashlib-like CRC32C (Castagnoli), as used by S3 ChecksumCRC32C
+    Uses the crc32c package when installed, otherwise a (slow) pure python table.
+    """
+
+    name = "crc32c"
+    digest_size = 4
+
+    def __init__(self):
+        self._crc = 0
+
+    def update(self, data):
+        if _crc32c is not None:
+            self._crc = _crc32c.crc32c(data, self._crc)
+            return
+
+        global _CRC32C_TABLE
+        if _CRC32C_TABLE is None:
+            _CRC32C_TABLE = _crc32c_table()
+        table = _CRC32C_TABLE
+        crc = self._crc ^ 0xFFFFFFFF
+        for byte in memoryview(data).cast("B"):
+            crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+        self._crc = crc ^ 0xFFFFFFFF
+
+    def digest(self) -> bytes:
+        return self._crc.to_bytes(4, "big")
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+
+def new_hash(algorithm: str):
+    algorithm = algorithm.lower()
+    if algorithm not in ALGORITHMS:
+        raise RuntimeError(f"Un-supported checksum algorithm: {algorithm}")
+    if algorithm == "crc32c":
+        return Crc32c()
+    return hashlib.new(algorithm)
+
+
+def digest_chunks(chunks: Iterable, algorithms: Sequence[str] = ("sha256",)) -> Dict[str, str]:
+    """Hash a stream of chunks with every requested algorithm in a single pass"""
+    hashes = {algorithm: new_hash(algorithm) for algorithm in algorithms}
+    for chunk in chunks:
+        for h in hashes.values():
+            h.update(chunk)
+    return {algorithm: h.hexdigest() for algorithm, h in hashes.items()}
+
+
+def iter_stream_chunks(stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterable[memoryview]:
+    """Read a binary stream in chunks into one reused buffer, each chunk is only valid until the next"""
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    while True:
+        length = stream.readinto(buffer)
+        if not length:
+            return
+        yield view[:length]
+
+
+def iter_view_chunks(view: memoryview, chunk_size: int = CHUNK_SIZE) -> Iterable[memoryview]:
+    """Zero-copy chunks of a buffer (e.g. PosixFile.read_view), each released once the next is requested"""
+    for start in range(0, len(view), chunk_size):
+        with view[start:start + chunk_size] as chunk:
+            yield chunk
+
+
+def b64_to_hex(value: str) -> str:
+    return base64.b64decode(value).hex()
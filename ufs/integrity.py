@@ -0,0 +1,202 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from ufs.base import Directory, File, FileEntry, FileSystem
+from ufs.transfer import ProgressTracker, TransferProgress, TransferResult
+
+
+class ChecksumEntry(NamedTuple):
+    relative_path: str
+    size: int
+    digest: Optional[str]
+
+
+class ChecksumManifest:
+    """
+    Digests of the files of a directory, keyed by path relative to it
+    Saved as JSON lines: a header with the algorithm and root, then one [path, size, digest] per file.
+    """
+
+    def __init__(self, algorithm: str, root: str = "", entries: Iterable[ChecksumEntry] = ()):
+        self.algorithm = algorithm
+        self.root = root
+        self.entries: Dict[str, ChecksumEntry] = {entry.relative_path: entry for entry in entries}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[ChecksumEntry]:
+        for relative_path in sorted(self.entries):
+            yield self.entries[relative_path]
+
+    def __contains__(self, relative_path: str) -> bool:
+        return relative_path in self.entries
+
+    def get(self, relative_path: str) -> Optional[ChecksumEntry]:
+        return self.entries.get(relative_path)
+
+    def dumps(self) -> str:
+        lines = [json.dumps(dict(algorithm=self.algorithm, root=self.root))]
+        lines.extend(json.dumps(list(entry)) for entry in self)
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def loads(cls, text: str) -> "ChecksumManifest":
+        lines = iter(text.splitlines())
+        header = json.loads(next(lines))
+        entries = (ChecksumEntry(*json.loads(line)) for line in lines if line)
+        return cls(header["algorithm"], header.get("root", ""), entries)
+
+    def save(self, dst: Union[str, File]):
+        """:param dst: Posix or S3 file (or path)"""
+        if not isinstance(dst, File):
+            dst = FileSystem.to_file(dst)
+        dst.write_text(self.dumps(), "WRITE")
+
+    @classmethod
+    def load(cls, src: Union[str, File]) -> "ChecksumManifest":
+        if not isinstance(src, File):
+            src = FileSystem.to_file(src)
+        return cls.loads(src.read_text())
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(algorithm={self.algorithm}, root={self.root}, files={len(self)})"
+
+
+class VerifyResult:
+    """
+    Outcome of comparing a directory to a reference (manifest or directory), per relative path
+    mismatched: path -> (expected, actual) ChecksumEntry, actual digest None when the sizes differ
+    missing: in the reference only, extra: in the directory only
+    failed: path -> exception raised while hashing
+    """
+
+    def __init__(self, algorithm: str):
+        self.algorithm = algorithm
+        self.matched = 0
+        self.mismatched: Dict[str, Tuple[ChecksumEntry, ChecksumEntry]] = dict()
+        self.missing: List[str] = list()
+        self.extra: List[str] = list()
+        self.failed: Dict[str, BaseException] = dict()
+
+    @property
+    def ok(self) -> bool:
+        return not (self.mismatched or self.missing or self.extra or self.failed)
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(algorithm={self.algorithm}, matched={self.matched}, "
+            f"mismatched={len(self.mismatched)}, missing={len(self.missing)}, "
+            f"extra={len(self.extra)}, failed={len(self.failed)})"
+        )
+
+
+def _relative_entries(directory: Directory, **kwargs) -> Dict[str, FileEntry]:
+    root = str(directory)
+    return {
+        entry.path[len(root):].lstrip("/"): entry
+        for entry in directory.iter_entries(True, **kwargs)
+    }
+
+
+def checksum_directory(
+        directory: Directory,
+        algorithm: str = "sha256",
+        workers: Optional[int] = None,
+        progress: Optional[Callable[[TransferProgress], None]] = None,
+        **kwargs,
+) -> ChecksumManifest:
+    """See Directory.checksums"""
+    entries = _relative_entries(directory, **kwargs)
+    result = directory._checksum_files(entries.values(), algorithm, workers, ProgressTracker(progress))
+    result.raise_for_errors()
+    return ChecksumManifest(
+        algorithm,
+        str(directory),
+        (
+            ChecksumEntry(relative_path, entry.size, result.succeeded[entry.path])
+            for relative_path, entry in entries.items()
+        ),
+    )
+
+
+def verify(
+        directory: Directory,
+        reference: Union[ChecksumManifest, Directory],
+        algorithm: Optional[str] = None,
+        workers: Optional[int] = None,
+        progress: Optional[Callable[[TransferProgress], None]] = None,
+) -> VerifyResult:
+    """See Directory.verify"""
+    if isinstance(reference, ChecksumManifest):
+        algorithm = reference.algorithm
+    algorithm = algorithm or "sha256"
+
+    entries = _relative_entries(directory)
+    if isinstance(reference, ChecksumManifest):
+        expected = reference.entries
+    else:
+        reference_entries = _relative_entries(reference)
+        expected = {
+            relative_path: ChecksumEntry(relative_path, entry.size, None)
+            for relative_path, entry in reference_entries.items()
+        }
+
+    result = VerifyResult(algorithm)
+    result.extra = sorted(set(entries) - set(expected))
+    # only files present on both sides with the same size are worth hashing
+    candidates = list()
+    for relative_path in sorted(expected):
+        entry = entries.get(relative_path)
+        if entry is None:
+            result.missing.append(relative_path)
+        elif entry.size != expected[relative_path].size:
+            result.mismatched[relative_path] = (
+                expected[relative_path], ChecksumEntry(relative_path, entry.size, None)
+            )
+        else:
+            candidates.append(relative_path)
+
+    # one tracker for both sides, so that progress counts every hashed file once in one sequence
+    tracker = ProgressTracker(progress)
+
+    def hash_side(side: Directory, side_entries: Dict[str, FileEntry]) -> TransferResult:
+        return side._checksum_files(
+            (side_entries[relative_path] for relative_path in candidates), algorithm, workers, tracker
+        )
+
+    if isinstance(reference, ChecksumManifest):
+        actual = hash_side(directory, entries)
+        expected_digests = {p: expected[p].digest for p in candidates}
+    else:
+        # both sides hashed at the same time, e.g. Posix on processes while S3 streams on threads
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            reference_future = executor.submit(hash_side, reference, reference_entries)
+            actual = hash_side(directory, entries)
+            reference_result = reference_future.result()
+        expected_digests = dict()
+        for relative_path in candidates:
+            path = reference_entries[relative_path].path
+            if path in reference_result.failed:
+                result.failed[relative_path] = reference_result.failed[path]
+            else:
+                expected_digests[relative_path] = reference_result.succeeded[path]
+
+    for relative_path in candidates:
+        path = entries[relative_path].path
+        if path in actual.failed:
+            result.failed[relative_path] = actual.failed[path]
+            continue
+        if relative_path not in expected_digests:
+            continue
+        digest = actual.succeeded[path]
+        if digest == expected_digests[relative_path]:
+            result.matched += 1
+        else:
+            size = entries[relative_path].size
+            result.mismatched[relative_path] = (
+                ChecksumEntry(relative_path, size, expected_digests[relative_path]),
+                ChecksumEntry(relative_path, size, digest),
+            )
+    return result
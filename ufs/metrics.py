@@ -0,0 +1,277 @@
+import bisect
+import math
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf
+)
+
+
+class OperationEvent(NamedTuple):
+    """
+    One backend call, as passed to hooks
+    backend: "s3" or "posix"
+    operation: client method (head_object, list_objects_v2, ...) or Posix operation (scandir, copy_file)
+    target: s3://bucket/key or local path
+    """
+
+    backend: str
+    operation: str
+    target: str
+    duration: float
+    bytes: int = 0
+    error: Optional[BaseException] = None
+
+
+class Histogram:
+    """Fixed bucket histogram with count, sum, min and max"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[min(bisect.bisect_left(self.buckets, value), len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th (0-100) percentile, capped by max"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> dict:
+        return dict(
+            count=self.count,
+            sum=self.total,
+            min=self.min if self.count else 0.0,
+            max=self.max,
+            mean=self.total / self.count if self.count else 0.0,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+        )
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process counters and histograms, labelled by backend and operation
+    Counters: requests, errors, bytes, retries. Histogram: latency (seconds).
+    """
+
+    def __init__(self):
+        self._counters: Dict[Tuple, float] = dict()
+        self._histograms: Dict[Tuple, Histogram] = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> Tuple:
+        return (name,) + tuple(sorted(labels.items()))
+
+    def incr(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(self._key(name, labels))
+
+    def record(self, event: OperationEvent):
+        labels = dict(backend=event.backend, operation=event.operation)
+        key = self._key("latency", labels)
+        with self._lock:
+            errors = int(event.error is not None)
+            for name, value in (("requests", 1), ("bytes", event.bytes), ("errors", errors)):
+                counter_key = self._key(name, labels)
+                self._counters[counter_key] = self._counters.get(counter_key, 0) + value
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(event.duration)
+
+    def snapshot(self) -> dict:
+        """{"counters": {name: [(labels, value)]}, "histograms": {name: [(labels, summary)]}}"""
+        counters = dict()
+        histograms = dict()
+        with self._lock:
+            for (name, *labels), value in self._counters.items():
+                counters.setdefault(name, list()).append((dict(labels), value))
+            for (name, *labels), histogram in self._histograms.items():
+                histograms.setdefault(name, list()).append((dict(labels), histogram.as_dict()))
+        return dict(counters=counters, histograms=histograms)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+_registry: Optional[MetricsRegistry] = None
+_hooks: List[Callable[[OperationEvent], None]] = list()
+
+
+def enable_metrics() -> MetricsRegistry:
+    """Turn on the metrics registry recording every instrumented backend call"""
+    global _registry
+    _registry = MetricsRegistry()
+    return _registry
+
+
+def disable_metrics():
+    global _registry
+    _registry = None
+
+
+def get_metrics() -> Optional[MetricsRegistry]:
+    return _registry
+
+
+def add_hook(hook: Callable[[OperationEvent], None]):
+    """Call hook with an OperationEvent after every instrumented backend call (from worker threads)"""
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Callable[[OperationEvent], None]):
+    _hooks.remove(hook)
+
+
+def instrumentation_enabled() -> bool:
+    return _registry is not None or bool(_hooks)
+
+
+def emit(event: OperationEvent):
+    registry = _registry
+    if registry is not None:
+        registry.record(event)
+    for hook in list(_hooks):
+        hook(event)
+
+
+def count(name: str, value: float = 1, **labels):
+    """Increment a counter of the registry, a no-op when metrics are disabled"""
+    registry = _registry
+    if registry is not None:
+        registry.incr(name, value, **labels)
+
+
+class _Operation:
+    __slots__ = ("bytes",)
+
+    def __init__(self):
+        self.bytes = 0
+
+
+@contextmanager
+def instrument(backend: str, operation: str, target: str = "") -> Iterator[_Operation]:
+    """
+    Time the wrapped backend call and emit an OperationEvent, set .bytes on the yielded
+    object to report the amount of data moved
+    """
+    op = _Operation()
+    if not instrumentation_enabled():
+        yield op
+        return
+
+    start = time.perf_counter()
+    try:
+        yield op
+    except BaseException as e:
+        emit(OperationEvent(backend, operation, target, time.perf_counter() - start, op.bytes, e))
+        raise
+    emit(OperationEvent(backend, operation, target, time.perf_counter() - start, op.bytes))
+
+
+def _s3_target(kwargs: dict) -> str:
+    bucket_name = kwargs.get("Bucket", "")
+    return f"s3://{bucket_name}/{kwargs.get('Key', kwargs.get('Prefix', ''))}"
+
+
+def _s3_bytes(operation: str, kwargs: dict, response) -> int:
+    if operation in ("put_object", "upload_part"):
+        body = kwargs.get("Body")
+        return len(body) if isinstance(body, (bytes, bytearray, memoryview)) else 0
+    if operation == "get_object" and isinstance(response, dict):
+        return response.get("ContentLength", 0)
+    return 0
+
+
+class InstrumentedS3Client:
+    """Proxy of a boto3 S3 client, every public method call is timed and emitted as an OperationEvent"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.client, name)
+        if name.startswith("_") or name in ("meta", "exceptions") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with instrument("s3", name, _s3_target(kwargs)) as op:
+                response = attr(*args, **kwargs)
+                op.bytes = _s3_bytes(name, kwargs, response)
+            return response
+
+        return call
+
+
+# wrappers of clients without an instance __dict__ (slotted), each holding a weak proxy
+# of its client so that the entry does not keep the client alive
+_slotted_wrappers = weakref.WeakKeyDictionary()
+
+
+def instrumented_client(client):
+    """The client, wrapped in one shared InstrumentedS3Client while instrumentation is enabled"""
+    if client is None or not instrumentation_enabled():
+        return client
+    # the type check also skips the child attributes Mock clients make up for any name
+    wrapper = getattr(client, "_ufs_instrumented", None)
+    if isinstance(wrapper, InstrumentedS3Client):
+        return wrapper
+    try:
+        wrapper = _slotted_wrappers.get(client)
+    except TypeError:
+        # neither weak referenceable nor hashable, wrapped per call
+        return InstrumentedS3Client(client)
+    if wrapper is not None:
+        return wrapper
+
+    wrapper = InstrumentedS3Client(client)
+    try:
+        # kept on the client itself, so that the wrapper lives exactly as long as the client
+        client._ufs_instrumented = wrapper
+    except (AttributeError, TypeError):
+        wrapper = InstrumentedS3Client(weakref.proxy(client))
+        _slotted_wrappers[client] = wrapper
+    return wrapper
@@ -0,0 +1,172 @@
+import re
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional, Tuple, Union
+
+from ufs.base import FileEntry
+
+_MAGIC = re.compile(r"[*?[]")
+
+
+def has_magic(pattern: str) -> bool:
+    return _MAGIC.search(pattern) is not None
+
+
+def literal_prefix(segment: str) -> str:
+    """Part of the segment before its first wildcard"""
+    match = _MAGIC.search(segment)
+    return segment if match is None else segment[:match.start()]
+
+
+def _translate_bracket(pattern: str, i: int) -> Tuple[Optional[str], int]:
+    # same rules as fnmatch: "]" right after "[" or "[!" is a literal
+    j = i + 1
+    if j < len(pattern) and pattern[j] == "!":
+        j += 1
+    if j < len(pattern) and pattern[j] == "]":
+        j += 1
+    while j < len(pattern) and pattern[j] != "]":
+        j += 1
+    if j >= len(pattern):
+        return None, i + 1
+    body = pattern[i + 1:j].replace("\\", "\\\\")
+    if body[0] == "!":
+        body = "^" + body[1:]
+    elif body[0] in "^[":
+        body = "\\" + body
+    return f"[{body}]", j + 1
+
+
+def translate(pattern: str) -> str:
+    """
+    Regular expression of a glob pattern over "/" separated paths
+    '*', '?' and '[...]' never match "/", a '**' segment matches any number of segments
+    """
+    parts = list()
+    i = 0
+    while i < len(pattern):
+        at_segment_start = i == 0 or pattern[i - 1] == "/"
+        if at_segment_start and pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif at_segment_start and pattern.startswith("**", i) and i + 2 == len(pattern):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[":
+            bracket, i = _translate_bracket(pattern, i)
+            parts.append(bracket or "\\[")
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "(?s:" + "".join(parts) + r")\Z"
+
+
+class GlobPattern:
+    """
+    Glob pattern relative to a directory, e.g. "year=2024/*/part-*.parquet" or "**/*.json"
+    Matched segment by segment, so that listings only descend where a match is possible.
+    """
+
+    __slots__ = ("pattern", "segments", "_regex", "_segment_regexes")
+
+    def __init__(self, pattern: str):
+        pattern = pattern.strip().strip("/")
+        if not pattern:
+            raise RuntimeError("Empty glob pattern")
+        self.pattern = pattern
+        self.segments = pattern.split("/")
+        self._regex = re.compile(translate(pattern))
+        self._segment_regexes = [
+            None if segment == "**" else re.compile(translate(segment)) for segment in self.segments
+        ]
+
+    def match(self, relative_path: str) -> bool:
+        return self._regex.match(relative_path) is not None
+
+    def match_segment(self, index: int, name: str) -> bool:
+        regex = self._segment_regexes[index]
+        return regex is None or regex.match(name) is not None
+
+
+def iter_glob(
+        pattern: GlobPattern,
+        list_level: Callable[[str, str], Iterable[Tuple[str, bool, object]]],
+        list_tree: Callable[[str, int], Iterable[Tuple[str, object]]],
+        max_depth: int = -1,
+) -> Iterator[object]:
+    """
+    Walk pattern segment by segment, listing only the directories that can hold a match
+    Literal directory segments are descended into without listing their parent, a '**' segment
+    switches to a listing of the whole sub-tree, filtered on the full relative path.
+    :param list_level: (relative_dir, name_prefix) -> (name, is_dir, item) for every entry one level
+        below relative_dir whose name starts with name_prefix
+    :param list_tree: (relative_dir, max_depth) -> (relative_path, item) for every file below relative_dir
+    :param max_depth: deepest sub-directory level holding matches, -1 for no limit
+    :return: the items of the matching files, in listing order of each level
+    """
+    segments = pattern.segments
+    pending = [("", 0)]
+    while pending:
+        # every segment before a '**' is one directory level, so index is also the depth
+        relative_dir, index = pending.pop()
+        segment = segments[index]
+        if segment == "**":
+            remaining = -1 if max_depth < 0 else max_depth - index
+            for relative_path, item in list_tree(relative_dir, remaining):
+                if pattern.match(relative_path):
+                    yield item
+            continue
+
+        last = index == len(segments) - 1
+        if not last:
+            if 0 <= max_depth <= index:
+                continue
+            if not has_magic(segment):
+                pending.append((relative_dir + segment + "/", index + 1))
+                continue
+
+        sub_dirs = list()
+        for name, is_dir, item in list_level(relative_dir, literal_prefix(segment)):
+            if is_dir == last or not pattern.match_segment(index, name):
+                continue
+            if last:
+                yield item
+            else:
+                sub_dirs.append((relative_dir + name + "/", index + 1))
+        # popped in listing order
+        pending.extend(reversed(sub_dirs))
+
+
+def entry_filter(
+        predicate: Optional[Callable[[FileEntry], bool]] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        modified_after: Union[float, datetime, None] = None,
+        modified_before: Union[float, datetime, None] = None,
+) -> Optional[Callable[[FileEntry], bool]]:
+    """Single test of a FileEntry for the given conditions, None when there are none"""
+    if isinstance(modified_after, datetime):
+        modified_after = modified_after.timestamp()
+    if isinstance(modified_before, datetime):
+        modified_before = modified_before.timestamp()
+    if predicate is None and min_size is None and max_size is None and modified_after is None \
+            and modified_before is None:
+        return None
+
+    def accept(entry: FileEntry) -> bool:
+        if min_size is not None and entry.size < min_size:
+            return False
+        if max_size is not None and entry.size > max_size:
+            return False
+        if modified_after is not None and entry.mtime <= modified_after:
+            return False
+        if modified_before is not None and entry.mtime >= modified_before:
+            return False
+        return predicate is None or predicate(entry)
+
+    return accept
@@ -1,10 +1,20 @@
 import os
+import shutil
+import stat
+import tempfile
 from abc import ABC
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import islice
+from typing import IO, Iterator, List, NamedTuple, Optional, Tuple
 
 from ufs.base import FileSystemObject
+from ufs.metrics import instrument
 
 
 class PosixObject(FileSystemObject, ABC):
+    __slots__ = ()
+
     def as_file(self) -> "File":
         from ufs.posix.posix_file import PosixFile
 
@@ -36,45 +46,291 @@ def convert_mode(mode: str, format: str) -> str:
     raise RuntimeError(f"Invalid format: {format}")
 
 
-def file_counter(path: str) -> int:
-    total = 0
-    with os.scandir(path) as it:
-        for entry in it:
-            if entry.is_file():
-                total += 1
-            elif entry.is_dir():
-                total += file_counter(entry.path)
-    return total
+def _create_temp(directory: str, name: str) -> str:
+    """
+    Create an empty hidden .<name>.*.tmp file in directory, mode 0o666 less the umask like open()
+    (tempfile.mkstemp creates 0o600 files, and os.umask can only be queried by changing it)
+    """
+    for _ in range(tempfile.TMP_MAX):
+        temp_path = os.path.join(directory, f".{name}.{os.urandom(6).hex()}.tmp")
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return temp_path
+    raise FileExistsError(f"No usable temporary file name in {directory}")
 
 
-def get_files_list(path: str, recursive: bool = True, limit: int = -1) -> list:
-    files = list()
-    counter = 0
+def _fsync_directory(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
-    with os.scandir(path) as it:
-        for entry in it:
-            if entry.is_file():
-                files.append(str(entry.path))
-                counter += 1
-            elif entry.is_dir() and recursive:
-                files.extend(
-                    get_files_list(str(entry.path), recursive, limit=(limit - counter))
-                )
-            if 0 < limit <= counter:
-                break
 
-    if 0 < limit < len(files):
-        files = files[:limit]
+@contextmanager
+def atomic_writer(
+        path: str, mode: str = "wb", encoding: Optional[str] = None, fsync: bool = True
+) -> Iterator[IO]:
+    """
+    Write path through a temporary file in the same directory, renamed over path once the block
+    exits without error: readers see the previous or the new content, never a partial file,
+    and a crashed writer only leaves a hidden .<name>.*.tmp file behind
+    :param mode: "w", "wb", "a" or "ab"; appending starts from a copy of the current content
+    :param fsync: flush the file and then the directory entry to disk, so that the new content
+        survives a power loss once the block has exited
+    """
+    if mode.rstrip("b") not in ("w", "a"):
+        raise RuntimeError(f"Un-supported mode for atomic writes: {mode}")
+    directory, name = os.path.split(os.path.abspath(path))
+    temp_path = _create_temp(directory, name)
+    try:
+        try:
+            # same permissions as the file being replaced, new files keep the ones open() would give
+            os.chmod(temp_path, stat.S_IMODE(os.stat(path).st_mode))
+            if mode.startswith("a"):
+                shutil.copyfile(path, temp_path)
+        except FileNotFoundError:
+            pass
+
+        with open(temp_path, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    if fsync:
+        _fsync_directory(directory)
 
-    return files
 
+# follow: walk symlinked files and directories, skipping links back to an ancestor (cycles)
+# files: list symlinked files, do not descend into symlinked directories
+# skip: ignore symlinks
+# links: never follow, symlinks (and any other non-directory) are reported as files, e.g. for removal
+SYMLINK_POLICIES = ("follow", "files", "skip", "links")
 
-def get_dir_size(path: str):
-    total = 0
+
+class TreeScan(NamedTuple):
+    file_count: int
+    size: int
+    files: Optional[list] = None
+
+
+def _scan_directory(
+        path: str, symlinks: str, stat: bool
+) -> Tuple[List[os.DirEntry], List[Tuple[os.DirEntry, Optional[tuple]]]]:
+    """
+    One directory level, split into files and (directory, identity) pairs
+    The identity (st_dev, st_ino) is only resolved when following symlinks, for cycle detection.
+    With stat, the files' stat results are fetched here (os.DirEntry caches them), so that
+    on network file systems the metadata latency is paid in the walker's worker threads.
+    """
+    with instrument("posix", "scandir", path):
+        return _scan(path, symlinks, stat)
+
+
+def _scan(
+        path: str, symlinks: str, stat: bool
+) -> Tuple[List[os.DirEntry], List[Tuple[os.DirEntry, Optional[tuple]]]]:
+    files = list()
+    dirs = list()
     with os.scandir(path) as it:
         for entry in it:
+            if symlinks == "links":
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append((entry, None))
+                else:
+                    files.append(entry)
+                continue
+            if symlinks != "follow" and entry.is_symlink():
+                if symlinks == "files" and entry.is_file():
+                    files.append(entry)
+                continue
             if entry.is_file():
-                total += entry.stat().st_size
+                files.append(entry)
             elif entry.is_dir():
-                total += get_dir_size(entry.path)
-    return total
+                identity = None
+                if symlinks == "follow":
+                    entry_stat = entry.stat()
+                    identity = (entry_stat.st_dev, entry_stat.st_ino)
+                dirs.append((entry, identity))
+
+    if stat:
+        for entry in files:
+            try:
+                entry.stat(follow_symlinks=symlinks != "links")
+            except OSError:
+                # raised again to the consumer calling stat()
+                pass
+    return files, dirs
+
+
+def _root_identity(path: str, symlinks: str) -> Optional[tuple]:
+    if symlinks != "follow":
+        return None
+    root_stat = os.stat(path)
+    return root_stat.st_dev, root_stat.st_ino
+
+
+def _is_cycle(ancestors: Optional[tuple], entry: os.DirEntry, identity: Optional[tuple]) -> bool:
+    """
+    Whether the directory entry is a symlink to one of its ancestors
+    ancestors is a (identity, parent ancestors) chain, None when not following symlinks
+    """
+    if identity is None or not entry.is_symlink():
+        return False
+    while ancestors is not None:
+        if ancestors[0] == identity:
+            return True
+        ancestors = ancestors[1]
+    return False
+
+
+def _iter_sorted(
+        path: str, max_depth: int, symlinks: str, stat: bool, include_dirs: bool
+) -> Iterator[os.DirEntry]:
+    root_identity = _root_identity(path, symlinks)
+    ancestors = (root_identity, None) if root_identity is not None else None
+
+    def level(dir_path: str) -> Iterator[Tuple[os.DirEntry, bool, Optional[tuple]]]:
+        files, dirs = _scan_directory(dir_path, symlinks, stat)
+        entries = [(entry, False, None) for entry in files]
+        entries.extend((entry, True, identity) for entry, identity in dirs)
+        # a directory sorts as "name/", so that walking depth first matches sorted() on full paths
+        return iter(sorted(entries, key=lambda e: e[0].name + "/" if e[1] else e[0].name))
+
+    stack = [(level(path), ancestors)]
+    while stack:
+        entries, ancestors = stack[-1]
+        item = next(entries, None)
+        if item is None:
+            stack.pop()
+            continue
+        entry, is_dir, identity = item
+        if not is_dir:
+            yield entry
+        elif (max_depth < 0 or len(stack) <= max_depth) and not _is_cycle(ancestors, entry, identity):
+            if include_dirs:
+                yield entry
+            child_ancestors = (identity, ancestors) if identity is not None else None
+            stack.append((level(entry.path), child_ancestors))
+
+
+def iter_file_entries(
+        path: str,
+        recursive: bool = True,
+        sort: bool = False,
+        max_depth: int = -1,
+        symlinks: str = "follow",
+        fan_out: int = 1,
+        stat: bool = False,
+        include_dirs: bool = False,
+) -> Iterator[os.DirEntry]:
+    """
+    Iteratively walk path, yielding os.DirEntry for every file as soon as its directory is scanned
+    :param path: directory to walk
+    :param recursive: descend into sub-directories
+    :param sort: yield in sorted order of the full paths, holding one directory listing per depth in memory
+    :param max_depth: deepest sub-directory level to descend into, -1 for no limit (0 is recursive=False)
+    :param symlinks: one of SYMLINK_POLICIES
+    :param fan_out: number of threads scanning directories concurrently, ignored with sort
+    :param stat: also fetch the files' stat results while scanning (see _scan_directory)
+    :param include_dirs: also yield the sub-directories walked into, each before its content
+    """
+    if symlinks not in SYMLINK_POLICIES:
+        raise RuntimeError(f"Un-supported symlink policy: {symlinks}")
+    if not recursive:
+        max_depth = 0
+
+    if sort:
+        yield from _iter_sorted(path, max_depth, symlinks, stat, include_dirs)
+        return
+
+    root_identity = _root_identity(path, symlinks)
+    pending = [(path, 0, (root_identity, None) if root_identity is not None else None)]
+
+    def descend(dirs: list, depth: int, ancestors: Optional[tuple]) -> list:
+        if 0 <= max_depth <= depth:
+            return list()
+        accepted = list()
+        for entry, identity in dirs:
+            if _is_cycle(ancestors, entry, identity):
+                continue
+            child_ancestors = (identity, ancestors) if identity is not None else None
+            pending.append((entry.path, depth + 1, child_ancestors))
+            accepted.append(entry)
+        return accepted if include_dirs else list()
+
+    if fan_out <= 1:
+        while pending:
+            dir_path, depth, ancestors = pending.pop()
+            files, dirs = _scan_directory(dir_path, symlinks, stat)
+            yield from descend(dirs, depth, ancestors)
+            yield from files
+        return
+
+    with ThreadPoolExecutor(max_workers=fan_out) as executor:
+        in_flight = dict()
+        try:
+            while pending or in_flight:
+                # bounded number of scans queued ahead, pending holds only directory paths
+                while pending and len(in_flight) < fan_out * 2:
+                    dir_path, depth, ancestors = pending.pop()
+                    future = executor.submit(_scan_directory, dir_path, symlinks, stat)
+                    in_flight[future] = (depth, ancestors)
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    depth, ancestors = in_flight.pop(future)
+                    files, dirs = future.result()
+                    yield from descend(dirs, depth, ancestors)
+                    yield from files
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+
+def scan_tree(
+        path: str,
+        recursive: bool = True,
+        max_depth: int = -1,
+        symlinks: str = "follow",
+        fan_out: int = 1,
+        list_files: bool = False,
+) -> TreeScan:
+    """File count, total size and (with list_files) the file paths from a single walk"""
+    file_count = size = 0
+    files = list() if list_files else None
+    for entry in iter_file_entries(
+            path, recursive, max_depth=max_depth, symlinks=symlinks, fan_out=fan_out, stat=True
+    ):
+        file_count += 1
+        size += entry.stat().st_size
+        if files is not None:
+            files.append(entry.path)
+    return TreeScan(file_count, size, files)
+
+
+def file_counter(path: str, fan_out: int = 1, **kwargs) -> int:
+    return sum(1 for _ in iter_file_entries(path, fan_out=fan_out, **kwargs))
+
+
+def get_files_list(
+        path: str, recursive: bool = True, limit: int = -1, fan_out: int = 1, **kwargs
+) -> list:
+    entries = iter_file_entries(path, recursive=recursive, fan_out=fan_out, **kwargs)
+    if limit > 0:
+        entries = islice(entries, limit)
+    return [str(entry.path) for entry in entries]
+
+
+def get_dir_size(path: str, fan_out: int = 1, **kwargs) -> int:
+    return scan_tree(path, fan_out=fan_out, **kwargs).size
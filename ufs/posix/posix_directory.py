@@ -1,22 +1,39 @@
+import multiprocessing
 import os.path
-import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
 from pathlib import PosixPath
-from typing import Union
-from uuid import uuid4
+from typing import Callable, Iterable, Iterator, Optional, Union
 
-from ufs.base import Directory, File
+from ufs.archive import write_archive
+from ufs.base import Directory, File, FileEntry
 from ufs.posix.posix_common import (
+    PosixObject,
+    TreeScan,
+    _scan_directory,
     file_counter,
     get_dir_size,
-    get_files_list,
-    PosixObject,
+    iter_file_entries,
+    scan_tree,
 )
+from ufs.posix.posix_tree import copy_tree, remove_tree
+from ufs.transfer import ProgressTracker, TransferEngine, TransferProgress, TransferResult
+
+
+def _process_context():
+    """forkserver where available (not on Windows), spawn otherwise: never fork a threaded process"""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
 
 
 class PosixDirectory(PosixObject, Directory):
+    __slots__ = ()
+
     def __init__(self, path: Union[str, PosixPath], *args, **kwargs):
         if not str(path).strip().endswith("/"):
-            path = path.strip() + "/"
+            path = str(path).strip() + "/"
         super().__init__(path, *args, **kwargs)
 
     def _validate_path(self, path: str) -> bool:
@@ -28,8 +45,36 @@ class PosixDirectory(PosixObject, Directory):
     def create(self, parents: bool = True, exist_ok: bool = False, *args, **kwargs):
         PosixPath(self).mkdir(parents=parents, exist_ok=exist_ok)
 
-    def duplicate(self, dst: "Directory", dir_exist_ok: bool = False):
-        shutil.copytree(self, dst, dirs_exist_ok=dir_exist_ok)
+    def duplicate(
+            self,
+            dst: "Directory",
+            dir_exist_ok: bool = False,
+            preserve_metadata: bool = True,
+            fan_out: int = 1,
+            engine: Optional[TransferEngine] = None,
+            progress: Optional[Callable[[TransferProgress], None]] = None,
+    ) -> TransferResult:
+        """
+        Copy the tree into dst, files are copied concurrently (see copy_tree)
+        :param preserve_metadata: copy permission bits and timestamps, like shutil.copytree
+        :param progress: called with TransferProgress (files, bytes, elapsed) after every file
+        """
+        from ufs.s3.s3_directory import S3Directory
+
+        if isinstance(dst, S3Directory):
+            return dst._upload(self, engine=engine, progress=progress, fan_out=fan_out)
+
+        result = copy_tree(
+            str(self),
+            str(dst),
+            dir_exist_ok=dir_exist_ok,
+            preserve_metadata=preserve_metadata,
+            fan_out=fan_out,
+            engine=engine,
+            progress=progress,
+        )
+        result.raise_for_errors()
+        return result
 
     def join_as_file(self, *other) -> "File":
         from ufs.posix.posix_file import PosixFile
@@ -39,55 +84,244 @@ class PosixDirectory(PosixObject, Directory):
     def join_as_directory(self, *other) -> "Directory":
         return PosixDirectory(PosixPath(self).joinpath(*other))
 
-    def remove(self, missing_ok: bool = True, dry_run: bool = False, *args, **kwargs):
-        if not dry_run:
-            return PosixPath(self).unlink(missing_ok)
+    def remove(
+            self,
+            missing_ok: bool = True,
+            dry_run: bool = False,
+            fan_out: int = 1,
+            engine: Optional[TransferEngine] = None,
+            progress: Optional[Callable[[TransferProgress], None]] = None,
+            *args,
+            **kwargs,
+    ) -> TransferResult:
+        """Recursively remove the directory, files are unlinked concurrently (see remove_tree)"""
+        result = remove_tree(
+            str(self),
+            missing_ok=missing_ok,
+            dry_run=dry_run,
+            fan_out=fan_out,
+            engine=engine,
+            progress=progress,
+        )
+        result.raise_for_errors()
+        return result
+
+    def iter_files(
+            self,
+            recursive: bool = True,
+            limit: int = -1,
+            sort: bool = False,
+            max_depth: int = -1,
+            symlinks: str = "follow",
+            fan_out: int = 1,
+            *args,
+            **kwargs,
+    ) -> Iterator[str]:
+        """
+        See iter_file_entries for max_depth, symlinks (follow, files or skip)
+        and fan_out (threads scanning directories concurrently)
+        """
+        entries = iter_file_entries(
+            str(self), recursive, sort, max_depth=max_depth, symlinks=symlinks, fan_out=fan_out
+        )
+        if limit > 0:
+            entries = islice(entries, limit)
+        for entry in entries:
+            yield entry.path
+
+    def iter_entries(
+            self,
+            recursive: bool = True,
+            limit: int = -1,
+            sort: bool = False,
+            max_depth: int = -1,
+            symlinks: str = "follow",
+            fan_out: int = 1,
+            *args,
+            **kwargs,
+    ) -> Iterator[FileEntry]:
+        entries = iter_file_entries(
+            str(self),
+            recursive,
+            sort,
+            max_depth=max_depth,
+            symlinks=symlinks,
+            fan_out=fan_out,
+            stat=True,
+        )
+        if limit > 0:
+            entries = islice(entries, limit)
+        for entry in entries:
+            stat = entry.stat()
+            yield FileEntry(entry.path, stat.st_size, stat.st_mtime)
+
+    def iter_file_objects(
+            self,
+            recursive: bool = True,
+            limit: int = -1,
+            sort: bool = False,
+            max_depth: int = -1,
+            symlinks: str = "follow",
+            fan_out: int = 1,
+            *args,
+            **kwargs,
+    ) -> Iterator["File"]:
+        from ufs.posix.posix_file import PosixFile
+
+        for file_path in self.iter_files(
+                recursive, limit, sort, max_depth=max_depth, symlinks=symlinks, fan_out=fan_out
+        ):
+            yield PosixFile(file_path)
+
+    def _iter_glob(self, pattern: str, max_depth: int, symlinks: str) -> Iterator[os.DirEntry]:
+        """Entries of the files matching pattern, scanning only the directories that can hold a match"""
+        from ufs.pattern import GlobPattern, iter_glob
+
+        root = str(self)
+
+        def list_level(relative_dir: str, name_prefix: str):
+            try:
+                files, dirs = _scan_directory(root + relative_dir, symlinks, False)
+            except (FileNotFoundError, NotADirectoryError):
+                return
+            for entry in files:
+                if entry.name.startswith(name_prefix):
+                    yield entry.name, False, entry
+            for entry, _ in dirs:
+                if entry.name.startswith(name_prefix):
+                    yield entry.name, True, entry
+
+        def list_tree(relative_dir: str, depth: int):
+            if not os.path.isdir(root + relative_dir):
+                return
+            for entry in iter_file_entries(root + relative_dir, max_depth=depth, symlinks=symlinks):
+                yield entry.path[len(root):], entry
 
-        for file_path in self.list_files(recursive=True):
-            print(f"Deleting: {file_path}")
+        return iter_glob(GlobPattern(pattern), list_level, list_tree, max_depth)
+
+    def glob(
+            self, pattern: str, limit: int = -1, max_depth: int = -1, symlinks: str = "follow", **kwargs
+    ) -> Iterator[str]:
+        """
+        Lazily yield the paths of the files matching pattern (see DirectoryPrefix.glob)
+        Only the directories that can hold a match are scanned, and nothing is stat'ed.
+        """
+        entries = self._iter_glob(pattern, max_depth, symlinks)
+        if limit > 0:
+            entries = islice(entries, limit)
+        for entry in entries:
+            yield entry.path
+
+    def find(
+            self,
+            pattern: str = "**",
+            predicate: Optional[Callable[[FileEntry], bool]] = None,
+            min_size: Optional[int] = None,
+            max_size: Optional[int] = None,
+            modified_after: Union[float, datetime, None] = None,
+            modified_before: Union[float, datetime, None] = None,
+            max_depth: int = -1,
+            limit: int = -1,
+            symlinks: str = "follow",
+            **kwargs,
+    ) -> Iterator[FileEntry]:
+        """See DirectoryPrefix.find, only the files matching pattern are stat'ed"""
+        from ufs.pattern import entry_filter
+
+        accept = entry_filter(predicate, min_size, max_size, modified_after, modified_before)
+        for entry in self._iter_glob(pattern, max_depth, symlinks):
+            stat = entry.stat()
+            file_entry = FileEntry(entry.path, stat.st_size, stat.st_mtime)
+            if accept is None or accept(file_entry):
+                yield file_entry
+                limit -= 1
+                if limit == 0:
+                    return
+
+    def _checksum_files(
+            self,
+            entries: Iterable[FileEntry],
+            algorithm: str,
+            workers: Optional[int] = None,
+            tracker: Optional[ProgressTracker] = None,
+    ) -> TransferResult:
+        """
+        Hashing is CPU bound, so files are hashed by a process pool; the engine's threads only
+        wait on it, keeping the bounded in-flight listing, retries and per path results
+        """
+        from ufs.posix.posix_file import file_checksum
+
+        workers = workers or os.cpu_count() or 1
+        tracker = tracker or ProgressTracker()
+        engine = TransferEngine(max_workers=workers)
+        if workers == 1:
+            def digest(entry: FileEntry) -> str:
+                value = file_checksum(entry.path, algorithm)
+                tracker.update(entry.size)
+                return value
+
+            return engine.run(digest, entries, key=lambda entry: entry.path)
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_process_context()) as pool:
+            # start the worker processes once, before the engine's threads wait on them
+            pool.submit(os.getpid).result()
+
+            def digest(entry: FileEntry) -> str:
+                value = pool.submit(file_checksum, entry.path, algorithm).result()
+                tracker.update(entry.size)
+                return value
+
+            return engine.run(digest, entries, key=lambda entry: entry.path)
 
     def list_files(self, recursive: bool = True, limit: int = -1, *args, **kwargs):
-        # Note: limit do not allow correct sorting order
-        return sorted(get_files_list(str(self), recursive=recursive, limit=limit))
+        return list(self.iter_files(recursive, limit=limit, sort=True))
 
     def list_file_objects(
             self, recursive: bool = True, limit: int = -1, *args, **kwargs
     ) -> list:
-        from ufs.posix.posix_file import PosixFile
+        return list(self.iter_file_objects(recursive, limit=limit, sort=True))
 
-        files = self.list_files(recursive, limit=limit, *args, **kwargs)
-        return [PosixFile(f) for f in files]
-
-    def copy_to(self, dst: "Directory", dir_exist_ok: bool = False):
-        base_name = os.path.basename(self)
+    def copy_to(
+            self, dst: "Directory", dir_exist_ok: bool = False, *args, **kwargs
+    ) -> TransferResult:
+        base_name = os.path.basename(str(self).rstrip("/"))
         dst = dst.join_as_directory(base_name)
-        shutil.copytree(self, dst, dirs_exist_ok=dir_exist_ok)
-
-    def archive_to_posix(self, dst: File, archive_format: str):
-        extension = ''
-        if archive_format == 'zip':
-            assert dst.endswith(".zip")
-            extension = '.zip'
-        elif archive_format == 'gztar':
-            assert dst.endswith('.tar.gz')
-            extension = '.tar.gz'
-        else:
-            raise RuntimeError(f'Un-supported archive format: {archive_format}')
-
-        base_name = str(dst).replace(extension, "")
-        shutil.make_archive(base_name=base_name, format=archive_format, root_dir=self)
-
-    def archive_to_s3(self, dst: File, archive_format: str):
-        from ufs.posix.posix_file import PosixFile
-        temp_file = PosixFile(os.path.join(f'/tmp/{uuid4()}', os.path.basename(dst)))
-        self.archive_to_posix(temp_file, archive_format)
-        dst._upload(temp_file)
+        return self.duplicate(dst, dir_exist_ok, *args, **kwargs)
+
+    def archive_to_posix(
+            self,
+            dst: File,
+            archive_format: str,
+            compression_level: Optional[int] = None,
+            progress: Optional[Callable[[TransferProgress], None]] = None,
+    ):
+        write_archive(
+            self, dst, archive_format, compression_level=compression_level, progress=progress
+        )
+
+    def archive_to_s3(
+            self,
+            dst: File,
+            archive_format: str,
+            compression_level: Optional[int] = None,
+            progress: Optional[Callable[[TransferProgress], None]] = None,
+    ):
+        # streamed straight into a multipart upload, no local staging of the archive
+        write_archive(
+            self, dst, archive_format, compression_level=compression_level, progress=progress
+        )
+
+    def file_count(self, fan_out: int = 1, *args, **kwargs) -> int:
+        return file_counter(str(self), fan_out=fan_out, *args, **kwargs)
 
-    def file_count(self) -> int:
-        return file_counter(str(self))
+    def size(self, fan_out: int = 1, *args, **kwargs) -> int:
+        return get_dir_size(str(self), fan_out=fan_out, *args, **kwargs)
 
-    def size(self) -> int:
-        return get_dir_size(str(self))
+    def scan(
+            self, recursive: bool = True, fan_out: int = 1, list_files: bool = False, **kwargs
+    ) -> TreeScan:
+        """File count, size and optionally the file list from one walk, see scan_tree"""
+        return scan_tree(str(self), recursive, fan_out=fan_out, list_files=list_files, **kwargs)
 
     def exists(self) -> bool:
         return PosixPath(self).exists()
@@ -1,54 +1,127 @@
-import hashlib
+import mmap
 import os
 import shutil
-from io import BytesIO
+from contextlib import contextmanager
 from pathlib import PosixPath
+from typing import IO, ContextManager, Iterator, Optional, Sequence
 
 from ufs.base import File
-from ufs.posix.posix_common import convert_mode
+from ufs.checksum import digest_chunks, iter_stream_chunks
+from ufs.posix.posix_common import PosixObject, atomic_writer, convert_mode
 
 
-class PosixFile(File):
+class PosixFile(PosixObject, File):
+    __slots__ = ()
+
     def _validate_path(self, path: str) -> bool:
         return path.startswith("/") and not path.endswith("/")
 
     def is_file_path(self) -> bool:
         return True
 
-    def write_text(self, content: str, mode, *args, **kwargs):
+    def write_text(self, content: str, mode, atomic: bool = False, *args, **kwargs):
+        """:param atomic: write a temporary file and rename it over this one, see atomic_writer"""
         mode = convert_mode(mode, "text")
-        with open(self, mode) as f:
+        with self._writer(mode, atomic) as f:
             f.write(content)
 
-    def write_bytes(self, content: bytes, mode, encoding="utf-8", *args, **kwargs):
+    def write_bytes(self, content: bytes, mode, encoding="utf-8", atomic: bool = False, *args, **kwargs):
+        """:param atomic: write a temporary file and rename it over this one, see atomic_writer"""
         mode = convert_mode(mode, "bytes")
-        with open(self, mode) as f:
+        with self._writer(mode, atomic) as f:
             f.write(content)
 
+    def _writer(self, mode: str, atomic: bool) -> ContextManager[IO]:
+        return atomic_writer(self._path, mode) if atomic else open(self, mode)
+
+    def atomic_writer(self, mode: str = "wb", encoding: Optional[str] = None) -> ContextManager[IO]:
+        """
+        Context manager of a file handle whose content replaces this file (fsync'ed, renamed)
+        only when the block exits without error, see posix_common.atomic_writer
+        """
+        return atomic_writer(self._path, mode, encoding=encoding)
+
     def touch(self, exist_ok: bool = True, *args, **kwargs):
         PosixPath(self).touch(exist_ok=exist_ok)
 
     def remove(self, missing_ok: bool = True, *args, **kwargs):
         PosixPath(self).unlink(missing_ok)
 
-    def read_text(self) -> str:
-        return open(self).read()
+    def open(self, mode: str = "rb", encoding: Optional[str] = None, *args, **kwargs) -> IO:
+        return open(self, mode, encoding=encoding, *args, **kwargs)
+
+    def read_text(self, encoding: Optional[str] = None) -> str:
+        with open(self, encoding=encoding) as f:
+            return f.read()
 
     def read_bytes(self) -> bytes:
-        return open(self, "rb").read()
+        with open(self, "rb") as f:
+            return f.read()
+
+    @contextmanager
+    def read_view(self) -> Iterator[memoryview]:
+        """
+        Read-only memoryview over the memory-mapped file, without copying its content
+        The view (and any slice taken from it) is only valid inside the with block; release
+        or copy slices before leaving it, otherwise unmapping fails with BufferError.
+        """
+        with open(self, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # empty files cannot be mapped
+                yield memoryview(b"")
+                return
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
 
-    def checksum(self, *args, **kwargs) -> str:
-        digest = hashlib.file_digest(BytesIO(open(self, "rb").read()), "sha256")
-        return digest.hexdigest()
+    def readinto(self, buffer, offset: int = 0) -> int:
+        """
+        Read the file from offset into a caller provided writable buffer (bytearray, memoryview,
+        numpy array, ...) until the buffer is full or the end of file
+        :return: number of bytes read
+        """
+        view = memoryview(buffer).cast("B")
+        total = 0
+        with open(self, "rb", buffering=0) as f:
+            f.seek(offset)
+            while total < len(view):
+                n = f.readinto(view[total:])
+                if not n:
+                    break
+                total += n
+        return total
+
+    def checksum(self, algorithm: str = "sha256", *args, **kwargs) -> str:
+        return self.checksums((algorithm,))[algorithm]
+
+    def checksums(self, algorithms: Sequence[str] = ("sha256",), *args, **kwargs) -> dict:
+        # read into one reused buffer: a mapping would raise SIGBUS if the file is truncated meanwhile
+        with open(self, "rb", buffering=0) as f:
+            return digest_chunks(iter_stream_chunks(f), algorithms)
 
     def duplicate(self, dst: "File"):
+        from ufs.s3.s3_file import S3File
+
+        if isinstance(dst, S3File):
+            # multipart upload with parts read in parallel
+            return dst._upload(self)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
         shutil.copy(self, dst)
 
     def copy_to(self, dst: "Directory"):
-        shutil.copy(self, dst)
+        return self.duplicate(dst.join_as_file(self.basename()))
 
     def size(self) -> int:
         return os.stat(self).st_size
 
     def exists(self) -> bool:
         return PosixPath(self).exists()
+
+
+def file_checksum(path: str, algorithm: str = "sha256") -> str:
+    """Module level, so that it can be run by process pool workers"""
+    return PosixFile(path).checksum(algorithm)
@@ -0,0 +1,181 @@
+import errno
+import os
+import shutil
+import sys
+from typing import Callable, Optional
+
+from ufs.metrics import instrument
+from ufs.posix.posix_common import iter_file_entries
+from ufs.transfer import ProgressTracker, TransferEngine, TransferProgress, TransferResult
+
+# ioctl(dst, FICLONE, src): share the source's extents (btrfs, xfs, ...) instead of copying
+_FICLONE = 0x40049409
+_COPY_CHUNK_SIZE = 1024 * 1024 * 1024
+# errors meaning the kernel fast path is not available for this pair of files
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    try:
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+def _copy_kernel(copy: Callable[[int], int]) -> Optional[int]:
+    """Run copy(count) until end of file, None if the very first call is not supported"""
+    copied = 0
+    while True:
+        try:
+            n = copy(_COPY_CHUNK_SIZE)
+        except OSError as e:
+            if copied == 0 and e.errno in _FALLBACK_ERRNOS:
+                return None
+            raise
+        if n == 0:
+            return copied
+        copied += n
+
+
+def copy_file(src: str, dst: str, preserve_metadata: bool = False) -> int:
+    """
+    Copy the content of src to dst using the cheapest method available:
+    reflink, then copy_file_range (server side copies on NFS 4.2 / CIFS), then sendfile,
+    then a user space copy
+    :param preserve_metadata: also copy permission bits, timestamps and flags (shutil.copystat)
+    :return: number of bytes copied
+    """
+    with instrument("posix", "copy_file", src) as op:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+            size = os.fstat(src_fd).st_size
+            copied = None
+            if size and _reflink(src_fd, dst_fd):
+                copied = size
+            if copied is None and hasattr(os, "copy_file_range"):
+                copied = _copy_kernel(lambda count: os.copy_file_range(src_fd, dst_fd, count))
+            if copied is None and sys.platform.startswith("linux"):
+                copied = _copy_kernel(lambda count: os.sendfile(dst_fd, src_fd, None, count))
+            if copied is None:
+                shutil.copyfileobj(fsrc, fdst, length=1024 * 1024)
+                copied = size
+        op.bytes = copied
+
+    if preserve_metadata:
+        shutil.copystat(src, dst)
+    return copied
+
+
+def copy_tree(
+        src: str,
+        dst: str,
+        dir_exist_ok: bool = False,
+        preserve_metadata: bool = False,
+        symlinks: str = "follow",
+        fan_out: int = 1,
+        engine: Optional[TransferEngine] = None,
+        progress: Optional[Callable[[TransferProgress], None]] = None,
+) -> TransferResult:
+    """
+    Copy the directory tree src to dst, files are copied concurrently by the engine's workers
+    Directories are created as the walk reaches them, before any of their files is submitted.
+    :param symlinks: walk policy, see iter_file_entries (follow copies the content of links, like copytree)
+    :param fan_out: threads scanning the source directories
+    :param progress: called with TransferProgress (files, bytes, elapsed) after every copied file
+    :return: TransferResult keyed by source path, with the bytes copied per file
+    """
+    src = src.rstrip("/") + "/"
+    dst = dst.rstrip("/") + "/"
+    os.makedirs(dst, exist_ok=dir_exist_ok)
+
+    tracker = ProgressTracker(progress)
+    directories = [(src, dst)]
+
+    def sources():
+        for entry in iter_file_entries(src, symlinks=symlinks, fan_out=fan_out, include_dirs=True):
+            target = dst + entry.path[len(src):]
+            if entry.is_dir():
+                os.makedirs(target, exist_ok=True)
+                if preserve_metadata:
+                    directories.append((entry.path, target))
+                continue
+            yield entry.path, target
+
+    def copy(item) -> int:
+        copied = copy_file(item[0], item[1], preserve_metadata=preserve_metadata)
+        tracker.update(copied)
+        return copied
+
+    engine = engine or TransferEngine()
+    result = engine.run(copy, sources(), key=lambda item: item[0])
+
+    if preserve_metadata:
+        # after the files, as creating them updates the directories' mtime; deepest first
+        for src_dir, dst_dir in reversed(directories):
+            shutil.copystat(src_dir, dst_dir)
+    return result
+
+
+def remove_tree(
+        path: str,
+        missing_ok: bool = True,
+        dry_run: bool = False,
+        fan_out: int = 1,
+        engine: Optional[TransferEngine] = None,
+        progress: Optional[Callable[[TransferProgress], None]] = None,
+) -> TransferResult:
+    """
+    Recursively remove the directory path, unlinking files concurrently and then removing
+    the directories level by level, deepest first. Symlinks are removed, never followed.
+    :param progress: called with TransferProgress (files, bytes, elapsed) after every removed file
+    :return: TransferResult keyed by path, for files and directories
+    """
+    path = path.rstrip("/")
+    if os.path.islink(path):
+        raise RuntimeError(f"Cannot remove a symbolic link as a directory tree: {path}")
+    if not os.path.exists(path):
+        if missing_ok:
+            return TransferResult()
+        raise FileNotFoundError(path)
+
+    tracker = ProgressTracker(progress)
+    levels = [[path]]
+
+    def files():
+        for entry in iter_file_entries(
+                path, symlinks="links", fan_out=fan_out, stat=progress is not None, include_dirs=True
+        ):
+            if entry.is_dir(follow_symlinks=False):
+                depth = entry.path.count("/") - path.count("/")
+                while len(levels) <= depth:
+                    levels.append(list())
+                levels[depth].append(entry.path)
+                continue
+            if dry_run:
+                print(f"Deleting: {entry.path}")
+                continue
+            yield entry
+
+    def unlink(entry: os.DirEntry):
+        size = entry.stat(follow_symlinks=False).st_size if progress is not None else 0
+        os.unlink(entry.path)
+        tracker.update(size)
+
+    engine = engine or TransferEngine()
+    result = engine.run(unlink, files(), key=lambda entry: entry.path)
+    if dry_run or not result.ok:
+        return result
+
+    for level in reversed(levels):
+        level_result = engine.run(os.rmdir, level)
+        result.succeeded.update(level_result.succeeded)
+        result.failed.update(level_result.failed)
+        result.retries += level_result.retries
+        if not level_result.ok:
+            break
+    return result
@@ -0,0 +1,119 @@
+import threading
+from typing import Optional, Tuple
+
+from ufs.s3.s3_transfer import DEFAULT_TRANSFER_CONFIG
+from ufs.transfer import DEFAULT_MAX_WORKERS
+
+# every TransferEngine worker running a multipart transfer with all its parts in flight
+DEFAULT_MAX_POOL_CONNECTIONS = DEFAULT_MAX_WORKERS * DEFAULT_TRANSFER_CONFIG.max_concurrency
+
+ClientKey = Tuple[Optional[str], Optional[str], Optional[str], int]
+
+
+def pool_connections_for(engine_workers: int, transfer_concurrency: int) -> int:
+    """HTTP connections needed by engine_workers transfers of transfer_concurrency parts each"""
+    return engine_workers * transfer_concurrency
+
+
+class S3ClientPool:
+    """
+    Thread-safe registry of boto3 S3 clients keyed by (region, endpoint, credentials profile,
+    HTTP connection pool size)
+    boto3 clients are thread-safe and keep their own HTTP connection pool, so one client per key
+    is shared by every S3Object and worker thread; sessions are not thread-safe and are only
+    used under the lock to build the client.
+    :param max_pool_connections: pool size of the clients got without one, connections are
+        opened on demand so a generous size costs nothing while idle
+    """
+
+    def __init__(self, max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS):
+        self.max_pool_connections = max_pool_connections
+        self._clients = dict()
+        self._lock = threading.Lock()
+
+    def _create(
+            self,
+            region_name: Optional[str],
+            endpoint_url: Optional[str],
+            profile_name: Optional[str],
+            max_pool_connections: int,
+    ):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("S3 client pool requires boto3, or pass s3_client explicitly")
+
+        session = boto3.session.Session(profile_name=profile_name, region_name=region_name)
+        return session.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            config=Config(max_pool_connections=max_pool_connections),
+        )
+
+    def get(
+            self,
+            region_name: Optional[str] = None,
+            endpoint_url: Optional[str] = None,
+            profile_name: Optional[str] = None,
+            max_pool_connections: Optional[int] = None,
+    ):
+        """:param max_pool_connections: e.g. pool_connections_for(engine workers, part concurrency)"""
+        key = self._key(region_name, endpoint_url, profile_name, max_pool_connections)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._create(*key)
+                self._clients[key] = client
+            return client
+
+    def _key(
+            self,
+            region_name: Optional[str],
+            endpoint_url: Optional[str],
+            profile_name: Optional[str],
+            max_pool_connections: Optional[int],
+    ) -> ClientKey:
+        return region_name, endpoint_url, profile_name, max_pool_connections or self.max_pool_connections
+
+    def register(
+            self,
+            client,
+            region_name: Optional[str] = None,
+            endpoint_url: Optional[str] = None,
+            profile_name: Optional[str] = None,
+            max_pool_connections: Optional[int] = None,
+    ):
+        """Use an existing client (e.g. with custom credentials or a stub) for the key"""
+        with self._lock:
+            self._clients[self._key(region_name, endpoint_url, profile_name, max_pool_connections)] = client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+
+_client_pool = S3ClientPool()
+
+
+def get_client_pool() -> S3ClientPool:
+    return _client_pool
+
+
+def get_s3_client(
+        region_name: Optional[str] = None,
+        endpoint_url: Optional[str] = None,
+        profile_name: Optional[str] = None,
+        max_pool_connections: Optional[int] = None,
+):
+    """
+    Shared client from the default pool, S3Object falls back to it when no s3_client is given
+    :param max_pool_connections: HTTP connection pool size, for more concurrent requests than
+        DEFAULT_MAX_POOL_CONNECTIONS (see pool_connections_for); clients differing only in pool
+        size are separate clients
+    """
+    return _client_pool.get(region_name, endpoint_url, profile_name, max_pool_connections)
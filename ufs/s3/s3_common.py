@@ -1,39 +1,128 @@
+import heapq
+import queue
+import threading
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
 
 from ufs.base import FileSystemObject
+from ufs.cache import get_metadata_cache
+from ufs.checksum import b64_to_hex
+from ufs.metrics import instrumented_client
+from ufs.s3.s3_transfer import DEFAULT_TRANSFER_CONFIG
+
+# upper bound of listing results held in memory while waiting for a consumer
+_MAX_PENDING_ITEMS = 1000
+_DONE = object()
+# levels of sub-prefixes iter_contents_parallel lists with a delimiter looking for fan_out of them
+_MAX_SPLIT_LEVELS = 2
+# DeleteObjects limit
+MAX_DELETE_KEYS = 1000
 
 
 class S3Object(FileSystemObject, ABC):
+    __slots__ = (
+        "_s3_client",
+        "_protocol",
+        "keep_directories_logical",
+        "transfer_config",
+        "_bucket_name",
+        "_prefix",
+    )
+
     def __init__(
             self,
             path,
             s3_client=None,
             protocol: str = "s3://",
             keep_directories_logical: bool = True,
+            transfer_config: Optional["S3TransferConfig"] = None,
             *args,
             **kwargs,
     ):
-        if protocol == "s3://":
-            if path.startswith("s3a://"):
-                path = path.replace("s3a://", "s3://")
-        elif protocol == "s3a://":
-            if path.startswith("s3://"):
-                path = path.replace("s3://", "s3a://")
-
         super().__init__(path, *args, **kwargs)
+        if not self._path.startswith(protocol):
+            if protocol == "s3://" and self._path.startswith("s3a://"):
+                self._path = "s3://" + self._path[6:]
+            elif protocol == "s3a://" and self._path.startswith("s3://"):
+                self._path = "s3a://" + self._path[5:]
 
-        self._client = s3_client
+        self._s3_client = s3_client
         self._protocol = protocol
         self.keep_directories_logical = keep_directories_logical
+        self.transfer_config = transfer_config or DEFAULT_TRANSFER_CONFIG
+        self._bucket_name = None
+        self._prefix = None
 
-        _, _, bucket_name, prefix = self._path.split("/", 3)
+    @classmethod
+    def from_paths(
+            cls,
+            paths: Iterable[str],
+            s3_client=None,
+            protocol: str = "s3://",
+            keep_directories_logical: bool = True,
+            transfer_config: Optional["S3TransferConfig"] = None,
+            *args,
+            **kwargs,
+    ) -> list:
+        transfer_config = transfer_config or DEFAULT_TRANSFER_CONFIG
+        objects = list()
+        for path in paths:
+            path = path.strip()
+            if not path.startswith(protocol):
+                # needs the s3 / s3a rewrite
+                objects.append(cls(path, s3_client, protocol, keep_directories_logical, transfer_config))
+                continue
+            obj = cls.__new__(cls)
+            obj._path = path
+            obj._s3_client = s3_client
+            obj._protocol = protocol
+            obj.keep_directories_logical = keep_directories_logical
+            obj.transfer_config = transfer_config
+            obj._bucket_name = None
+            obj._prefix = None
+            objects.append(obj)
+        return objects
+
+    def _split(self):
+        _, _, self._bucket_name, self._prefix = self._path.split("/", 3)
 
-        self.bucket_name = bucket_name
-        self.prefix = prefix
+    @property
+    def bucket_name(self) -> str:
+        if self._bucket_name is None:
+            self._split()
+        return self._bucket_name
+
+    @property
+    def prefix(self) -> str:
+        if self._prefix is None:
+            self._split()
+        return self._prefix
 
     def _validate_path(self, path) -> bool:
         return path.startswith(self._protocol)
 
+    @property
+    def _client(self):
+        if self._s3_client is None:
+            from ufs.s3.s3_client import get_s3_client
+
+            # shared client from the pool, instead of one per object
+            self._s3_client = get_s3_client()
+        return instrumented_client(self._s3_client)
+
+    def _derive(self, cls, path: str):
+        """New S3 object of cls sharing this object's client, protocol and settings"""
+        return cls.from_paths(
+            (path,),
+            s3_client=self._s3_client,
+            protocol=self._protocol,
+            keep_directories_logical=self.keep_directories_logical,
+            transfer_config=self.transfer_config,
+        )[0]
+
     @abstractmethod
     def _download(self, dst: "PosixObject"):
         raise NotImplementedError
@@ -42,26 +131,271 @@ class S3Object(FileSystemObject, ABC):
     def _upload(self, src: "PosixObject"):
         raise NotImplementedError
 
+    def _invalidate_metadata(self):
+        """
+        Drop cached metadata of this object (everything below it for directories) and of its parents,
+        mark it stale in the enabled manifests
+        """
+        from ufs.s3.s3_manifest import invalidate_manifests
+
+        invalidate_manifests(self.bucket_name, self.prefix, self.is_directory_path())
+        cache = get_metadata_cache()
+        if cache is None:
+            return
+
+        if self.is_directory_path():
+            cache.invalidate_prefix(self._path)
+        else:
+            cache.invalidate(self._path)
+
+        root = f"{self._protocol}{self.bucket_name}/"
+        parent = self._path.rstrip("/")
+        while len(parent) >= len(root):
+            parent = parent[:parent.rfind("/") + 1]
+            cache.invalidate(parent)
+            parent = parent[:-1]
+
     def as_file(self) -> "File":
         from ufs.s3.s3_file import S3File
 
-        return S3File(self._path)
+        return self._derive(S3File, self._path)
 
     def as_directory(self) -> "Directory":
         from ufs.s3.s3_directory import S3Directory
 
-        return S3Directory(self._path)
+        return self._derive(S3Directory, self._path)
+
+
+# head_object checksum fields, only usable when they cover the full object (no "-N" suffix)
+_CHECKSUM_FIELDS = dict(sha1="ChecksumSHA1", sha256="ChecksumSHA256", crc32c="ChecksumCRC32C")
+
+
+def metadata_checksums(head: dict, algorithms: Sequence[str]) -> dict:
+    """Hex digests of the requested algorithms that can be taken from a head_object response"""
+    result = dict()
+    for algorithm in algorithms:
+        if algorithm == "md5":
+            etag = head.get("ETag", "").strip('"')
+            encrypted = (
+                head.get("ServerSideEncryption") == "aws:kms"
+                or "SSECustomerAlgorithm" in head
+            )
+            # multipart ETags are md5 of the part md5s, and encrypted object ETags are opaque
+            if etag and "-" not in etag and not encrypted:
+                result[algorithm] = etag
+            continue
+
+        value = head.get(_CHECKSUM_FIELDS.get(algorithm, ""))
+        if value and "-" not in value:
+            result[algorithm] = b64_to_hex(value)
+    return result
+
+
+# error codes of head_object / get_object for missing keys, and for denied requests
+NOT_FOUND_CODES = ("404", "NoSuchKey", "NotFound")
+FORBIDDEN_CODES = ("403", "AccessDenied", "Forbidden")
+
+
+def error_code(error: Exception) -> Optional[str]:
+    """Error code of a botocore ClientError, None for any other exception"""
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return None
+    return response.get("Error", {}).get("Code")
 
 
 def delete_s3_objects(
         s3_client, bucket_name, objects_list: list, dry_run: bool = False
-):
+) -> list:
+    """
+    Delete objects with DeleteObjects, MAX_DELETE_KEYS keys per request
+    :param objects_list: list of dict(Key=...)
+    :return: per key errors reported by S3, dicts with Key, Code and Message
+    """
     if dry_run:
         for prefix in objects_list:
-            print(f"Deleting: s3://{bucket_name}/{prefix}")
+            print(f"Deleting: s3://{bucket_name}/{prefix['Key']}")
+        return list()
+
+    errors = list()
+    for start in range(0, len(objects_list), MAX_DELETE_KEYS):
+        response = s3_client.delete_objects(
+            Bucket=bucket_name,
+            Delete=dict(Objects=objects_list[start:start + MAX_DELETE_KEYS], Quiet=True),
+        )
+        errors.extend(response.get("Errors", ()))
+    return errors
+
+
+def iter_list_pages(
+        s3_client,
+        bucket_name: str,
+        prefix: str,
+        delimiter: Optional[str] = None,
+        start_after: Optional[str] = None,
+) -> Iterator[dict]:
+    """:param start_after: only list the keys after this one (StartAfter), in key order"""
+    # list_objects_v2 called page by page (rather than through a paginator), so that
+    # every page request goes through the instrumented client
+    kwargs = dict(Bucket=bucket_name, Prefix=prefix)
+    if delimiter:
+        kwargs["Delimiter"] = delimiter
+    if start_after:
+        kwargs["StartAfter"] = start_after
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        yield response
+        if not response.get("IsTruncated"):
+            return
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def iter_level(
+        s3_client, bucket_name: str, prefix: str, delimiter: str = "/"
+) -> Iterator[Tuple[str, Optional[dict]]]:
+    """
+    List one level below prefix, yielding (key, content) for objects and (sub_prefix, None)
+    for common prefixes, merged in key order
+    """
+    for response in iter_list_pages(s3_client, bucket_name, prefix, delimiter=delimiter):
+        contents = ((c["Key"], c) for c in response.get("Contents", []))
+        prefixes = ((p["Prefix"], None) for p in response.get("CommonPrefixes", []))
+        yield from heapq.merge(contents, prefixes, key=lambda item: item[0])
+
+
+def _iter_split(
+        s3_client, bucket_name: str, prefix: str, fan_out: int, levels: int = _MAX_SPLIT_LEVELS
+) -> Iterator[Tuple[str, Optional[dict]]]:
+    """
+    iter_level, with the sub-prefixes of a level holding fewer than fan_out of them replaced by
+    their own level (up to levels deep), so that a tree with few top level prefixes still gives
+    fan_out prefixes to paginate concurrently; yields in key order
+    """
+    level = iter_level(s3_client, bucket_name, prefix)
+    if levels <= 1:
+        yield from level
         return
 
-    s3_client.delete_s3_objects(
-        Bucket=bucket_name,
-        Delete=dict(Objects=objects_list, Quiet=True),
-    )
+    head = list(islice(level, _MAX_PENDING_ITEMS))
+    prefixes = sum(1 for _, content in head if content is None)
+    if len(head) == _MAX_PENDING_ITEMS or not 0 < prefixes < fan_out:
+        yield from head
+        yield from level
+        return
+
+    for key, content in head:
+        if content is None:
+            yield from _iter_split(s3_client, bucket_name, key, fan_out, levels - 1)
+        else:
+            yield key, content
+
+
+def iter_contents_parallel(
+        s3_client, bucket_name: str, prefix: str, fan_out: int, ordered: bool = False
+) -> Iterator[dict]:
+    """
+    List prefix by discovering its sub-prefixes with Delimiter='/' and paginating them concurrently
+    Sub-prefixes are looked for one level deeper when the first level has fewer than fan_out.
+    :param fan_out: number of sub-prefixes paginated at the same time
+    :param ordered: yield in key order (as a single paginator would), otherwise as pages arrive
+    :return: generator of list_objects_v2 "Contents" items
+    """
+    stop = threading.Event()
+
+    def put(q: queue.Queue, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def list_prefix(sub_prefix: str, q: queue.Queue):
+        try:
+            for response in iter_list_pages(s3_client, bucket_name, sub_prefix):
+                if stop.is_set():
+                    return
+                if "Contents" in response:
+                    put(q, response["Contents"])
+        except Exception as e:
+            put(q, e)
+            return
+        put(q, _DONE)
+
+    def drain(q: queue.Queue):
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+
+    executor = ThreadPoolExecutor(max_workers=fan_out)
+    futures = list()
+    level = _iter_split(s3_client, bucket_name, prefix, fan_out)
+    try:
+        if not ordered:
+            results = queue.Queue(maxsize=fan_out * 2)
+            running = 0
+
+            def take(block: bool):
+                nonlocal running
+                while running:
+                    try:
+                        item = results.get(block=block)
+                    except queue.Empty:
+                        return
+                    if item is _DONE:
+                        running -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield from item
+
+            for key, content in level:
+                if content is not None:
+                    yield content
+                else:
+                    futures.append(executor.submit(list_prefix, key, results))
+                    running += 1
+                # pages already listed, so that the workers do not wait on a full queue meanwhile
+                yield from take(block=False)
+
+            yield from take(block=True)
+            return
+
+        # each sub-prefix gets a small queue of its own, consumed in key order
+        pending = deque()
+        running = 0
+
+        def fill():
+            nonlocal running
+            while running < fan_out and len(pending) < _MAX_PENDING_ITEMS:
+                item = next(level, None)
+                if item is None:
+                    return
+                if item[1] is not None:
+                    pending.append(item[1])
+                    continue
+                q = queue.Queue(maxsize=2)
+                futures.append(executor.submit(list_prefix, item[0], q))
+                pending.append(q)
+                running += 1
+
+        fill()
+        while pending:
+            head = pending.popleft()
+            if isinstance(head, dict):
+                yield head
+            else:
+                running -= 1
+                # keep fan_out sub-prefixes listing while the head one is consumed
+                fill()
+                yield from drain(head)
+            fill()
+    finally:
+        stop.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
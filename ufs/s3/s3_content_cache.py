@@ -0,0 +1,197 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from typing import BinaryIO, Optional, Union
+
+from ufs.posix.posix_directory import PosixDirectory
+from ufs.s3.s3_common import error_code
+from ufs.s3.s3_transfer import download_file
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024 * 1024
+_SUFFIX = ".obj"
+_PART_SUFFIX = ".part"
+_LOCK_FILE = ".lock"
+# a download not written to for this long was left behind by a killed process
+STALE_PART_SECONDS = 3600
+# a cache over budget is evicted down to this fraction of max_bytes, so that a full cache
+# is not scanned again on every miss
+EVICT_TO_RATIO = 0.9
+
+
+class ContentCache:
+    """
+    Read-through on-disk cache of S3 object contents, keyed by bucket, key and ETag
+    Files are published with an atomic rename and evicted (least recently used first) under an
+    exclusive flock, so several processes on one host can share the same directory.
+    The directory is only scanned for eviction when this process's running estimate of its size
+    (the last scan plus its own downloads) goes over max_bytes, so entries added by other
+    processes meanwhile can take it over max_bytes until then.
+    """
+
+    def __init__(
+            self, directory: Union[str, PosixDirectory], max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.directory = PosixDirectory(str(directory))
+        self.directory.create(exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._estimated_bytes = 0
+        # sets the estimate, and cleans up after processes killed mid-download
+        self.evict()
+
+    def _cache_path(self, bucket_name: str, key: str, etag: str) -> str:
+        digest = hashlib.sha256(f"{bucket_name}/{key}/{etag}".encode("utf-8")).hexdigest()
+        return os.path.join(str(self.directory), digest + _SUFFIX)
+
+    def _fetch(self, s3_file: "S3File", head: dict, path: str) -> BinaryIO:
+        fd, temp_path = tempfile.mkstemp(dir=str(self.directory), suffix=_PART_SUFFIX)
+        f = os.fdopen(fd, "rb")
+        try:
+            download_file(
+                s3_file._client,
+                s3_file.bucket_name,
+                s3_file.prefix,
+                temp_path,
+                head["ContentLength"],
+                config=s3_file.transfer_config,
+                if_match=head["ETag"],
+            )
+            os.replace(temp_path, path)
+        except BaseException:
+            f.close()
+            os.unlink(temp_path)
+            raise
+        return f
+
+    def open(self, s3_file: "S3File") -> BinaryIO:
+        """
+        Binary file handle on an up to date local copy of the object, downloading it on a miss
+        The handle stays readable even if another process evicts the entry meanwhile.
+        """
+        for attempt in range(2):
+            head = s3_file._head()
+            path = self._cache_path(s3_file.bucket_name, s3_file.prefix, head["ETag"])
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                pass
+            else:
+                # refresh mtime, used as the LRU clock for eviction
+                os.utime(f.fileno())
+                with self._lock:
+                    self.hits += 1
+                return f
+
+            try:
+                f = self._fetch(s3_file, head, path)
+            except Exception as e:
+                if attempt == 0 and error_code(e) in ("412", "PreconditionFailed"):
+                    # object changed since head_object (or the cached head is stale)
+                    s3_file._invalidate_metadata()
+                    continue
+                raise
+            with self._lock:
+                self.misses += 1
+                self._estimated_bytes += os.fstat(f.fileno()).st_size
+                over_budget = self._estimated_bytes > self.max_bytes
+            if over_budget:
+                self.evict(int(self.max_bytes * EVICT_TO_RATIO))
+            return f
+
+    def read_bytes(self, s3_file: "S3File") -> bytes:
+        with self.open(s3_file) as f:
+            return f.read()
+
+    def mmap(self, s3_file: "S3File") -> mmap.mmap:
+        """Read-only memory map of the cached copy, stays valid after the entry is evicted"""
+        with self.open(s3_file) as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError(f"Cannot mmap empty object: {s3_file}")
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def size(self) -> int:
+        total = 0
+        with os.scandir(str(self.directory)) as it:
+            for entry in it:
+                if entry.name.endswith(_SUFFIX):
+                    total += entry.stat().st_size
+        return total
+
+    def evict(self, max_bytes: Optional[int] = None):
+        """
+        Remove least recently used entries until the cache fits max_bytes, and downloads
+        abandoned for STALE_PART_SECONDS
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        lock_path = os.path.join(str(self.directory), _LOCK_FILE)
+        with open(lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = list()
+                total = 0
+                stale = time.time() - STALE_PART_SECONDS
+                with os.scandir(str(self.directory)) as it:
+                    for entry in it:
+                        is_part = entry.name.endswith(_PART_SUFFIX)
+                        if not (is_part or entry.name.endswith(_SUFFIX)):
+                            continue
+                        try:
+                            stat = entry.stat()
+                            if is_part:
+                                if stat.st_mtime < stale:
+                                    os.unlink(entry.path)
+                                continue
+                        except FileNotFoundError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+
+                for _, size, path in sorted(entries):
+                    if total <= max_bytes:
+                        break
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    with self._lock:
+                        self.evictions += 1
+                with self._lock:
+                    self._estimated_bytes = total
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def clear(self):
+        self.evict(max_bytes=0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+
+_content_cache: Optional[ContentCache] = None
+
+
+def enable_content_cache(
+        directory: Union[str, PosixDirectory], max_bytes: int = DEFAULT_MAX_BYTES
+) -> ContentCache:
+    """Turn on the local content cache used by S3File.read_bytes/read_text/read_mmap"""
+    global _content_cache
+    _content_cache = ContentCache(directory, max_bytes=max_bytes)
+    return _content_cache
+
+
+def disable_content_cache():
+    global _content_cache
+    _content_cache = None
+
+
+def get_content_cache() -> Optional[ContentCache]:
+    return _content_cache
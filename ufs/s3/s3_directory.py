@@ -1,176 +1,371 @@
+import hashlib
 import os.path
-import tempfile
+from datetime import datetime
+from itertools import islice
 from os.path import join
-from uuid import uuid4
-
-from ufs.base import Directory, File
-from ufs.s3.s3_common import S3Object, delete_s3_objects
+from typing import Callable, Iterator, Optional, Union
+
+from ufs.archive import write_archive
+from ufs.base import Directory, File, FileEntry
+from ufs.cache import MISSING, get_metadata_cache
+from ufs.exceptions import FileSystemException
+from ufs.s3.s3_common import (
+    MAX_DELETE_KEYS,
+    S3Object,
+    delete_s3_objects,
+    iter_contents_parallel,
+    iter_level,
+    iter_list_pages,
+)
+from ufs.s3.s3_manifest import get_manifest
+from ufs.s3.s3_transfer import copy_object, download_file, upload_file
+from ufs.transfer import ProgressTracker, TransferEngine, TransferProgress, TransferResult
 
 
 class S3Directory(S3Object, Directory):
-    def size(self) -> int:
-        paginator = self._client.get_paginator("list_objects_v2")
-        response_iterator = paginator.paginate(
-            Bucket=self.bucket_name, Prefix=self.prefx
+    __slots__ = ()
+
+    def _iter_contents(self, recursive: bool = True, fan_out: int = 1, sort: bool = False):
+        if not recursive:
+            for _, content in iter_level(self._client, self.bucket_name, self.prefix):
+                if content is not None:
+                    yield content
+        elif fan_out > 1:
+            yield from iter_contents_parallel(
+                self._client, self.bucket_name, self.prefix, fan_out=fan_out, ordered=sort
+            )
+        else:
+            for response in iter_list_pages(self._client, self.bucket_name, self.prefix):
+                yield from response.get("Contents", [])
+
+    def _relative_key(self, key: str) -> str:
+        return key[len(self.prefix):].lstrip("/")
+
+    def _to_entry(self, content: dict) -> FileEntry:
+        return FileEntry(
+            f"{self._protocol}{self.bucket_name}/{content['Key']}",
+            content["Size"],
+            content["LastModified"].timestamp(),
+            content["ETag"].strip('"'),
         )
-        full_size = 0
-        for response in response_iterator:
-            if "Contents" not in response:
-                continue
-            for content in response["Contents"]:
-                full_size += content["Size"]
-        return full_size
-
-    def exists(self) -> bool:
+
+    def _manifest(self, use_manifest: bool):
+        return get_manifest(self) if use_manifest else None
+
+    def size(self, fan_out: int = 1, use_manifest: bool = False) -> int:
+        """:param use_manifest: answer from the enabled manifest, if any (see enable_manifest)"""
+        manifest = self._manifest(use_manifest)
+        if manifest is not None:
+            return manifest[0].size(manifest[1])
+        return sum(entry.size for entry in self.iter_entries(recursive=True, fan_out=fan_out))
+
+    def exists(self, use_manifest: bool = False) -> bool:
+        """:param use_manifest: answer from the enabled manifest, if any (see enable_manifest)"""
         if self.keep_directories_logical:
             return True
-        files = self.list_files(limit=1)
-        if len(files) > 0:
-            return True
-        return False
+
+        manifest = self._manifest(use_manifest)
+        if manifest is not None:
+            return manifest[0].exists(manifest[1])
+
+        cache = get_metadata_cache()
+        if cache is not None:
+            cached = cache.get(self._path, "exists")
+            if cached is not MISSING:
+                return cached
+
+        exists = next(self.iter_files(limit=1), None) is not None
+        if cache is not None:
+            cache.set(self._path, "exists", exists)
+        return exists
 
     def create(self, parents: bool = True, exist_ok: bool = False, *args, **kwargs):
         if self.keep_directories_logical:
             return
         raise NotImplementedError
 
-    def duplicate(self, dst: "Directory", dir_exist_ok: bool = False):
+    def duplicate(
+            self,
+            dst: "Directory",
+            dir_exist_ok: bool = False,
+            engine: Optional[TransferEngine] = None,
+            fan_out: int = 1,
+            progress: Optional[Callable[[TransferProgress], None]] = None,
+    ) -> TransferResult:
+        """:param progress: called with TransferProgress (objects, bytes, elapsed) after every object"""
         from ufs.posix.posix_directory import PosixDirectory
 
         if isinstance(dst, PosixDirectory):
-            return self._download(dst)
+            return self._download(dst, engine=engine, fan_out=fan_out, progress=progress)
         elif not isinstance(dst, S3Directory):
             raise NotImplementedError
 
-        source_prefix = self._path
-        for file_path in self.list_files(recursive=True):
-            _, _, source_bucket, file_path_prefix = file_path.split("/", 3)
-            source_relative_prefix = file_path.replace(source_prefix, "")
-            dst_file = dst.join_as_file(source_relative_prefix)
-            # create missing intermediate directories on Posix FileSystem
-            dst_dirname = os.path.dirname(dst_file)
-            os.makedirs(dst_dirname, exist_ok=True)
-
-            self._client.copy(
-                copy_source=dict(Bucket=source_bucket, Key=file_path_prefix),
-                Bucket=dst_file.bucket_name,
-                Key=dst_file.prefix,
+        tracker = ProgressTracker(progress)
+
+        def copy(content: dict):
+            dst_file = dst.join_as_file(self._relative_key(content["Key"]))
+            copy_object(
+                self._client,
+                self.bucket_name,
+                content["Key"],
+                dst_file.bucket_name,
+                dst_file.prefix,
+                content["Size"],
+                config=self.transfer_config,
             )
+            tracker.update(content["Size"])
+
+        engine = engine or TransferEngine()
+        contents = self._iter_contents(fan_out=fan_out)
+        result = engine.run(copy, contents, key=lambda content: content["Key"])
+        dst._invalidate_metadata()
+        result.raise_for_errors()
+        return result
 
     def join_as_file(self, *other) -> "File":
         from ufs.s3.s3_file import S3File
 
-        return S3File(join(self, *other))
+        return self._derive(S3File, join(self, *other))
 
     def join_as_directory(self, *other) -> "Directory":
-        return S3Directory(join(self, *other))
+        return self._derive(S3Directory, join(self, *other))
 
-    def remove(self, missing_ok: bool = True, dry_run: bool = False, *args, **kwargs):
+    def remove(
+            self, missing_ok: bool = True, dry_run: bool = False, fan_out: int = 1, *args, **kwargs
+    ):
         objects_list = list()
+        errors = list()
 
-        for file_path in self.list_files(recursive=True):
-            _, _, _, prefix = file_path.split("/", 3)
-            objects_list.append(dict(Key=prefix))
-            if len(objects_list) == 1000:
-                delete_s3_objects(
+        for content in self._iter_contents(fan_out=fan_out):
+            objects_list.append(dict(Key=content["Key"]))
+            if len(objects_list) == MAX_DELETE_KEYS:
+                errors.extend(delete_s3_objects(
                     s3_client=self._client,
                     bucket_name=self.bucket_name,
                     objects_list=objects_list,
                     dry_run=dry_run,
-                )
+                ))
                 objects_list = list()
 
         if objects_list:
-            delete_s3_objects(
+            errors.extend(delete_s3_objects(
                 s3_client=self._client,
                 bucket_name=self.bucket_name,
                 objects_list=objects_list,
                 dry_run=dry_run,
+            ))
+        if not dry_run:
+            self._invalidate_metadata()
+        if errors:
+            raise FileSystemException(
+                f"Failed to delete {len(errors)} objects under {self}, first failure: "
+                f"{errors[0].get('Key')}: {errors[0].get('Code')} {errors[0].get('Message')}"
+            )
+
+    def iter_files(
+            self,
+            recursive: bool = True,
+            limit: int = -1,
+            sort: bool = False,
+            fan_out: int = 1,
+            *args,
+            **kwargs,
+    ) -> Iterator[str]:
+        for entry in self.iter_entries(recursive, limit=limit, sort=sort, fan_out=fan_out):
+            yield entry.path
+
+    def iter_entries(
+            self,
+            recursive: bool = True,
+            limit: int = -1,
+            sort: bool = False,
+            fan_out: int = 1,
+            use_manifest: bool = False,
+            *args,
+            **kwargs,
+    ) -> Iterator[FileEntry]:
+        """
+        :param recursive: when False, only objects directly below the prefix (Delimiter='/')
+        :param sort: yield in key order, only costs extra buffering when fan_out > 1
+        :param fan_out: when > 1, paginate the sub-prefixes of this directory concurrently
+        :param use_manifest: read recursive listings from the enabled manifest, if any
+            (see enable_manifest), in key order
+        """
+        manifest = self._manifest(use_manifest) if recursive else None
+        if manifest is not None:
+            yield from manifest[0].iter_entries(manifest[1], limit=limit)
+            return
+
+        contents = self._iter_contents(recursive, fan_out=fan_out, sort=sort)
+        if limit > 0:
+            contents = islice(contents, limit)
+        for content in contents:
+            yield self._to_entry(content)
+
+    def iter_file_objects(
+            self,
+            recursive: bool = True,
+            limit: int = -1,
+            sort: bool = False,
+            fan_out: int = 1,
+            *args,
+            **kwargs,
+    ) -> Iterator["File"]:
+        from ufs.s3.s3_file import S3File
+
+        for file_path in self.iter_files(recursive, limit=limit, sort=sort, fan_out=fan_out):
+            yield self._derive(S3File, file_path)
+
+    def _iter_glob(self, pattern: str, max_depth: int) -> Iterator[dict]:
+        """
+        list_objects_v2 contents of the objects matching pattern
+        The literal part of every segment is pushed into Prefix, levels before a '**' are listed
+        with Delimiter='/' and only matching common prefixes are descended into.
+        """
+        from ufs.pattern import GlobPattern, iter_glob
+
+        client = self._client
+        bucket_name = self.bucket_name
+        base = self.prefix
+        if base and not base.endswith("/"):
+            base += "/"
+
+        def list_level(relative_dir: str, name_prefix: str):
+            prefix = base + relative_dir
+            for key, content in iter_level(client, bucket_name, prefix + name_prefix):
+                name = key[len(prefix):]
+                if content is None:
+                    yield name[:-1], True, None
+                elif name:
+                    yield name, False, content
+
+        def list_tree(relative_dir: str, depth: int):
+            if depth < 0:
+                for response in iter_list_pages(client, bucket_name, base + relative_dir):
+                    for content in response.get("Contents", []):
+                        if not content["Key"].endswith("/"):
+                            yield content["Key"][len(base):], content
+                return
+            pending = [(relative_dir, depth)]
+            while pending:
+                prefix, remaining = pending.pop()
+                for key, content in iter_level(client, bucket_name, base + prefix):
+                    if content is None:
+                        if remaining > 0:
+                            pending.append((key[len(base):], remaining - 1))
+                    elif not key.endswith("/"):
+                        yield key[len(base):], content
+
+        return iter_glob(GlobPattern(pattern), list_level, list_tree, max_depth)
+
+    def find(
+            self,
+            pattern: str = "**",
+            predicate: Optional[Callable[[FileEntry], bool]] = None,
+            min_size: Optional[int] = None,
+            max_size: Optional[int] = None,
+            modified_after: Union[float, datetime, None] = None,
+            modified_before: Union[float, datetime, None] = None,
+            max_depth: int = -1,
+            limit: int = -1,
+            use_manifest: bool = False,
+            **kwargs,
+    ) -> Iterator[FileEntry]:
+        """
+        See DirectoryPrefix.find, filters on the listing's metadata, no head_object calls
+        :param use_manifest: answer from the enabled manifest, if any (see enable_manifest)
+        """
+        from ufs.pattern import entry_filter
+
+        manifest = self._manifest(use_manifest)
+        if manifest is not None:
+            yield from manifest[0].find(
+                pattern,
+                predicate,
+                min_size,
+                max_size,
+                modified_after,
+                modified_before,
+                max_depth,
+                limit,
+                prefix=manifest[1],
             )
+            return
+
+        accept = entry_filter(predicate, min_size, max_size, modified_after, modified_before)
+        for content in self._iter_glob(pattern, max_depth):
+            entry = self._to_entry(content)
+            if accept is None or accept(entry):
+                yield entry
+                limit -= 1
+                if limit == 0:
+                    return
 
     def list_files(
             self, recursive: bool = True, limit: int = -1, *args, **kwargs
     ) -> list:
-        # TODO: pending implementation for recursive=False
-        paginator = self._client.get_paginator("list_objects_v2")
-        response_iterator = paginator.paginate(
-            Bucket=self.bucket_name, Prefix=self.prefx
-        )
-        files = list()
-        counter = 0
-        for response in response_iterator:
-            if "Contents" not in response:
-                continue
-            for content in response["Contents"]:
-                file_prefix = content["Key"]
-                files.append(f"{self._protocol}{self.bucket_name}/{file_prefix}")
-                counter += 1
-                if 0 < limit <= counter:
-                    break
-            if 0 < limit <= counter:
-                break
-
-        return files
+        return list(self.iter_files(recursive, limit=limit))
 
     def list_file_objects(
             self, recursive: bool = True, limit: int = -1, *args, **kwargs
     ) -> list:
-        from ufs.s3.s3_file import S3File
-
-        file_objects = list()
-        for file_path in self.list_files(recursive, limit=limit):
-            file_objects.append(S3File(file_path))
-        return file_objects
-
-    def copy_to(self, dst: "Directory", dir_exist_ok: bool = False):
-        source_basename = os.path.basename(self)
+        return list(self.iter_file_objects(recursive, limit=limit))
+
+    def copy_to(
+            self,
+            dst: "Directory",
+            dir_exist_ok: bool = False,
+            engine: Optional[TransferEngine] = None,
+            *args,
+            **kwargs,
+    ) -> TransferResult:
+        source_basename = os.path.basename(str(self).rstrip("/"))
         dst = dst.join_as_directory(source_basename)
-        return self.duplicate(dst)
-
-    def archive_to_posix(self, dst: File, archive_format: str):
-        from ufs.posix.posix_directory import PosixDirectory
-
-        with tempfile.TemporaryDirectory() as temp_staging:
-            temp_stg = PosixDirectory(temp_staging)
-            # first download source s3 directory to Posix Directory
-            self._download(temp_stg)
-            temp_stg.zip_to(dst, archive_format=archive_format)
-
-    def archive_to_s3(self, dst: File, archive_format: str):
-        from ufs.posix.posix_file import PosixFile
+        return self.duplicate(dst, dir_exist_ok, engine, *args, **kwargs)
+
+    def archive_to_posix(
+            self,
+            dst: File,
+            archive_format: str,
+            compression_level: Optional[int] = None,
+            progress: Optional[Callable[[TransferProgress], None]] = None,
+    ):
+        # objects are fetched concurrently and streamed into the archive, no local staging
+        write_archive(
+            self, dst, archive_format, compression_level=compression_level, progress=progress
+        )
 
-        temp_file = PosixFile(join(f'/tmp/{uuid4()}', os.path.basename(dst)))
-        self.archive_to_posix(temp_file, archive_format)
-        dst._upload(temp_file)
+    def archive_to_s3(
+            self,
+            dst: File,
+            archive_format: str,
+            compression_level: Optional[int] = None,
+            progress: Optional[Callable[[TransferProgress], None]] = None,
+    ):
+        write_archive(
+            self, dst, archive_format, compression_level=compression_level, progress=progress
+        )
 
     def tar_gz_to(self, dst: File):
-        from ufs.posix.posix_directory import PosixDirectory
-        from ufs.posix.posix_file import PosixFile
-        from ufs.s3.s3_file import S3File
-
-        with tempfile.TemporaryDirectory() as temp_staging:
-            temp_stg = PosixDirectory(temp_staging)
-            # first download source s3 directory to Posix Directory
-            self._download(temp_stg)
-
-            if isinstance(dst, PosixFile):
-                temp_stg.tar_gz_to(dst)
-            elif not isinstance(dst, S3File):
-                raise NotImplementedError
+        write_archive(self, dst, "gztar")
 
-            # then, zip it to Posix File (temporary) first
-            temp_tar_gz_file = PosixFile(f"/tmp/{uuid4()}/{os.path.basename(dst)}")
-            temp_stg.tar_gz_to(temp_tar_gz_file)
-            # then, upload to dst S3 File
-            dst._upload(temp_tar_gz_file)
-
-    def file_count(self) -> int:
-        return len(self.list_files(recursive=True))
+    def file_count(self, fan_out: int = 1, use_manifest: bool = False) -> int:
+        """:param use_manifest: answer from the enabled manifest, if any (see enable_manifest)"""
+        manifest = self._manifest(use_manifest)
+        if manifest is not None:
+            return manifest[0].file_count(manifest[1])
+        return sum(1 for _ in self._iter_contents(fan_out=fan_out))
 
     def is_directory_path(self) -> bool:
         return True
 
-    def _download(self, dst: "PosixObject"):
+    def _download(
+            self,
+            dst: "PosixObject",
+            engine: Optional[TransferEngine] = None,
+            fan_out: int = 1,
+            progress: Optional[Callable[[TransferProgress], None]] = None,
+    ) -> TransferResult:
         """
         Download S3Directory into posix directory
         e.g. S3Directory = s3://bucket_name/file/path/
@@ -179,27 +374,46 @@ class S3Directory(S3Object, Directory):
             as /tmp/somewhere/prefix/file1.txt
         outcome
         :param dst: PosixDirectory, where contents of the source directory need to be downloaded into
-        :return: None
+        :param engine: TransferEngine, worker pool used for the downloads
+        :param fan_out: number of sub-prefixes listed concurrently
+        :param progress: called with TransferProgress (objects, bytes, elapsed) after every object
+        :return: TransferResult, keyed by S3 key
         """
         from ufs.posix.posix_directory import PosixDirectory
 
         dst: PosixDirectory = dst.as_directory()
-        source_prefix = self._path
-        for file_path in self.list_files(recursive=True):
-            _, _, _, download_source_prefix = file_path.split("/", 3)
-            source_relative_prefix = file_path.replace(source_prefix, "")
-            dst_file = dst.join_as_file(source_relative_prefix)
-            # create missing intermediate directories on Posix FileSystem
-            dst_dirname = os.path.dirname(dst_file)
-            os.makedirs(dst_dirname, exist_ok=True)
+        tracker = ProgressTracker(progress)
 
-            self._client.download_file(
-                Bucket=self.bucket_name,
-                Key=download_source_prefix,
-                Filename=str(dst_file),
+        def download(content: dict):
+            dst_file = dst.join_as_file(self._relative_key(content["Key"]))
+            # create missing intermediate directories on Posix FileSystem
+            os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+            download_file(
+                self._client,
+                self.bucket_name,
+                content["Key"],
+                str(dst_file),
+                content["Size"],
+                config=self.transfer_config,
+                # parts of a key overwritten mid-transfer must not be mixed
+                if_match=content["ETag"],
             )
-
-    def _upload(self, src: "PosixObject"):
+            tracker.update(content["Size"])
+
+        engine = engine or TransferEngine()
+        contents = self._iter_contents(fan_out=fan_out)
+        result = engine.run(download, contents, key=lambda content: content["Key"])
+        result.raise_for_errors()
+        return result
+
+    def _upload(
+            self,
+            src: "PosixObject",
+            engine: Optional[TransferEngine] = None,
+            progress: Optional[Callable[[TransferProgress], None]] = None,
+            state_directory: Optional[str] = None,
+            fan_out: int = 1,
+    ) -> TransferResult:
         """
         Upload PosixDirectory files into S3
         e.g. PosixDirectory = /tmp/somewhere/
@@ -208,15 +422,41 @@ class S3Directory(S3Object, Directory):
             as s3://bucket_name/upload_to/prefix/file1.txt
         outcome
         :param src: PosixDirectory, contents of the source directory need to be uploaded into S3
-        :return: None
+        :param engine: TransferEngine, worker pool used for the uploads
+        :param progress: called with TransferProgress (files, bytes, elapsed) after every file
+        :param state_directory: local directory of the upload state files making multipart uploads
+            resumable, running the same upload again only transfers the missing parts
+        :param fan_out: number of source directories scanned concurrently
+        :return: TransferResult, keyed by source file path
         """
         from ufs.posix.posix_directory import PosixDirectory
 
         src: PosixDirectory = src.as_directory()
         src_prefix = str(src)
-        for file_path in src.list_files(recursive=True):
-            source_relative_path = file_path.replace(src_prefix, "")
+        tracker = ProgressTracker(progress)
+        if state_directory is not None:
+            os.makedirs(state_directory, exist_ok=True)
+
+        def upload(entry: FileEntry):
+            source_relative_path = entry.path[len(src_prefix):]
             dst_prefix = join(self.prefix, source_relative_path)
-            self._client.upload_file(
-                Filename=file_path, Bucket=self.bucket_name, Key=dst_prefix
+            state_file = None
+            if state_directory is not None:
+                digest = hashlib.sha256(f"{self.bucket_name}/{dst_prefix}".encode("utf-8")).hexdigest()
+                state_file = os.path.join(state_directory, digest + ".json")
+            upload_file(
+                self._client,
+                self.bucket_name,
+                dst_prefix,
+                entry.path,
+                config=self.transfer_config,
+                state_file=state_file,
             )
+            tracker.update(entry.size)
+
+        engine = engine or TransferEngine()
+        entries = src.iter_entries(recursive=True, fan_out=fan_out)
+        result = engine.run(upload, entries, key=lambda entry: entry.path)
+        self._invalidate_metadata()
+        result.raise_for_errors()
+        return result
@@ -1,52 +1,156 @@
-import hashlib
-from io import BytesIO
+import mmap
+import os
+from typing import IO, Callable, Iterator, Optional, Sequence
 
 from ufs.base import File
-from ufs.s3.s3_common import S3Object
+from ufs.cache import MISSING, get_metadata_cache
+from ufs.checksum import digest_chunks
+from ufs.s3.s3_common import FORBIDDEN_CODES, NOT_FOUND_CODES, S3Object, error_code, metadata_checksums
+from ufs.s3.s3_content_cache import get_content_cache
+from ufs.s3.s3_stream import open_object
+from ufs.s3.s3_transfer import (
+    MultipartWriter,
+    copy_object,
+    download_file,
+    iter_object_chunks,
+    read_first_range,
+    read_object,
+    read_object_into,
+    read_range,
+    request_body,
+    upload_file,
+)
+from ufs.transfer import ProgressTracker, TransferProgress
 
 
 class S3File(S3Object, File):
-    def _download(self, dst: "PosixObject"):
-        self._client.download_file(Bucket=self.bucket_name, Key=self.prefix, Filename=str(dst))
+    __slots__ = ()
 
-    def _upload(self, src: "PosixObject"):
-        self._client.upload_file(Bucket=self.bucket_name, Key=self.prefix, Filename=str(src))
+    def _download(
+            self,
+            dst: "PosixObject",
+            size: Optional[int] = None,
+            progress: Optional[Callable[[TransferProgress], None]] = None,
+            etag: Optional[str] = None,
+    ):
+        """
+        Stream the object into a Posix file, using parallel ranged GETs above the multipart threshold
+        :param size: object size when already known (e.g. from a listing), otherwise it comes with
+            the first ranged GET
+        :param progress: called with TransferProgress once the object is downloaded
+        :param etag: ETag every part must have (e.g. from a listing), the first part's by default
+        """
+        tracker = ProgressTracker(progress)
+        download_file(
+            self._client,
+            self.bucket_name,
+            self.prefix,
+            str(dst),
+            size,
+            config=self.transfer_config,
+            if_match=etag,
+        )
+        tracker.update(os.path.getsize(dst) if size is None else size)
+
+    def _upload(
+            self,
+            src: "PosixObject",
+            progress: Optional[Callable[[TransferProgress], None]] = None,
+            state_file: Optional[str] = None,
+    ):
+        """
+        :param state_file: local file making a multipart upload resumable: an interrupted upload
+            continues from its completed parts when called again with the same state file
+        """
+        tracker = ProgressTracker(progress)
+        upload_file(
+            self._client,
+            self.bucket_name,
+            self.prefix,
+            str(src),
+            config=self.transfer_config,
+            state_file=state_file,
+        )
+        self._invalidate_metadata()
+        tracker.update(os.path.getsize(src))
+
+    def _head(self, checksum_mode: bool = False) -> dict:
+        field = "head_checksums" if checksum_mode else "head"
+        cache = get_metadata_cache()
+        if cache is not None:
+            cached = cache.get(self._path, field)
+            if cached is not MISSING:
+                return cached
+
+        kwargs = dict(Bucket=self.bucket_name, Key=self.prefix)
+        if checksum_mode:
+            kwargs["ChecksumMode"] = "ENABLED"
+        response = self._client.head_object(**kwargs)
+
+        if cache is not None:
+            cache.set(self._path, field, response)
+        return response
 
     def size(self) -> int:
         try:
-            response = self._client.head_object(Bucket=self.bucket_name, Key=self.prefix)
-            return response['ContentLength']
-        except:
-            # if there is a permission error for head_object
-            response = self._client.get_object(Bucket=self.bucket_name, Key=self.prefix)
-            return response['ContentLength']
+            return self._head()['ContentLength']
+        except Exception as e:
+            if error_code(e) not in FORBIDDEN_CODES + NOT_FOUND_CODES:
+                raise
+            # head_object may be denied where get_object is not, a one byte range tells the size
+            return read_first_range(self._client, self.bucket_name, self.prefix, 1)[1]
 
     def exists(self) -> bool:
+        cache = get_metadata_cache()
+        if cache is not None:
+            cached = cache.get(self._path, "exists")
+            if cached is not MISSING:
+                return cached
+
+        exists = False
         try:
-            self._client.head_object(Bucket=self.bucket_name, Key=self.prefix)
-            return True
-        except:
-            # if there is a permission error for head_object
+            self._head()
+            exists = True
+        except Exception as e:
+            if error_code(e) not in FORBIDDEN_CODES + NOT_FOUND_CODES:
+                raise
+            # head_object may be denied where get_object is not
             try:
-                self._client.get_object(Bucket=self.bucket_name, Key=self.prefix)
-                return True
-            except:
-                pass
-        return False
-
-    def write_text(self, content: str, mode, *args, **kwargs):
-        self._client.put_object(
-            Bucket=self.bucket_name,
-            Key=self.prefix,
-            Body=content.encode('urf-8')
-        )
+                read_first_range(self._client, self.bucket_name, self.prefix, 1)
+                exists = True
+            except Exception as e:
+                if error_code(e) not in FORBIDDEN_CODES + NOT_FOUND_CODES:
+                    raise
+
+        if cache is not None:
+            cache.set(self._path, "exists", exists)
+        return exists
+
+    def write_text(self, content: str, mode, encoding="utf-8", *args, **kwargs):
+        self.write_bytes(content.encode(encoding), mode)
 
     def write_bytes(self, content: bytes, mode, encoding="utf-8", *args, **kwargs):
-        self._client.put_object(
-            Bucket=self.bucket_name,
-            Key=self.prefix,
-            Body=content
-        )
+        """
+        :param content: bytes-like, e.g. a PosixFile.read_view, uploaded part by part without
+            copying it into an intermediate buffer
+        """
+        if len(content) <= self.transfer_config.multipart_threshold:
+            self._client.put_object(
+                Bucket=self.bucket_name,
+                Key=self.prefix,
+                Body=request_body(content),
+            )
+        else:
+            with MultipartWriter(
+                    self._client,
+                    self.bucket_name,
+                    self.prefix,
+                    config=self.transfer_config,
+                    size=len(content),
+            ) as writer:
+                # the writer is closed before returning, content cannot change in the meantime
+                writer.write(content, keep_reference=True)
+        self._invalidate_metadata()
 
     def touch(self, *args, **kwargs):
         pass
@@ -56,22 +160,135 @@ class S3File(S3Object, File):
             print(f'Deleting: s3://{self.bucket_name}/{self.prefix}')
             return
         self._client.delete_object(Bucket=self.bucket_name, Key=self.prefix)
+        self._invalidate_metadata()
+
+    def open(
+            self, mode: str = "rb", encoding: Optional[str] = None, *args, size: Optional[int] = None, **kwargs
+    ) -> IO:
+        """
+        Buffered stream over the object, reads prefetch ranged GETs ahead of the position
+        and writes go through a multipart upload completed on close
+        :param mode: one of r, rb, w, wb
+        :param size: object size when already known (e.g. from a listing), otherwise it comes
+            with the first ranged GET
+        """
+        return open_object(
+            self._client,
+            self.bucket_name,
+            self.prefix,
+            mode=mode,
+            encoding=encoding,
+            size=size,
+            config=self.transfer_config,
+            on_complete=self._invalidate_metadata,
+        )
+
+    def read_text(self, encoding="utf-8", size: Optional[int] = None):
+        return self.read_bytes(size=size).decode(encoding)
+
+    def read_bytes(self, size: Optional[int] = None):
+        """
+        :param size: object size when already known (e.g. from a listing), small objects are
+            then read with a plain get_object; otherwise the first ranged GET tells the size
+        """
+        content_cache = get_content_cache()
+        if content_cache is not None:
+            return content_cache.read_bytes(self)
+        return read_object(
+            self._client, self.bucket_name, self.prefix, size, config=self.transfer_config
+        )
+
+    def read_mmap(self) -> mmap.mmap:
+        """Read-only memory map of the object's copy in the content cache (see enable_content_cache)"""
+        content_cache = get_content_cache()
+        if content_cache is None:
+            raise RuntimeError("read_mmap requires the content cache, see enable_content_cache")
+        return content_cache.mmap(self)
+
+    def read_range(self, offset: int, length: int) -> bytes:
+        return read_range(self._client, self.bucket_name, self.prefix, offset, length)
 
-    def read_text(self):
-        response = self._client.get_object(Bucket=self.bucket_name, Key=self.prefix)
-        return response['Body'].read().decode('utf-8')
+    def readinto(self, buffer, offset: int = 0) -> int:
+        """
+        Read the object from offset into a caller provided writable buffer, until the buffer is
+        full or the end of the object, with parallel ranged GETs for large buffers
+        :return: number of bytes read
+        """
+        length = min(memoryview(buffer).nbytes, max(self.size() - offset, 0))
+        view = memoryview(buffer).cast("B")[:length]
+        return read_object_into(
+            self._client, self.bucket_name, self.prefix, view, offset, config=self.transfer_config
+        )
+
+    def iter_chunks(
+            self, offset: int = 0, size: Optional[int] = None, etag: Optional[str] = None
+    ) -> Iterator[bytes]:
+        """
+        Stream the object in transfer_config.part_size chunks using parallel ranged GETs,
+        holding at most transfer_config.max_concurrency chunks in memory
+        :param size: object size when already known, otherwise it comes with the first chunk
+        :param etag: ETag every chunk must have, the first chunk's by default
+        """
+        yield from iter_object_chunks(
+            self._client,
+            self.bucket_name,
+            self.prefix,
+            size,
+            config=self.transfer_config,
+            offset=offset,
+            if_match=etag,
+        )
 
-    def read_bytes(self):
-        response = self._client.get_object(Bucket=self.bucket_name, Key=self.prefix)
-        return response['Body'].read()
+    def checksum(self, algorithm: str = "sha256", use_metadata: bool = True, *args, **kwargs) -> str:
+        return self.checksums((algorithm,), use_metadata=use_metadata)[algorithm]
 
-    def checksum(self, *args, **kwargs) -> str:
-        content = self.read_bytes()
-        digest = hashlib.file_digest(BytesIO(content), "sha256")
-        return digest.hexdigest()
+    def checksums(
+            self, algorithms: Sequence[str] = ("sha256",), use_metadata: bool = True, *args, **kwargs
+    ) -> dict:
+        """
+        Digests of the object, streamed in chunks and computed in a single pass
+        :param use_metadata: take digests from head_object (full object Checksum* values, or the
+            ETag for md5 of single part uploads without SSE-KMS/SSE-C) instead of downloading
+        """
+        result = dict()
+        head = dict()
+        if use_metadata:
+            try:
+                head = self._head(checksum_mode=True)
+                result = metadata_checksums(head, algorithms)
+            except Exception:
+                # no permission for head_object, or checksum mode not supported by the endpoint
+                result = dict()
+
+        missing = [algorithm for algorithm in algorithms if algorithm not in result]
+        if missing:
+            chunks = self.iter_chunks(size=head.get("ContentLength"), etag=head.get("ETag"))
+            result.update(digest_chunks(chunks, missing))
+        return result
 
     def duplicate(self, dst: "File"):
-        raise NotImplementedError
+        """
+        Copy to dst, server-side (copy_object / upload_part_copy) when dst is an S3File,
+        streamed download when it is a PosixFile
+        """
+        from ufs.posix.posix_file import PosixFile
+
+        if isinstance(dst, S3File):
+            copy_object(
+                self._client,
+                self.bucket_name,
+                self.prefix,
+                dst.bucket_name,
+                dst.prefix,
+                self.size(),
+                config=self.transfer_config,
+            )
+            dst._invalidate_metadata()
+        elif isinstance(dst, PosixFile):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            self._download(dst)
+        else:
+            raise NotImplementedError
 
     def copy_to(self, dst: "Directory"):
-        raise NotImplementedError
+        return self.duplicate(dst.join_as_file(self.basename()))
@@ -0,0 +1,408 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from ufs.base import FileEntry
+from ufs.s3.s3_common import iter_list_pages
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    etag TEXT,
+    generation INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stale (
+    prefix TEXT PRIMARY KEY,
+    marked_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+_BATCH_SIZE = 10000
+
+
+def _prefix_range(prefix: str) -> Tuple[str, list]:
+    """SQL condition (and parameters) selecting the keys starting with prefix, as an index range"""
+    if not prefix:
+        return "1", list()
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return "key >= ? AND key < ?", [prefix, upper]
+
+
+class S3Manifest:
+    """
+    Persistent index (sqlite file) of the objects below an S3Directory: key, size, mtime, etag
+    Answers counts, sizes, listings and globs locally; the answers are as of the last refresh.
+    Several processes can share the file, readers are not blocked by a refresh (WAL journal,
+    S3 is listed outside of any transaction and rows are written in short batches).
+    Writes through ufs mark the keys they touch as stale (see invalidate_manifests), stale
+    parts of the directory are not answered from the index until the next refresh.
+    """
+
+    def __init__(self, directory: "S3Directory", path: str):
+        self.directory = directory
+        self.path = path
+        self.bucket_name = directory.bucket_name
+        self.prefix = directory.prefix
+        if self.prefix and not self.prefix.endswith("/"):
+            self.prefix += "/"
+        self._root = f"{directory._protocol}{self.bucket_name}/{self.prefix}"
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+
+        source = self._meta("source")
+        if source is None:
+            self._write([(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                [("source", f"{self.bucket_name}/{self.prefix}")],
+            )])
+        elif source != f"{self.bucket_name}/{self.prefix}":
+            raise RuntimeError(f"Manifest {path} indexes s3://{source}, not {self._root}")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> "S3Manifest":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _meta(self, name: str):
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return None if row is None else row[0]
+
+    @property
+    def refreshed_at(self) -> Optional[float]:
+        """Time (seconds since epoch) of the last refresh, None if never refreshed"""
+        return self._meta("refreshed_at")
+
+    def _rows(self, prefix: str, start_after: Optional[str] = None) -> Iterator[tuple]:
+        client = self.directory._client
+        for response in iter_list_pages(
+                client, self.bucket_name, self.prefix + prefix, start_after=start_after
+        ):
+            # "directory/" marker objects are kept, live listings count them too
+            for content in response.get("Contents", []):
+                yield (
+                    content["Key"][len(self.prefix):],
+                    content["Size"],
+                    content["LastModified"].timestamp(),
+                    content["ETag"].strip('"'),
+                )
+
+    def _write(self, queries: Iterable[Tuple[str, Iterable]]):
+        """One short write transaction, under the connection lock"""
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for query, params in queries:
+                    connection.executemany(query, params)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def _insert(self, rows: Iterator[tuple], generation: int) -> int:
+        # rows come from a paginated listing, the lock is only taken to write each batch
+        query = "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?)"
+        count = 0
+        batch = list()
+        for row in rows:
+            batch.append(row + (generation,))
+            if len(batch) >= _BATCH_SIZE:
+                self._write([(query, batch)])
+                count += len(batch)
+                batch = list()
+        if batch:
+            self._write([(query, batch)])
+        return count + len(batch)
+
+    def _relist(self, prefix: str, generation: int) -> int:
+        """List prefix completely, then drop its rows that were not listed (deleted objects)"""
+        listed = self._insert(self._rows(prefix), generation)
+        condition, params = _prefix_range(prefix)
+        self._write([(
+            f"DELETE FROM objects WHERE {condition} AND generation < ?", [params + [generation]]
+        )])
+        return listed
+
+    def mark_stale(self, prefix: str = ""):
+        """
+        Record that the objects below prefix (relative to the directory, a key or a sub-directory)
+        changed, they are listed again by the next refresh and not answered from the index until then
+        """
+        self._write([(
+            "INSERT OR REPLACE INTO stale (prefix, marked_at) VALUES (?, ?)", [(prefix, time.time())]
+        )])
+
+    def is_stale(self, prefix: str = "") -> bool:
+        """Whether anything below prefix (or containing it) changed since the last refresh"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM stale WHERE substr(?, 1, length(prefix)) = prefix "
+                "OR substr(prefix, 1, length(?)) = ? LIMIT 1",
+                (prefix, prefix, prefix),
+            ).fetchone()
+        return row is not None
+
+    def refresh(self, partitions: Optional[Iterable[str]] = None, full: bool = False) -> int:
+        """
+        Bring the index up to date, the first refresh always lists the whole directory
+        By default only the keys after the last indexed one are listed (StartAfter), which picks up
+        every new object of an append-only prefix whose keys grow in order (dated, sequenced).
+        :param partitions: sub-prefixes (relative to the directory) re-listed completely, e.g.
+            the partitions rewritten since the last refresh; deleted objects are dropped from them
+        :param full: re-list the whole directory, dropping deleted objects
+        The prefixes marked stale before the refresh started are always re-listed.
+        :return: number of objects listed
+        """
+        with self._refresh_lock:
+            started_at = time.time()
+            with self._lock:
+                connection = self._connection
+                last_key = connection.execute("SELECT MAX(key) FROM objects").fetchone()[0]
+                stale = [row[0] for row in connection.execute("SELECT prefix FROM stale")]
+                generation = connection.execute(
+                    "SELECT COALESCE(MAX(generation), 0) + 1 FROM objects"
+                ).fetchone()[0]
+
+            if full or last_key is None or "" in stale:
+                listed = self._relist("", generation)
+            else:
+                listed = 0
+                relisted = set()
+                for partition in sorted([*(partitions or ()), *stale], key=len):
+                    partition = partition.lstrip("/")
+                    # a partition inside one already re-listed is covered by it
+                    if not any(partition.startswith(done) for done in relisted):
+                        listed += self._relist(partition, generation)
+                        relisted.add(partition)
+                if partitions is None:
+                    listed += self._insert(
+                        self._rows("", start_after=self.prefix + last_key), generation
+                    )
+
+            # the directory totals are kept, so that file_count() and size() are lookups
+            with self._lock:
+                count, size = self._connection.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects"
+                ).fetchone()
+            self._write([
+                (
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                    dict(file_count=count, size=size, refreshed_at=time.time()).items(),
+                ),
+                # marks made while listing are kept, they may not have been seen
+                ("DELETE FROM stale WHERE marked_at < ?", [(started_at,)]),
+            ])
+        return listed
+
+    def _aggregate(self, expression: str, prefix: str):
+        condition, params = _prefix_range(prefix)
+        with self._lock:
+            return self._connection.execute(
+                f"SELECT {expression} FROM objects WHERE {condition}", params
+            ).fetchone()[0]
+
+    def file_count(self, prefix: str = "") -> int:
+        """:param prefix: relative to the directory, e.g. "year=2024/" """
+        if not prefix:
+            return self._meta("file_count") or 0
+        return self._aggregate("COUNT(*)", prefix)
+
+    def size(self, prefix: str = "") -> int:
+        if not prefix:
+            return self._meta("size") or 0
+        return self._aggregate("COALESCE(SUM(size), 0)", prefix)
+
+    def exists(self, prefix: str = "") -> bool:
+        """Whether any object is indexed below prefix"""
+        condition, params = _prefix_range(prefix)
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT 1 FROM objects WHERE {condition} LIMIT 1", params
+            ).fetchone()
+        return row is not None
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            row = self._connection.execute("SELECT 1 FROM objects WHERE key = ?", (key,)).fetchone()
+        return row is not None
+
+    def _select(self, conditions: List[str], params: list) -> Iterator[tuple]:
+        # fetched in batches, so that the lock is not held while the caller consumes the rows
+        last_key = None
+        while True:
+            batch_conditions, batch_params = conditions, params
+            if last_key is not None:
+                batch_conditions = conditions + ["key > ?"]
+                batch_params = params + [last_key]
+            query = (
+                "SELECT key, size, mtime, etag FROM objects WHERE "
+                + " AND ".join(batch_conditions)
+                + f" ORDER BY key LIMIT {_BATCH_SIZE}"
+            )
+            with self._lock:
+                rows = self._connection.execute(query, batch_params).fetchall()
+            yield from rows
+            if len(rows) < _BATCH_SIZE:
+                return
+            last_key = rows[-1][0]
+
+    def _to_entry(self, row: tuple) -> FileEntry:
+        return FileEntry(self._root + row[0], row[1], row[2], row[3])
+
+    def iter_entries(self, prefix: str = "", limit: int = -1) -> Iterator[FileEntry]:
+        """FileEntry of the indexed objects below prefix, in key order, like a recursive listing"""
+        condition, params = _prefix_range(prefix)
+        for row in self._select([condition], params):
+            yield self._to_entry(row)
+            limit -= 1
+            if limit == 0:
+                return
+
+    def find(
+            self,
+            pattern: str = "**",
+            predicate: Optional[Callable[[FileEntry], bool]] = None,
+            min_size: Optional[int] = None,
+            max_size: Optional[int] = None,
+            modified_after: Union[float, datetime, None] = None,
+            modified_before: Union[float, datetime, None] = None,
+            max_depth: int = -1,
+            limit: int = -1,
+            prefix: str = "",
+    ) -> Iterator[FileEntry]:
+        """
+        See DirectoryPrefix.find, in key order. The literal part of the pattern and the size and
+        time bounds are answered by the index, the rest of the pattern and predicate in Python.
+        :param prefix: sub-directory (relative to the directory) the pattern is relative to
+        """
+        from ufs.pattern import GlobPattern, literal_prefix
+
+        matcher = GlobPattern(pattern)
+        if isinstance(modified_after, datetime):
+            modified_after = modified_after.timestamp()
+        if isinstance(modified_before, datetime):
+            modified_before = modified_before.timestamp()
+
+        condition, params = _prefix_range(prefix + literal_prefix(matcher.pattern))
+        conditions = [condition]
+        for bound, value in (
+                ("size >= ?", min_size),
+                ("size <= ?", max_size),
+                ("mtime > ?", modified_after),
+                ("mtime < ?", modified_before),
+        ):
+            if value is not None:
+                conditions.append(bound)
+                params.append(value)
+
+        for row in self._select(conditions, params):
+            relative_path = row[0][len(prefix):]
+            # like the live glob, "directory/" marker objects are not files
+            if relative_path.endswith("/"):
+                continue
+            if 0 <= max_depth < relative_path.count("/") or not matcher.match(relative_path):
+                continue
+            entry = self._to_entry(row)
+            if predicate is None or predicate(entry):
+                yield entry
+                limit -= 1
+                if limit == 0:
+                    return
+
+    def glob(self, pattern: str, limit: int = -1, prefix: str = "", **kwargs) -> Iterator[str]:
+        for entry in self.find(pattern, limit=limit, prefix=prefix, **kwargs):
+            yield entry.path
+
+
+_manifests: Dict[Tuple[str, str], S3Manifest] = dict()
+_manifests_lock = threading.Lock()
+
+
+def enable_manifest(directory: "S3Directory", path: str, refresh: bool = True) -> S3Manifest:
+    """
+    Open (or create) the manifest file of directory, S3Directory calls given use_manifest=True
+    (file_count, size, exists, recursive listings, glob and find) of the directory and its
+    sub-directories are then answered from it, except for the parts marked stale
+    :param refresh: refresh the index now, incrementally when the file already has one
+    """
+    manifest = S3Manifest(directory, path)
+    if refresh:
+        manifest.refresh()
+    with _manifests_lock:
+        previous = _manifests.get((manifest.bucket_name, manifest.prefix))
+        _manifests[(manifest.bucket_name, manifest.prefix)] = manifest
+    if previous is not None:
+        previous.close()
+    return manifest
+
+
+def disable_manifest(directory: "S3Directory"):
+    prefix = directory.prefix
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    with _manifests_lock:
+        manifest = _manifests.pop((directory.bucket_name, prefix), None)
+    if manifest is not None:
+        manifest.close()
+
+
+def get_manifest(directory: "S3Directory") -> Optional[Tuple[S3Manifest, str]]:
+    """
+    The enabled manifest covering directory (the one of the closest parent), with the directory's
+    prefix relative to it, None when there is none or the directory changed since its last refresh
+    """
+    if not _manifests:
+        return None
+    bucket_name = directory.bucket_name
+    prefix = directory.prefix
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    with _manifests_lock:
+        candidates = [
+            (manifest_prefix, manifest)
+            for (manifest_bucket, manifest_prefix), manifest in _manifests.items()
+            if manifest_bucket == bucket_name and prefix.startswith(manifest_prefix)
+        ]
+    if not candidates:
+        return None
+    manifest_prefix, manifest = max(candidates, key=lambda candidate: len(candidate[0]))
+    relative_prefix = prefix[len(manifest_prefix):]
+    if manifest.is_stale(relative_prefix):
+        return None
+    return manifest, relative_prefix
+
+
+def invalidate_manifests(bucket_name: str, key: str, is_directory: bool):
+    """Mark what a write to key (a directory prefix when is_directory) changed in the enabled manifests"""
+    if not _manifests:
+        return
+    if is_directory and key and not key.endswith("/"):
+        key += "/"
+    with _manifests_lock:
+        manifests = [
+            (manifest_prefix, manifest)
+            for (manifest_bucket, manifest_prefix), manifest in _manifests.items()
+            if manifest_bucket == bucket_name
+        ]
+    for manifest_prefix, manifest in manifests:
+        if key.startswith(manifest_prefix):
+            manifest.mark_stale(key[len(manifest_prefix):])
+        elif is_directory and manifest_prefix.startswith(key):
+            # the whole manifest directory is below the changed one
+            manifest.mark_stale("")
@@ -0,0 +1,220 @@
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from ufs.s3.s3_transfer import (
+    DEFAULT_TRANSFER_CONFIG,
+    MultipartWriter,
+    S3TransferConfig,
+    read_first_range,
+    read_range,
+)
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Seekable raw reader over ranged GETs
+    Sequential reads keep up to max_concurrency part_size chunks prefetched ahead of the
+    current position, a seek outside of the prefetched window discards it.
+    Without a known size, the first chunk is read with one ranged GET telling the size and ETag,
+    and the following chunks are requested for that ETag.
+    """
+
+    def __init__(
+            self,
+            s3_client,
+            bucket_name: str,
+            key: str,
+            size: Optional[int] = None,
+            config: S3TransferConfig = DEFAULT_TRANSFER_CONFIG,
+    ):
+        super().__init__()
+        self._client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.size = size
+        self.config = config
+        self._etag = None
+
+        self._pos = 0
+        self._chunk = memoryview(b"")
+        self._chunk_offset = 0
+        self._window = deque()
+        self._executor = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            if self.size is None:
+                head = self._client.head_object(Bucket=self.bucket_name, Key=self.key)
+                self.size = head["ContentLength"]
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError(f"Negative seek position: {pos}")
+        self._pos = pos
+        return pos
+
+    def _fetch(self, offset: int):
+        length = min(self.config.part_size, self.size - offset)
+        future = self._executor.submit(
+            read_range, self._client, self.bucket_name, self.key, offset, length, self._etag
+        )
+        self._window.append((offset, future))
+
+    def _load_chunk(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.config.max_concurrency)
+
+        # drop prefetched chunks entirely behind the current position
+        while self._window and self._window[0][0] + self.config.part_size <= self._pos:
+            self._window.popleft()[1].cancel()
+        if not self._window or self._window[0][0] > self._pos:
+            for _, future in self._window:
+                future.cancel()
+            self._window.clear()
+            self._fetch(self._pos)
+
+        offset, future = self._window.popleft()
+        self._chunk = memoryview(future.result())
+        self._chunk_offset = offset
+        self._prefetch()
+
+    def _prefetch(self):
+        next_offset = self._chunk_offset + len(self._chunk)
+        if self._window:
+            next_offset = self._window[-1][0] + self.config.part_size
+        while len(self._window) < self.config.max_concurrency and next_offset < self.size:
+            self._fetch(next_offset)
+            next_offset += self.config.part_size
+
+    def _load_first_chunk(self):
+        data, self.size, self._etag = read_first_range(
+            self._client, self.bucket_name, self.key, self.config.part_size, self._pos
+        )
+        self._chunk = memoryview(data)
+        self._chunk_offset = self._pos
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.config.max_concurrency)
+        self._prefetch()
+
+    def readinto(self, buffer) -> int:
+        if self.size is None:
+            self._load_first_chunk()
+        if self._pos >= self.size:
+            return 0
+
+        start = self._pos - self._chunk_offset
+        if not 0 <= start < len(self._chunk):
+            self._load_chunk()
+            start = self._pos - self._chunk_offset
+
+        length = min(len(buffer), len(self._chunk) - start)
+        memoryview(buffer).cast("B")[:length] = self._chunk[start:start + length]
+        self._pos += length
+        return length
+
+    def close(self):
+        if self._executor is not None:
+            for _, future in self._window:
+                future.cancel()
+            self._window.clear()
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._chunk = memoryview(b"")
+        super().close()
+
+
+class S3MultipartRawWriter(io.RawIOBase):
+    """Raw writer feeding a MultipartWriter, the object is completed on close"""
+
+    def __init__(self, writer: MultipartWriter):
+        super().__init__()
+        self._writer = writer
+        self.aborted = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.aborted:
+            return len(memoryview(data))
+        return self._writer.write(data)
+
+    def abort(self):
+        self.aborted = True
+        self._writer.abort()
+
+    def close(self):
+        if not self.closed and not self.aborted:
+            self._writer.close()
+        super().close()
+
+
+class S3BufferedWriter(io.BufferedWriter):
+    """Buffered writer that aborts the multipart upload when its with-block raises"""
+
+    def abort(self):
+        self.raw.abort()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.abort()
+        return super().__exit__(exc_type, exc_val, exc_tb)
+
+
+class S3TextWriter(io.TextIOWrapper):
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.buffer.abort()
+        return super().__exit__(exc_type, exc_val, exc_tb)
+
+
+def open_object(
+        s3_client,
+        bucket_name: str,
+        key: str,
+        mode: str = "rb",
+        encoding: Optional[str] = None,
+        size: Optional[int] = None,
+        config: S3TransferConfig = DEFAULT_TRANSFER_CONFIG,
+        on_complete: Optional[Callable[[], None]] = None,
+):
+    """
+    :param mode: one of r, rb, w, wb
+    :param size: object size when known, read modes otherwise learn it from the first ranged GET
+    :param on_complete: called once a written object has been completed
+    """
+    text = "b" not in mode
+    flags = mode.replace("b", "").replace("t", "")
+
+    if flags == "r":
+        raw = S3RangeReader(s3_client, bucket_name, key, size, config=config)
+        stream = io.BufferedReader(raw)
+        if text:
+            return io.TextIOWrapper(stream, encoding=encoding or "utf-8")
+        return stream
+    elif flags == "w":
+        writer = MultipartWriter(
+            s3_client, bucket_name, key, config=config, on_complete=on_complete
+        )
+        stream = S3BufferedWriter(S3MultipartRawWriter(writer))
+        if text:
+            return S3TextWriter(stream, encoding=encoding or "utf-8")
+        return stream
+
+    raise RuntimeError(f"Un-supported mode = {mode}")
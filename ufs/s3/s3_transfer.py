@@ -0,0 +1,683 @@
+import io
+import json
+import os
+import shutil
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, Optional, Tuple
+
+MB = 1024 * 1024
+# S3 limits for multipart uploads and single request copies
+MIN_PART_SIZE = 5 * MB
+MAX_PARTS = 10000
+MAX_COPY_OBJECT_SIZE = 5 * 1024 * MB
+
+
+class S3TransferConfig:
+    """
+    Tuning for single-object S3 transfers
+    :param part_size: size of each ranged GET and each multipart upload part
+    :param max_concurrency: number of parts transferred at the same time
+    :param multipart_threshold: objects larger than this use ranged / multipart transfers
+    """
+
+    def __init__(
+            self,
+            part_size: int = 8 * MB,
+            max_concurrency: int = 8,
+            multipart_threshold: int = 16 * MB,
+    ):
+        if part_size < 1:
+            raise RuntimeError(f"Invalid part_size: {part_size}")
+        if max_concurrency < 1:
+            raise RuntimeError(f"Invalid max_concurrency: {max_concurrency}")
+
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.multipart_threshold = multipart_threshold
+
+    def upload_part_size(self, size: Optional[int] = None) -> int:
+        """Part size honouring S3 minimum part size and maximum number of parts"""
+        part_size = max(self.part_size, MIN_PART_SIZE)
+        if size is not None and size > part_size * MAX_PARTS:
+            part_size = -(-size // MAX_PARTS)
+        return part_size
+
+
+DEFAULT_TRANSFER_CONFIG = S3TransferConfig()
+
+
+def iter_ranges(size: int, part_size: int) -> Iterator[Tuple[int, int]]:
+    for offset in range(0, size, part_size):
+        yield offset, min(part_size, size - offset)
+
+
+def _get_kwargs(bucket_name: str, key: str, if_match: Optional[str] = None, **kwargs) -> dict:
+    kwargs.update(Bucket=bucket_name, Key=key)
+    if if_match:
+        # listings strip the quotes of ETags, If-Match wants them
+        kwargs["IfMatch"] = if_match if if_match.startswith('"') else f'"{if_match}"'
+    return kwargs
+
+
+def _object_size(response: dict) -> int:
+    """Size of the whole object, from the ContentRange ("bytes 0-99/1234") of a ranged GET"""
+    content_range = response.get("ContentRange")
+    if content_range:
+        return int(content_range.rsplit("/", 1)[1])
+    return response["ContentLength"]
+
+
+def read_range(
+        s3_client,
+        bucket_name: str,
+        key: str,
+        offset: int,
+        length: int,
+        if_match: Optional[str] = None,
+) -> bytes:
+    """:param if_match: ETag the object must still have, fails with 412 PreconditionFailed otherwise"""
+    if length <= 0:
+        return b""
+    response = s3_client.get_object(
+        **_get_kwargs(
+            bucket_name, key, if_match, Range=f"bytes={offset}-{offset + length - 1}"
+        )
+    )
+    return response["Body"].read()
+
+
+def read_first_range(
+        s3_client,
+        bucket_name: str,
+        key: str,
+        length: int,
+        offset: int = 0,
+        if_match: Optional[str] = None,
+) -> Tuple[bytes, int, str]:
+    """
+    Up to length bytes of an object from offset with one ranged GET, which also tells the object's
+    size and ETag: reads of unknown size start with it instead of a head_object
+    :return: (data, object size, ETag)
+    """
+    from ufs.s3.s3_common import error_code
+
+    try:
+        response = s3_client.get_object(
+            **_get_kwargs(bucket_name, key, if_match, Range=f"bytes={offset}-{offset + length - 1}")
+        )
+    except Exception as e:
+        # empty object, or offset past its end
+        if error_code(e) not in ("416", "InvalidRange"):
+            raise
+        head = s3_client.head_object(**_get_kwargs(bucket_name, key, if_match))
+        return b"", head["ContentLength"], head["ETag"]
+    return response["Body"].read(), _object_size(response), response["ETag"]
+
+
+def iter_object_chunks(
+        s3_client,
+        bucket_name: str,
+        key: str,
+        size: Optional[int] = None,
+        config: S3TransferConfig = DEFAULT_TRANSFER_CONFIG,
+        offset: int = 0,
+        if_match: Optional[str] = None,
+) -> Iterator[bytes]:
+    """
+    Stream an object in part_size chunks fetched with parallel ranged GETs
+    At most max_concurrency chunks are held in memory at any time.
+    :param size: object size when known, otherwise it comes with the first chunk and the other
+        chunks are requested for the same ETag
+    :param if_match: ETag the object must keep, fails with 412 PreconditionFailed otherwise
+    """
+    if size is None:
+        first, size, etag = read_first_range(
+            s3_client, bucket_name, key, config.part_size, offset, if_match
+        )
+        if first:
+            yield first
+        offset += len(first)
+        if_match = if_match or etag
+
+    ranges = iter_ranges(size - offset, config.part_size)
+    with ThreadPoolExecutor(max_workers=config.max_concurrency) as executor:
+        window = deque()
+        try:
+            for start, length in ranges:
+                window.append(
+                    executor.submit(
+                        read_range, s3_client, bucket_name, key, offset + start, length, if_match
+                    )
+                )
+                if len(window) >= config.max_concurrency:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+        finally:
+            for future in window:
+                future.cancel()
+
+
+def read_object_into(
+        s3_client,
+        bucket_name: str,
+        key: str,
+        buffer,
+        offset: int = 0,
+        config: S3TransferConfig = DEFAULT_TRANSFER_CONFIG,
+        if_match: Optional[str] = None,
+) -> int:
+    """
+    Read len(buffer) bytes of an object from offset into a caller provided writable buffer,
+    with parallel ranged GETs above the multipart threshold
+    :return: number of bytes read
+    """
+    view = memoryview(buffer).cast("B")
+    length = len(view)
+    if length <= config.multipart_threshold:
+        data = read_range(s3_client, bucket_name, key, offset, length, if_match)
+        view[:len(data)] = data
+        return len(data)
+
+    def fetch(part: Tuple[int, int]) -> int:
+        start, part_length = part
+        data = read_range(s3_client, bucket_name, key, offset + start, part_length, if_match)
+        view[start:start + len(data)] = data
+        return len(data)
+
+    with ThreadPoolExecutor(max_workers=config.max_concurrency) as executor:
+        futures = [executor.submit(fetch, part) for part in iter_ranges(length, config.part_size)]
+        return sum(future.result() for future in futures)
+
+
+def read_object(
+        s3_client,
+        bucket_name: str,
+        key: str,
+        size: Optional[int] = None,
+        config: S3TransferConfig = DEFAULT_TRANSFER_CONFIG,
+) -> bytes:
+    """
+    Read a whole object, using parallel ranged GETs above the multipart threshold
+    :param size: object size when known (e.g. from a listing), otherwise the first part_size bytes
+        are read with one ranged GET telling the size, and the rest only for larger objects
+    """
+    if size is not None and size <= config.multipart_threshold:
+        response = s3_client.get_object(Bucket=bucket_name, Key=key)
+        return response["Body"].read()
+
+    first, etag = b"", None
+    if size is None:
+        first, size, etag = read_first_range(s3_client, bucket_name, key, config.part_size)
+        if len(first) >= size:
+            return first
+
+    buffer = bytearray(size)
+    buffer[:len(first)] = first
+    # the remaining parts must come from the same version as the first one
+    read_object_into(
+        s3_client, bucket_name, key, memoryview(buffer)[len(first):], len(first), config, etag
+    )
+    return bytes(buffer)
+
+
+class _ViewBody(io.RawIOBase):
+    """Seekable read-only stream over a memoryview, handed out in read sized copies"""
+
+    def __init__(self, view: memoryview):
+        super().__init__()
+        self._view = view
+        self._position = 0
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += len(self._view)
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        data = self._view[self._position:self._position + len(buffer)]
+        memoryview(buffer).cast("B")[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else self._position + size
+        data = bytes(self._view[self._position:end])
+        self._position += len(data)
+        return data
+
+
+def request_body(data):
+    """
+    Body argument for put_object / upload_part: bytes and bytearray as they are, other buffers
+    (memoryviews, mmaps) through a stream rather than a full copy
+    """
+    if isinstance(data, (bytes, bytearray)):
+        return data
+    return _ViewBody(memoryview(data).cast("B"))
+
+
+class MultipartWriter:
+    """
+    Write-only sink uploading an object in parts, with up to max_concurrency parts in flight
+    Falls back to a single put_object when less than one part has been written.
+    """
+
+    def __init__(
+            self,
+            s3_client,
+            bucket_name: str,
+            key: str,
+            config: S3TransferConfig = DEFAULT_TRANSFER_CONFIG,
+            size: Optional[int] = None,
+            on_complete: Optional[Callable[[], None]] = None,
+    ):
+        self._client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.config = config
+        self.part_size = config.upload_part_size(size)
+
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._executor = None
+        self._in_flight = set()
+        self._parts = dict()
+        self._next_part_number = 1
+        self._on_complete = on_complete
+        self.bytes_written = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _upload_part(self, part_number: int, data) -> Tuple[int, str]:
+        response = self._client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=request_body(data),
+        )
+        return part_number, response["ETag"]
+
+    def _collect(self, done):
+        for future in done:
+            self._in_flight.discard(future)
+            part_number, etag = future.result()
+            self._parts[part_number] = etag
+
+    def _submit(self, data):
+        if self._upload_id is None:
+            response = self._client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key
+            )
+            self._upload_id = response["UploadId"]
+            self._executor = ThreadPoolExecutor(max_workers=self.config.max_concurrency)
+
+        if len(self._in_flight) >= self.config.max_concurrency:
+            done, _ = wait(self._in_flight, return_when=FIRST_COMPLETED)
+            self._collect(done)
+
+        future = self._executor.submit(self._upload_part, self._next_part_number, data)
+        self._in_flight.add(future)
+        self._next_part_number += 1
+
+    def write(self, data, keep_reference: Optional[bool] = None) -> int:
+        """
+        :param keep_reference: the caller does not modify data before close(), so whole parts are
+            uploaded from it without a copy. Defaults to True for bytes only: a read-only view may
+            still be over a mutable buffer reused once write() returns (io.BufferedWriter does)
+        """
+        if keep_reference is None:
+            keep_reference = isinstance(data, bytes)
+        if self.closed:
+            raise ValueError("write to closed MultipartWriter")
+
+        data = memoryview(data).cast("B")
+        length = len(data)
+        self.bytes_written += length
+
+        if keep_reference and not self._buffer:
+            # whole parts straight from the caller's bytes, without copying them into our buffer
+            while len(data) >= self.part_size:
+                self._submit(data[:self.part_size])
+                data = data[self.part_size:]
+
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            self._submit(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return length
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if self._upload_id is None:
+                self._client.put_object(
+                    Bucket=self.bucket_name, Key=self.key, Body=bytes(self._buffer)
+                )
+            else:
+                if self._buffer:
+                    self._submit(bytes(self._buffer))
+                self._collect(wait(self._in_flight).done)
+                self._client.complete_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload=dict(
+                        Parts=[
+                            dict(PartNumber=number, ETag=self._parts[number])
+                            for number in sorted(self._parts)
+                        ]
+                    ),
+                )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            self.closed = True
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+
+        if self._on_complete is not None:
+            self._on_complete()
+
+    def abort(self):
+        self.closed = True
+        self._buffer = bytearray()
+        for future in self._in_flight:
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        if self._upload_id is not None:
+            self._client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id
+            )
+            self._upload_id = None
+
+
+def _list_parts(s3_client, bucket_name: str, key: str, upload_id: str) -> Iterator[dict]:
+    kwargs = dict(Bucket=bucket_name, Key=key, UploadId=upload_id)
+    while True:
+        response = s3_client.list_parts(**kwargs)
+        yield from response.get("Parts", [])
+        if not response.get("IsTruncated"):
+            return
+        kwargs["PartNumberMarker"] = response["NextPartNumberMarker"]
+
+
+def _resume_multipart(s3_client, state_file: str, state: dict, ranges: list) -> Tuple[Optional[str], dict]:
+    """
+    Upload id and {part number: ETag} of the completed parts recorded by state_file, if it is
+    for the same upload (bucket, key, source and part size) and the upload still exists
+    """
+    from ufs.s3.s3_common import error_code
+
+    try:
+        with open(state_file) as f:
+            saved = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None, dict()
+
+    upload_id = saved.pop("upload_id", None)
+    if upload_id is None:
+        return None, dict()
+    if saved != state:
+        # stale upload of a previous version of the source, its parts are useless
+        try:
+            s3_client.abort_multipart_upload(Bucket=saved["bucket"], Key=saved["key"], UploadId=upload_id)
+        except Exception:
+            pass
+        return None, dict()
+
+    try:
+        listed = list(_list_parts(s3_client, state["bucket"], state["key"], upload_id))
+    except Exception as e:
+        if error_code(e) == "NoSuchUpload":
+            return None, dict()
+        raise
+    # the server's list is the source of truth, parts cut short are uploaded again
+    return upload_id, {
+        part["PartNumber"]: part["ETag"]
+        for part in listed
+        if 0 < part["PartNumber"] <= len(ranges) and part["Size"] == ranges[part["PartNumber"] - 1][1]
+    }
+
+
+def _save_state(state_file: str, state: dict):
+    from ufs.posix.posix_common import atomic_writer
+
+    with atomic_writer(state_file, "w") as f:
+        json.dump(state, f)
+
+
+def run_multipart(
+        s3_client,
+        bucket_name: str,
+        key: str,
+        size: int,
+        upload_part: Callable[[str, int, int, int], str],
+        config: S3TransferConfig = DEFAULT_TRANSFER_CONFIG,
+        state_file: Optional[str] = None,
+        source_id=None,
+        create_kwargs: Optional[dict] = None,
+):
+    """
+    Create a multipart upload, transfer its parts with up to max_concurrency in parallel and
+    complete it, or abort it when any part fails
+    :param upload_part: callable(upload_id, part_number, offset, length) returning the part ETag
+    :param state_file: local file recording the upload id, for a resumable upload: on failure the
+        upload is kept instead of aborted, and a later call with the same state file only transfers
+        the parts S3 does not have yet (list_parts). Removed once the upload completes.
+        Interrupted uploads keep their parts stored (and billed) until resumed or aborted,
+        an AbortIncompleteMultipartUpload lifecycle rule cleans up the abandoned ones.
+    :param source_id: JSON serializable identity of the source (e.g. size and mtime), a state file
+        recorded for another source is discarded and its upload aborted
+    :param create_kwargs: object attributes for create_multipart_upload, e.g. ContentType, Metadata
+    """
+    part_size = config.upload_part_size(size)
+    ranges = list(iter_ranges(size, part_size))
+    state = dict(bucket=bucket_name, key=key, size=size, part_size=part_size, source=source_id)
+
+    upload_id, completed = None, dict()
+    if state_file is not None:
+        upload_id, completed = _resume_multipart(s3_client, state_file, state, ranges)
+    if upload_id is None:
+        response = s3_client.create_multipart_upload(Bucket=bucket_name, Key=key, **(create_kwargs or {}))
+        upload_id = response["UploadId"]
+        if state_file is not None:
+            _save_state(state_file, dict(state, upload_id=upload_id))
+
+    def transfer(part: Tuple[int, Tuple[int, int]]) -> dict:
+        part_number, (offset, length) = part
+        etag = completed.get(part_number)
+        if etag is None:
+            etag = upload_part(upload_id, part_number, offset, length)
+        return dict(PartNumber=part_number, ETag=etag)
+
+    try:
+        with ThreadPoolExecutor(max_workers=config.max_concurrency) as executor:
+            parts = list(executor.map(transfer, enumerate(ranges, 1)))
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload=dict(Parts=parts),
+        )
+    except Exception:
+        if state_file is None:
+            s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+        raise
+
+    if state_file is not None:
+        try:
+            os.unlink(state_file)
+        except FileNotFoundError:
+            pass
+
+
+# head_object fields copy_object carries over to the copy, and upload_part_copy does not;
+# SSE-C objects cannot be copied without their key, so their fields are left out
+_COPIED_ATTRIBUTES = (
+    "CacheControl",
+    "ContentDisposition",
+    "ContentEncoding",
+    "ContentLanguage",
+    "ContentType",
+    "Expires",
+    "Metadata",
+    "ServerSideEncryption",
+    "SSEKMSKeyId",
+    "BucketKeyEnabled",
+)
+
+
+def copy_object(
+        s3_client,
+        src_bucket_name: str,
+        src_key: str,
+        dst_bucket_name: str,
+        dst_key: str,
+        size: int,
+        config: S3TransferConfig = DEFAULT_TRANSFER_CONFIG,
+):
+    """
+    Server-side copy, with parallel upload_part_copy above the copy_object size limit
+    Multipart copies keep the source's content headers, user metadata and SSE settings as
+    copy_object does, and every part is copied from the same source ETag.
+    """
+    copy_source = dict(Bucket=src_bucket_name, Key=src_key)
+    if size <= MAX_COPY_OBJECT_SIZE:
+        s3_client.copy_object(CopySource=copy_source, Bucket=dst_bucket_name, Key=dst_key)
+        return
+
+    head = s3_client.head_object(Bucket=src_bucket_name, Key=src_key)
+    create_kwargs = {name: head[name] for name in _COPIED_ATTRIBUTES if name in head}
+
+    def upload_part(upload_id: str, part_number: int, offset: int, length: int) -> str:
+        response = s3_client.upload_part_copy(
+            Bucket=dst_bucket_name,
+            Key=dst_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            CopySource=copy_source,
+            CopySourceRange=f"bytes={offset}-{offset + length - 1}",
+            CopySourceIfMatch=head["ETag"],
+        )
+        return response["CopyPartResult"]["ETag"]
+
+    run_multipart(
+        s3_client, dst_bucket_name, dst_key, size, upload_part, config=config, create_kwargs=create_kwargs
+    )
+
+
+def upload_file(
+        s3_client,
+        bucket_name: str,
+        key: str,
+        filename: str,
+        config: S3TransferConfig = DEFAULT_TRANSFER_CONFIG,
+        state_file: Optional[str] = None,
+):
+    """
+    Upload a local file, with parts read by os.pread and uploaded in parallel above the threshold
+    :param state_file: makes multipart uploads resumable, see run_multipart; the state is tied to
+        the file's size and mtime, so a modified file is uploaded from scratch
+    """
+    with open(filename, "rb") as f:
+        file_stat = os.fstat(f.fileno())
+        size = file_stat.st_size
+        if size <= config.multipart_threshold:
+            s3_client.put_object(Bucket=bucket_name, Key=key, Body=f.read())
+            return
+
+        def upload_part(upload_id: str, part_number: int, offset: int, length: int) -> str:
+            response = s3_client.upload_part(
+                Bucket=bucket_name,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=os.pread(f.fileno(), length, offset),
+            )
+            return response["ETag"]
+
+        run_multipart(
+            s3_client,
+            bucket_name,
+            key,
+            size,
+            upload_part,
+            config=config,
+            state_file=state_file,
+            source_id=[size, file_stat.st_mtime_ns],
+        )
+
+
+def download_file(
+        s3_client,
+        bucket_name: str,
+        key: str,
+        filename: str,
+        size: Optional[int] = None,
+        config: S3TransferConfig = DEFAULT_TRANSFER_CONFIG,
+        if_match: Optional[str] = None,
+):
+    """
+    Stream an object into a local file, with parallel ranged GETs written by os.pwrite above the threshold
+    :param size: object size when known (e.g. from a listing), otherwise it comes with the first part
+    :param if_match: ETag the object must have, so that all parts come from the same version;
+        when not given, the ETag of the first part is required for the other ones
+    """
+    with open(filename, "wb") as f:
+        first = b""
+        if size is None:
+            first, size, etag = read_first_range(s3_client, bucket_name, key, config.part_size)
+            if_match = if_match or etag
+            if len(first) >= size:
+                f.write(first)
+                return
+        elif size <= config.multipart_threshold:
+            response = s3_client.get_object(**_get_kwargs(bucket_name, key, if_match))
+            shutil.copyfileobj(response["Body"], f, length=MB)
+            return
+
+        f.truncate(size)
+        os.pwrite(f.fileno(), first, 0)
+
+        def fetch(part: Tuple[int, int]):
+            offset, length = part
+            data = read_range(s3_client, bucket_name, key, offset, length, if_match=if_match)
+            os.pwrite(f.fileno(), data, offset)
+
+        remaining = (
+            (len(first) + offset, length) for offset, length in iter_ranges(size - len(first), config.part_size)
+        )
+        with ThreadPoolExecutor(max_workers=config.max_concurrency) as executor:
+            for _ in executor.map(fetch, remaining):
+                pass
@@ -0,0 +1,155 @@
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+from ufs.base import Directory, FileEntry
+from ufs.transfer import TransferEngine
+
+COMPARE_MODES = ("size", "mtime", "etag")
+
+
+class SyncAction(NamedTuple):
+    action: str  # "copy" or "delete"
+    relative_path: str
+    size: int
+    reason: str
+
+
+class SyncResult:
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        self.copied = 0
+        self.copied_bytes = 0
+        self.deleted = 0
+        self.deleted_bytes = 0
+        self.unchanged = 0
+        self.failed = dict()
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(dry_run={self.dry_run}, copied={self.copied}, "
+            f"copied_bytes={self.copied_bytes}, deleted={self.deleted}, "
+            f"deleted_bytes={self.deleted_bytes}, unchanged={self.unchanged}, "
+            f"failed={len(self.failed)})"
+        )
+
+
+def _relative_entries(directory: Directory, keep_markers: bool) -> Iterator[Tuple[str, FileEntry]]:
+    """:param keep_markers: also yield S3 directory marker keys (ending in "/")"""
+    if not directory.exists():
+        return
+    root = str(directory)
+    for entry in directory.iter_entries(recursive=True, sort=True):
+        relative_path = entry.path[len(root):].lstrip("/")
+        if keep_markers or not relative_path.endswith("/"):
+            yield relative_path, entry
+
+
+def _comparable_etag(etag: Optional[str]) -> bool:
+    # multipart ETags depend on the part size, equal content can have different ones
+    return bool(etag) and "-" not in etag
+
+
+def _changed(src: FileEntry, dst: FileEntry, compare: str) -> Optional[str]:
+    if src.size != dst.size:
+        return "size"
+    if compare == "etag" and _comparable_etag(src.etag) and _comparable_etag(dst.etag):
+        return "etag" if src.etag != dst.etag else None
+    if compare != "size" and src.mtime > dst.mtime:
+        return "mtime"
+    return None
+
+
+def diff(
+        src: Directory, dst: Directory, delete: bool = False, compare: str = "mtime"
+) -> Iterator[SyncAction]:
+    """
+    Merge-join the sorted listings of src and dst, yielding the actions making dst match src
+    Only the two listing cursors are held in memory. Directory marker keys are only synced
+    between S3 directories, Posix has no files for them.
+    :param compare: "size" (size only), "mtime" (size, or src newer than dst) or
+        "etag" (size and etag when both sides have a single part one, mtime otherwise)
+    """
+    from ufs.s3.s3_directory import S3Directory
+
+    if compare not in COMPARE_MODES:
+        raise RuntimeError(f"Un-supported compare mode: {compare}")
+
+    keep_markers = isinstance(src, S3Directory) and isinstance(dst, S3Directory)
+    src_it = _relative_entries(src, keep_markers)
+    dst_it = _relative_entries(dst, keep_markers)
+    src_item = next(src_it, None)
+    dst_item = next(dst_it, None)
+
+    while src_item is not None or dst_item is not None:
+        if dst_item is None or (src_item is not None and src_item[0] < dst_item[0]):
+            yield SyncAction("copy", src_item[0], src_item[1].size, "missing")
+            src_item = next(src_it, None)
+        elif src_item is None or dst_item[0] < src_item[0]:
+            if delete:
+                yield SyncAction("delete", dst_item[0], dst_item[1].size, "extra")
+            dst_item = next(dst_it, None)
+        else:
+            reason = _changed(src_item[1], dst_item[1], compare)
+            yield SyncAction("copy" if reason else "skip", src_item[0], src_item[1].size, reason or "")
+            src_item = next(src_it, None)
+            dst_item = next(dst_it, None)
+
+
+def sync(
+        src: Directory,
+        dst: Directory,
+        delete: bool = False,
+        compare: str = "mtime",
+        dry_run: bool = False,
+        engine: Optional[TransferEngine] = None,
+) -> SyncResult:
+    """
+    Incrementally make dst a mirror of src, for any combination of Posix and S3 directories
+    Only new or changed files are transferred, the copies start while both listings are still running.
+    :param delete: also remove files from dst which do not exist in src
+    :param compare: see diff()
+    :param dry_run: print the actions instead of applying them
+    :return: SyncResult, summary of objects and bytes moved
+    """
+    result = SyncResult(dry_run=dry_run)
+
+    def actions() -> Iterator[SyncAction]:
+        for action in diff(src, dst, delete=delete, compare=compare):
+            if action.action == "skip":
+                result.unchanged += 1
+                continue
+            yield action
+
+    def apply(action: SyncAction) -> SyncAction:
+        dst_file = dst.join_as_file(action.relative_path)
+        if action.action == "copy":
+            if dry_run:
+                print(f"Copying: {src.join_as_file(action.relative_path)} -> {dst_file}")
+            else:
+                src.join_as_file(action.relative_path).duplicate(dst_file)
+        else:
+            if dry_run:
+                print(f"Deleting: {dst_file}")
+            else:
+                dst_file.remove()
+        return action
+
+    if dry_run:
+        done = [apply(action) for action in actions()]
+    else:
+        engine = engine or TransferEngine()
+        transfer = engine.run(apply, actions(), key=lambda action: action.relative_path)
+        done = transfer.succeeded.values()
+        result.failed = transfer.failed
+
+    for action in done:
+        if action.action == "copy":
+            result.copied += 1
+            result.copied_bytes += action.size
+        else:
+            result.deleted += 1
+            result.deleted_bytes += action.size
+    return result
@@ -0,0 +1,231 @@
+import errno
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Iterable, NamedTuple, Optional
+
+from ufs.exceptions import FileSystemException
+from ufs.metrics import count
+
+DEFAULT_MAX_WORKERS = 16
+
+# S3 error codes of throttled or failed requests, any other ClientError (NoSuchKey, AccessDenied,
+# PreconditionFailed, ...) is permanent
+_RETRYABLE_ERROR_CODES = frozenset({
+    "Throttling",
+    "ThrottlingException",
+    "SlowDown",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+    "RequestTimeout",
+    "RequestTimeoutException",
+    "InternalError",
+    "ServiceUnavailable",
+    "500",
+    "502",
+    "503",
+    "504",
+})
+_RETRYABLE_ERRNOS = frozenset({errno.EAGAIN, errno.EBUSY, errno.EINTR, errno.ESTALE, errno.ETIMEDOUT})
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether an operation failing with error may succeed when attempted again: S3 throttling and 5xx
+    responses, connection errors and transient OS errors. Missing files, denied access and invalid
+    arguments (RuntimeError) are permanent.
+    """
+    # botocore ClientError
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if status in (429, 500, 502, 503, 504):
+            return True
+        return response.get("Error", {}).get("Code") in _RETRYABLE_ERROR_CODES
+
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if isinstance(error, OSError):
+        return error.errno in _RETRYABLE_ERRNOS
+
+    try:
+        from botocore.exceptions import ConnectionError as BotoConnectionError
+        from botocore.exceptions import HTTPClientError
+    except ImportError:
+        return False
+    # endpoint, connect and read timeouts, connections closed while streaming
+    return isinstance(error, (BotoConnectionError, HTTPClientError))
+
+
+class TransferException(FileSystemException):
+    def __init__(self, result: "TransferResult"):
+        self.result = result
+        first_key, first_error = next(iter(result.failed.items()))
+        super().__init__(
+            f"{len(result.failed)} of {result.total} transfers failed, "
+            f"first failure: {first_key}: {first_error!r}"
+        )
+
+
+class TransferResult:
+    """
+    Outcome of a TransferEngine run, reported per key
+    succeeded: key -> value returned by the transfer function
+    failed: key -> exception raised by the last attempt
+    """
+
+    def __init__(self):
+        self.succeeded: Dict[Hashable, Any] = dict()
+        self.failed: Dict[Hashable, BaseException] = dict()
+        self.retries = 0
+
+    @property
+    def total(self) -> int:
+        return len(self.succeeded) + len(self.failed)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def raise_for_errors(self):
+        if self.failed:
+            raise TransferException(self)
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(succeeded={len(self.succeeded)}, "
+            f"failed={len(self.failed)}, retries={self.retries})"
+        )
+
+
+class TransferProgress(NamedTuple):
+    items: int
+    bytes: int
+    elapsed: float
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second"""
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class ProgressTracker:
+    """Thread-safe counters of completed items and bytes, reported to an optional callback"""
+
+    def __init__(self, callback: Optional[Callable[[TransferProgress], None]] = None):
+        self.callback = callback
+        self.items = 0
+        self.bytes = 0
+        self._start = time.monotonic()
+        self._lock = Lock()
+
+    def update(self, nbytes: int = 0):
+        with self._lock:
+            self.items += 1
+            self.bytes += nbytes
+            if self.callback is not None:
+                self.callback(self.snapshot())
+
+    def snapshot(self) -> TransferProgress:
+        return TransferProgress(self.items, self.bytes, time.monotonic() - self._start)
+
+
+class TransferEngine:
+    """
+    Bounded worker pool shared by the multi-object operations
+
+    Items are pulled lazily from the given iterable, so a listing generator keeps
+    producing keys while earlier keys are already being transferred. At most
+    max_workers * 2 items are in flight at any time.
+    Failed items are attempted again with exponential backoff when retryable(error) is true
+    (is_retryable by default), other errors fail the item at once.
+    """
+
+    def __init__(
+            self,
+            max_workers: int = DEFAULT_MAX_WORKERS,
+            max_attempts: int = 3,
+            backoff: float = 0.2,
+            max_backoff: float = 5.0,
+            fail_fast: bool = False,
+            retryable: Callable[[BaseException], bool] = is_retryable,
+    ):
+        if max_workers < 1:
+            raise RuntimeError(f"Invalid max_workers: {max_workers}")
+        if max_attempts < 1:
+            raise RuntimeError(f"Invalid max_attempts: {max_attempts}")
+
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.fail_fast = fail_fast
+        self.retryable = retryable
+
+    def _delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        # jitter, so that throttled workers do not retry in lock step
+        return delay * random.uniform(0.5, 1.0)
+
+    def _attempt(self, func: Callable, item, result: TransferResult, lock: Lock):
+        attempt = 1
+        while True:
+            try:
+                return func(item)
+            except Exception as e:
+                if attempt >= self.max_attempts or not self.retryable(e):
+                    raise
+            time.sleep(self._delay(attempt))
+            attempt += 1
+            with lock:
+                result.retries += 1
+            count("retries")
+
+    def run(
+            self,
+            func: Callable,
+            items: Iterable,
+            key: Optional[Callable] = None,
+    ) -> TransferResult:
+        """
+        Apply func to every item using the worker pool
+        :param func: callable taking one item, its return value is recorded on success
+        :param items: iterable (or generator) of items to transfer
+        :param key: callable mapping an item to the key used in the result, defaults to the item
+        :return: TransferResult
+        """
+        key = key or (lambda item: item)
+        result = TransferResult()
+        max_in_flight = self.max_workers * 2
+        in_flight = dict()
+        lock = Lock()
+
+        def collect(done):
+            for future in done:
+                item_key = in_flight.pop(future)
+                try:
+                    result.succeeded[item_key] = future.result()
+                except Exception as e:
+                    result.failed[item_key] = e
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for item in items:
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                    if self.fail_fast and result.failed:
+                        break
+                future = executor.submit(self._attempt, func, item, result, lock)
+                in_flight[future] = key(item)
+
+            if self.fail_fast and result.failed:
+                for future in list(in_flight):
+                    if future.cancel():
+                        in_flight.pop(future)
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        return result